@@ -1,15 +1,27 @@
 import requests
 
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 from uuid import UUID
+from time import monotonic, sleep
 from logging import getLogger
+from typing import Callable, Optional
 
 from fw_test.wifi import WifiSecurityType, ApConfiguration
-from fw_test.firmware import Firmware
+from fw_test.firmware import Firmware, FirmwareVersion
 from fw_test.config import Config
+from fw_test.upload import MultipartUpload, UploadProgress, UploadStats, UploadError
+from fw_test.trace import Tracer
 
 LOGGER = getLogger(__name__)
 REQUEST_TIMEOUT = 5
+# maximum time the device may take to accept a chunk of the firmware
+UPLOAD_STALL_TIMEOUT = 10
+# time the device takes to answer once the whole firmware was sent
 FWUPDATE_TIMEOUT = 30
+# time the device takes to reboot with the new firmware
+REBOOT_TIMEOUT = 60
+POLL_INTERVAL = 0.5
 
 WIFI_SECURITY_MAP_TO_RE = {
     WifiSecurityType.NONE: "none",
@@ -21,26 +33,51 @@ WIFI_SECURITY_MAP_TO_RE = {
 BASE_URL = "http://192.168.240.1"
 
 
+def provision_payload(ap_configuration: ApConfiguration, env_id: UUID) -> dict:
+    return {
+        "ssid": ap_configuration.ssid,
+        "security": WIFI_SECURITY_MAP_TO_RE[ap_configuration.security_type],
+        "passphrase": ap_configuration.passphrase,
+        "envId": str(env_id),
+    }
+
+
 class LocalApi:
     """
     electric radiator local API for communicating with the app
     """
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, base_url: str = BASE_URL, pool_size: int = 1, retries: int = 1,
+                 tracer: Optional[Tracer] = None):
         self._config = config
+        self._base_url = base_url
+        self._tracer = tracer if tracer is not None else Tracer()
+        self.uploads: list[UploadStats] = []
+
+        # connections are kept alive, an idempotent request is retried once by default
+        # since the device drops them without notice when it reboots
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                              max_retries=Retry(total=retries, connect=0, read=retries, status=0, redirect=0))
+        self._session.mount("http://", adapter)
+
+    def request(self, method: str, path: str, timeout: float = REQUEST_TIMEOUT, **kwargs) -> requests.Response:
+        """
+        sends a request to the local API on a pooled connection
+        """
+        return self._session.request(method, self._base_url + path, timeout=timeout, **kwargs)
+
+    def close(self):
+        self._session.close()
 
     def provision(self, ap_configuration: ApConfiguration, env_id: UUID) -> dict:
         """
         send a provisioning request to the RE device
         """
-        payload_json = {
-            "ssid": ap_configuration.ssid,
-            "security": WIFI_SECURITY_MAP_TO_RE[ap_configuration.security_type],
-            "passphrase": ap_configuration.passphrase,
-            "envId": str(env_id),
-        }
+        payload_json = provision_payload(ap_configuration, env_id)
         LOGGER.info("provision the RE with %s", payload_json)
+        self._tracer.stimulus("api.provision", ssid=ap_configuration.ssid)
 
-        response = requests.post(BASE_URL + "/irsap/provision", json=payload_json, timeout=REQUEST_TIMEOUT).json()
+        response = self.request("POST", "/irsap/provision", json=payload_json).json()
 
         LOGGER.info("provision response: %s", response)
 
@@ -52,7 +89,7 @@ class LocalApi:
         """
         LOGGER.info("ask the RE to scan Wi-Fi networks")
 
-        response =  requests.get(BASE_URL + "/irsap/wifi/scan", timeout=REQUEST_TIMEOUT).json()
+        response = self.request("GET", "/irsap/wifi/scan").json()
 
         LOGGER.info("scan result: %s", response)
 
@@ -64,21 +101,76 @@ class LocalApi:
         """
         LOGGER.info("ask status to the RE")
 
-        response = requests.get(BASE_URL + "/irsap/state", timeout=REQUEST_TIMEOUT).json()
+        response = self.request("GET", "/irsap/state").json()
 
         LOGGER.info("status response: %s", response)
 
         return response
 
-    def firmware_update(self, firmware: Firmware) -> requests.Response:
+    def firmware_update(self, firmware: Firmware, on_progress: Optional[Callable[[UploadProgress], None]] = None,
+                        stall_timeout: float = UPLOAD_STALL_TIMEOUT) -> requests.Response:
         """
-        upgrade the firmware of the RE device
+        upgrade the firmware of the RE device, the image is streamed and the upload
+        fails if the device doesn't accept data for stall_timeout seconds
         """
         LOGGER.info("send firmware update version %s", firmware.version)
-
-        response = requests.post(BASE_URL + "/gainspan/system/fwuploc", files={ "fw_image": firmware.binary }, timeout=FWUPDATE_TIMEOUT)
+        self._tracer.stimulus("api.firmware_update", version=str(firmware.version))
+
+        upload = MultipartUpload("fw_image", firmware, on_progress)
+        response = None
+        try:
+            # the connect timeout of requests is also used while sending the body.
+            # POST is not retried by the adapter, the image is streamed only once
+            response = self.request("POST", "/gainspan/system/fwuploc", data=upload,
+                                    headers={"Content-Type": upload.content_type},
+                                    timeout=(stall_timeout, FWUPDATE_TIMEOUT))
+        except requests.ConnectionError as e:
+            if upload.started is not None and upload.finished is None:
+                raise UploadError(f"upload stalled after {upload.sent} of {upload.size} bytes") from e
+            raise
+        finally:
+            upload.close()
+            self._record_upload(upload, response)
 
         LOGGER.info("fwup response: %s %s", response.status_code, response.text)
 
         return response
 
+    def wait_for_version(self, version: FirmwareVersion, timeout: float = REBOOT_TIMEOUT,
+                         reconnect: Optional[Callable[[], None]] = None) -> dict:
+        """
+        polls the status of the RE device until it runs the specified firmware version.
+        If the device is unreachable, reconnect is called before polling again
+        """
+        LOGGER.info("wait for firmware version %s", version)
+
+        deadline = monotonic() + timeout
+        while True:
+            try:
+                status = self.status()
+                if FirmwareVersion.from_str(status["system"]["fwVer"]) == version:
+                    return status
+            except (requests.RequestException, ValueError, KeyError) as e:
+                LOGGER.debug("device not ready: %s", e)
+                if reconnect is not None and monotonic() < deadline:
+                    try:
+                        reconnect()
+                    except Exception as error:
+                        LOGGER.debug("reconnect failed: %s", error)
+
+            if monotonic() >= deadline:
+                raise TimeoutError(f"the device didn't come back with firmware {version}")
+            sleep(POLL_INTERVAL)
+
+    def _record_upload(self, upload: MultipartUpload, response: Optional[requests.Response]):
+        if upload.started is None:
+            return
+
+        finished = upload.finished or monotonic()
+        stats = UploadStats(upload.size, upload.sent, finished - upload.started,
+                            monotonic() - finished if upload.finished else 0.0,
+                            response.status_code if response is not None else None)
+        LOGGER.info("uploaded %d of %d bytes in %.3fs (%.1f kB/s)", stats.sent, stats.size, stats.duration,
+                    stats.throughput / 1000)
+        self.uploads.append(stats)
+
@@ -0,0 +1,243 @@
+import os
+import re
+import socket
+import hashlib
+import tempfile
+
+from time import monotonic, time
+from logging import getLogger
+from threading import Thread, Lock
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional
+
+from fw_test.firmware import Firmware
+
+LOGGER = getLogger(__name__)
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# maximum number of bytes handed to a single sendfile call
+SENDFILE_CHUNK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Artifact:
+    path: str
+    size: int
+    etag: str
+    modified: float
+
+
+@dataclass(frozen=True)
+class Transfer:
+    """
+    a download served by the artifact server
+    """
+    url_path: str
+    client: str
+    status: int
+    # first and last byte requested, None for the whole file
+    range: Optional[tuple[int, int]]
+    sent: int
+    duration: float
+    complete: bool
+
+    @property
+    def throughput(self) -> float:
+        """
+        bytes per second
+        """
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+
+class ArtifactServer:
+    """
+    HTTP server that publishes firmware binaries to the devices of the fixture. Files are
+    sent with sendfile, partial (Range) and conditional (ETag, Last-Modified) requests are
+    supported to exercise the resume of a download
+    """
+
+    def __init__(self, sock: socket.socket):
+        handler = type("Handler", (_Handler,), {"artifacts": self})
+        self._server = ThreadingHTTPServer(sock.getsockname()[:2], handler, bind_and_activate=False)
+        self._server.socket.close()
+        self._server.socket = sock
+        self._server.daemon_threads = True
+        sock.listen()
+
+        self._lock = Lock()
+        self._artifacts: dict[str, Artifact] = {}
+        self._directory = tempfile.TemporaryDirectory(prefix="fw_test-artifacts-")
+        self.transfers: list[Transfer] = []
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+        host, port = sock.getsockname()[:2]
+        LOGGER.debug("artifact server on %s:%d", host, port)
+
+    def publish(self, url_path: str, firmware: Firmware):
+        """
+        makes the firmware available at the specified path
+        """
+        path = firmware.path
+        if path is None:
+            path = os.path.join(self._directory.name, firmware.hash)
+            with open(path, "wb") as f:
+                f.write(firmware.binary)
+
+        LOGGER.info("publish %s as %s", path, url_path)
+        with self._lock:
+            self._artifacts[url_path] = Artifact(path, firmware.size, f'"{firmware.hash}"', time())
+
+    def put(self, url_path: str, data: bytes) -> str:
+        """
+        makes the bytes available at the specified path, returns their ETag
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(self._directory.name, digest)
+        with open(path, "wb") as f:
+            f.write(data)
+
+        LOGGER.info("publish %d bytes as %s", len(data), url_path)
+        artifact = Artifact(path, len(data), f'"{digest}"', time())
+        with self._lock:
+            self._artifacts[url_path] = artifact
+
+        return artifact.etag
+
+    def lookup(self, url_path: str) -> Optional[Artifact]:
+        with self._lock:
+            return self._artifacts.get(url_path)
+
+    def record(self, transfer: Transfer):
+        LOGGER.info("served %s to %s: %d %s, %d bytes in %.3fs (%.1f kB/s)", transfer.url_path, transfer.client,
+                    transfer.status, transfer.range or "", transfer.sent, transfer.duration, transfer.throughput / 1000)
+        with self._lock:
+            self.transfers.append(transfer)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._directory.cleanup()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    artifacts: ArtifactServer
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def log_message(self, format, *args):
+        LOGGER.debug("artifact server: " + format, *args)
+
+    def _serve(self, body: bool):
+        start = monotonic()
+        url_path = self.path.split("?", 1)[0]
+        artifact = self.artifacts.lookup(url_path)
+        if artifact is None:
+            return self._empty(404)
+
+        if self._not_modified(artifact):
+            return self._empty(304, artifact)
+
+        requested = self._range(artifact)
+        if requested is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{artifact.size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        first, last = requested or (0, artifact.size - 1)
+        self.send_response(206 if requested else 200)
+        self._validators(artifact)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(last - first + 1))
+        if requested:
+            self.send_header("Content-Range", f"bytes {first}-{last}/{artifact.size}")
+        self.end_headers()
+
+        if not body:
+            return
+
+        sent = 0
+        try:
+            with open(artifact.path, "rb") as f:
+                while sent < last - first + 1:
+                    count = min(SENDFILE_CHUNK, last - first + 1 - sent)
+                    written = os.sendfile(self.connection.fileno(), f.fileno(), first + sent, count)
+                    if written == 0:
+                        break
+                    sent += written
+        except OSError as e:
+            # the device dropped the connection, it may resume with a range request
+            LOGGER.debug("artifact transfer interrupted: %s", e)
+            self.close_connection = True
+
+        self.artifacts.record(Transfer(url_path, self.client_address[0], 206 if requested else 200,
+                                       requested or None, sent, monotonic() - start, sent == last - first + 1))
+
+    def _range(self, artifact: Artifact) -> Optional[tuple[int, int]] | bool:
+        """
+        requested byte range, None for the whole file or False if not satisfiable
+        """
+        header = self.headers.get("Range")
+        if header is None:
+            return None
+
+        # the range only applies if the file didn't change since the client got the first part
+        if_range = self.headers.get("If-Range")
+        if if_range is not None and if_range != artifact.etag:
+            return None
+
+        match = RANGE_RE.match(header.strip())
+        if match is None or match.groups() == ("", ""):
+            # multiple ranges are not supported, the whole file is sent
+            return None
+
+        start, end = match.groups()
+        if start == "":
+            first, last = max(0, artifact.size - int(end)), artifact.size - 1
+        elif end and int(end) < int(start):
+            # an invalid range is ignored, the whole file is sent
+            return None
+        else:
+            first = int(start)
+            last = min(int(end), artifact.size - 1) if end else artifact.size - 1
+
+        if first >= artifact.size:
+            return False
+
+        return first, last
+
+    def _not_modified(self, artifact: Artifact) -> bool:
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            return artifact.etag in (tag.strip() for tag in if_none_match.split(",")) or if_none_match.strip() == "*"
+
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            try:
+                return int(artifact.modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    def _validators(self, artifact: Artifact):
+        self.send_header("ETag", artifact.etag)
+        self.send_header("Last-Modified", formatdate(artifact.modified, usegmt=True))
+
+    def _empty(self, status: int, artifact: Optional[Artifact] = None):
+        self.send_response(status)
+        if artifact is not None:
+            self._validators(artifact)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
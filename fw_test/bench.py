@@ -0,0 +1,215 @@
+import http.client
+import requests
+
+from uuid import uuid4
+from time import monotonic, monotonic_ns
+from logging import getLogger
+from threading import Thread, Lock, Event
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Optional
+
+from fw_test.api import LocalApi, provision_payload
+from fw_test.trace import LatencyHistogram
+from fw_test.wifi import ApConfiguration, WifiSecurityType
+
+LOGGER = getLogger(__name__)
+
+# the device is considered unresponsive when no request succeeds for this time
+UNRESPONSIVE_TIMEOUT = 10
+# network sent to the device by the provision requests of the benchmark
+BENCH_AP_CONFIG = ApConfiguration("BENCH", WifiSecurityType.WPA2, "benchmark", 6)
+
+
+class Endpoint(Enum):
+    STATE = "state"
+    SCAN = "scan"
+    # provisioning changes the network the device connects to
+    PROVISION = "provision"
+
+
+class Outcome(Enum):
+    OK = auto()
+    # the device answered with an error status
+    HTTP_ERROR = auto()
+    TIMEOUT = auto()
+    # the connection was closed or reset by the device
+    RESET = auto()
+    # the connection was refused
+    REFUSED = auto()
+    ERROR = auto()
+
+
+@dataclass(frozen=True)
+class Workload:
+    """
+    requests sent by the benchmark. With a rate, requests are started at that rate
+    (per second) by at most concurrency workers, otherwise each worker sends the
+    next request as soon as it gets the response of the previous one
+    """
+    endpoints: tuple[Endpoint, ...] = (Endpoint.STATE,)
+    concurrency: int = 1
+    rate: Optional[float] = None
+    duration: float = 30
+    timeout: float = 5
+
+
+@dataclass
+class EndpointResult:
+    latencies: LatencyHistogram = field(default_factory=LatencyHistogram)
+    outcomes: dict[Outcome, int] = field(default_factory=lambda: {outcome: 0 for outcome in Outcome})
+
+    @property
+    def count(self) -> int:
+        return sum(self.outcomes.values())
+
+    def summary(self) -> dict:
+        summary = {
+            "requests": self.count,
+            "error_rate": 1 - self.outcomes[Outcome.OK] / self.count if self.count else 0.0,
+            "timeout_rate": self.outcomes[Outcome.TIMEOUT] / self.count if self.count else 0.0,
+            "resets": self.outcomes[Outcome.RESET],
+            "outcomes": {outcome.name.lower(): count for outcome, count in self.outcomes.items() if count},
+        }
+        if self.latencies.count:
+            summary["latency"] = self.latencies.summary()
+
+        return summary
+
+
+@dataclass
+class BenchReport:
+    workload: Workload
+    duration: float = 0
+    results: dict[Endpoint, EndpointResult] = field(default_factory=dict)
+    # seconds from the start at which the device stopped responding
+    unresponsive_at: Optional[float] = None
+
+    def summary(self) -> dict:
+        requests_count = sum(result.count for result in self.results.values())
+        return {
+            "concurrency": self.workload.concurrency,
+            "rate": self.workload.rate,
+            "duration": self.duration,
+            "throughput": requests_count / self.duration if self.duration > 0 else 0.0,
+            "unresponsive_at": self.unresponsive_at,
+            "endpoints": {endpoint.value: result.summary() for endpoint, result in self.results.items()},
+        }
+
+
+def classify(error: Exception) -> Outcome:
+    """
+    outcome of a request that raised, from the chain of exceptions wrapped by requests and urllib3
+    """
+    if isinstance(error, requests.Timeout):
+        return Outcome.TIMEOUT
+
+    pending, seen = [error], set()
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+
+        if isinstance(current, ConnectionRefusedError):
+            return Outcome.REFUSED
+        if isinstance(current, (ConnectionResetError, BrokenPipeError, http.client.RemoteDisconnected)):
+            return Outcome.RESET
+        if isinstance(current, TimeoutError):
+            return Outcome.TIMEOUT
+
+        pending.extend(arg for arg in current.args if isinstance(arg, BaseException))
+        for cause in (getattr(current, "reason", None), current.__cause__, current.__context__):
+            if isinstance(cause, BaseException):
+                pending.append(cause)
+
+    return Outcome.ERROR
+
+
+class Benchmark:
+    """
+    load generator for the local API of the device, it records the latency and the
+    outcome of each request and stops early if the device stops responding
+    """
+
+    def __init__(self, api: LocalApi, workload: Workload):
+        self._api = api
+        self._workload = workload
+        self._lock = Lock()
+        self._stop = Event()
+        self._next = 0
+        self._start = 0.0
+        self._last_success = 0.0
+        self._report = BenchReport(workload, results={endpoint: EndpointResult() for endpoint in workload.endpoints})
+
+    def run(self) -> BenchReport:
+        LOGGER.info("benchmark %s", self._workload)
+        self._start = self._last_success = monotonic()
+        workers = [Thread(target=self._worker, daemon=True) for _ in range(self._workload.concurrency)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self._report.duration = monotonic() - self._start
+        LOGGER.info("benchmark completed: %s", self._report.summary())
+
+        return self._report
+
+    def _worker(self):
+        while not self._stop.is_set():
+            slot = self._claim()
+            if slot is None:
+                return
+
+            index, start = slot
+            if (delay := start - monotonic()) > 0 and self._stop.wait(delay):
+                return
+
+            endpoint = self._workload.endpoints[index % len(self._workload.endpoints)]
+            self._record(endpoint, *self._send(endpoint))
+
+    def _claim(self) -> Optional[tuple[int, float]]:
+        """
+        index and start time of the next request, None at the end of the run
+        """
+        with self._lock:
+            index = self._next
+            self._next += 1
+
+        start = self._start + index / self._workload.rate if self._workload.rate else monotonic()
+        if start - self._start >= self._workload.duration:
+            return None
+
+        return index, start
+
+    def _send(self, endpoint: Endpoint) -> tuple[Outcome, int]:
+        sent_ns = monotonic_ns()
+        try:
+            match endpoint:
+                case Endpoint.STATE:
+                    response = self._api.request("GET", "/irsap/state", timeout=self._workload.timeout)
+                case Endpoint.SCAN:
+                    response = self._api.request("GET", "/irsap/wifi/scan", timeout=self._workload.timeout)
+                case Endpoint.PROVISION:
+                    response = self._api.request("POST", "/irsap/provision", timeout=self._workload.timeout,
+                                                 json=provision_payload(BENCH_AP_CONFIG, uuid4()))
+            # the body is read, as the app does
+            response.content
+        except requests.RequestException as e:
+            return classify(e), monotonic_ns() - sent_ns
+
+        return Outcome.OK if response.ok else Outcome.HTTP_ERROR, monotonic_ns() - sent_ns
+
+    def _record(self, endpoint: Endpoint, outcome: Outcome, latency_ns: int):
+        now = monotonic()
+        with self._lock:
+            result = self._report.results[endpoint]
+            result.outcomes[outcome] += 1
+            if outcome in (Outcome.OK, Outcome.HTTP_ERROR):
+                result.latencies.add(latency_ns)
+                self._last_success = now
+            elif now - self._last_success >= UNRESPONSIVE_TIMEOUT and self._report.unresponsive_at is None:
+                self._report.unresponsive_at = self._last_success - self._start
+                LOGGER.warning("the device stopped responding %.1fs after the start", self._report.unresponsive_at)
+                self._stop.set()
@@ -1,4 +1,6 @@
 from fw_test.cloud.protocol import Message, Action, Response
 from fw_test.cloud.state import PacketType
 from fw_test.cloud.jobs import Job, JobState
-from fw_test.cloud.cloud import Cloud
\ No newline at end of file
+from fw_test.cloud.cloud import Cloud
+from fw_test.cloud.shadow import Shadow, ShadowService, ShadowError
+from fw_test.cloud.changes import Change, ChangeFeed
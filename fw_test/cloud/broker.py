@@ -0,0 +1,506 @@
+import socket
+import asyncio
+import struct
+
+from logging import getLogger
+from enum import IntEnum
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+LOGGER = getLogger(__name__)
+
+PROTOCOL_NAME = b"MQTT"
+PROTOCOL_LEVEL = 4
+# the broker delivers at most with QoS 1
+MAX_QOS = 1
+SUBACK_FAILURE = 0x80
+# topics with more levels than this are rejected
+MAX_TOPIC_LEVELS = 32
+# subscribers of the topics published recently, dropped when the subscriptions change
+MATCH_CACHE_SIZE = 100_000
+
+_U16 = struct.Struct(">H")
+
+
+class ControlPacket(IntEnum):
+    CONNECT = 1
+    CONNACK = 2
+    PUBLISH = 3
+    PUBACK = 4
+    SUBSCRIBE = 8
+    SUBACK = 9
+    UNSUBSCRIBE = 10
+    UNSUBACK = 11
+    PINGREQ = 12
+    PINGRESP = 13
+    DISCONNECT = 14
+
+
+class MqttError(RuntimeError):
+    pass
+
+
+def encode_length(length: int) -> bytes:
+    """
+    remaining length of a packet, as variable length integer
+    """
+    # the packets of the shadow protocol fit in two bytes
+    if length < 0x80:
+        return bytes((length,))
+    if length < 0x4000:
+        return bytes((length & 0x7F | 0x80, length >> 7))
+    encoded = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        encoded.append(digit | 0x80 if length else digit)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value: bytes) -> bytes:
+    return _U16.pack(len(value)) + value
+
+
+def packet(packet_type: ControlPacket, body: bytes = b"", flags: int = 0) -> bytes:
+    return bytes((packet_type << 4 | flags,)) + encode_length(len(body)) + body
+
+
+def publish_packet(topic: bytes, payload: bytes, qos: int = 0, packet_id: int = 0) -> bytes:
+    length = 2 + len(topic) + len(payload) + (2 if qos else 0)
+    return b"".join((bytes((ControlPacket.PUBLISH << 4 | qos << 1,)), encode_length(length), _U16.pack(len(topic)),
+                     topic, _U16.pack(packet_id) if qos else b"", payload))
+
+
+def parse_publish(flags: int, body: bytes) -> tuple[bytes, bytes, int, int]:
+    """
+    topic, payload, QoS and packet identifier (0 with QoS 0) of a PUBLISH packet
+    """
+    qos = flags >> 1 & 0x03
+    topic_end = 2 + _U16.unpack_from(body)[0]
+    topic = body[2:topic_end]
+    if qos:
+        return topic, body[topic_end + 2:], qos, _U16.unpack_from(body, topic_end)[0]
+
+    return topic, body[topic_end:], 0, 0
+
+
+def split_packets(buffer: bytearray) -> list[tuple[int, int, bytes]]:
+    """
+    removes the complete packets from the buffer, as (type, flags, body) tuples
+    """
+    packets = []
+    position = 0
+    size = len(buffer)
+    while True:
+        index = position + 1
+        length = 0
+        shift = 0
+        complete = False
+        while index < size:
+            digit = buffer[index]
+            index += 1
+            length |= (digit & 0x7F) << shift
+            if not digit & 0x80:
+                complete = True
+                break
+            shift += 7
+            if shift >= 28:
+                raise MqttError("malformed remaining length")
+        if not complete or index + length > size:
+            break
+
+        header = buffer[position]
+        packets.append((header >> 4, header & 0x0F, bytes(buffer[index:index + length])))
+        position = index + length
+
+    del buffer[:position]
+
+    return packets
+
+
+class _Node:
+    __slots__ = ("children", "subscribers")
+
+    def __init__(self):
+        self.children: dict[bytes, "_Node"] = {}
+        self.subscribers: dict["_Session", int] = {}
+
+
+class SubscriptionTree:
+    """
+    subscriptions indexed by topic level, finding the subscribers of a topic costs
+    the number of levels and not the number of subscriptions
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._cache: dict[bytes, dict[_Session, int]] = {}
+
+    def add(self, topic_filter: bytes, session: "_Session", qos: int):
+        self._cache.clear()
+        node = self._root
+        for level in topic_filter.split(b"/"):
+            node = node.children.setdefault(level, _Node())
+        node.subscribers[session] = qos
+
+    def remove(self, topic_filter: bytes, session: "_Session"):
+        self._cache.clear()
+        path = [self._root]
+        for level in topic_filter.split(b"/"):
+            node = path[-1].children.get(level)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].subscribers.pop(session, None)
+        # prunes the branches left without subscriptions
+        for level, parent, node in reversed(list(zip(topic_filter.split(b"/"), path, path[1:]))):
+            if node.subscribers or node.children:
+                break
+            del parent.children[level]
+
+    def match(self, topic: bytes) -> dict["_Session", int]:
+        """
+        subscribers of the topic with the maximum QoS of their matching subscriptions
+        """
+        matches = self._cache.get(topic)
+        if matches is None:
+            if len(self._cache) >= MATCH_CACHE_SIZE:
+                self._cache.clear()
+            matches = self._cache[topic] = self._match(topic)
+
+        return matches
+
+    def _match(self, topic: bytes) -> dict["_Session", int]:
+        matches: dict[_Session, int] = {}
+        levels = topic.split(b"/")
+        nodes = [self._root]
+        # the wildcards at the first level don't match the topics starting with $
+        system = topic.startswith(b"$")
+        for depth, level in enumerate(levels):
+            following = []
+            wildcards = not system or depth > 0
+            for node in nodes:
+                multi = node.children.get(b"#") if wildcards else None
+                if multi is not None:
+                    self._collect(multi, matches)
+                child = node.children.get(level)
+                if child is not None:
+                    following.append(child)
+                single = node.children.get(b"+") if wildcards else None
+                if single is not None:
+                    following.append(single)
+            nodes = following
+            if not nodes:
+                return matches
+
+        for node in nodes:
+            self._collect(node, matches)
+            # "a/#" matches also "a"
+            multi = node.children.get(b"#")
+            if multi is not None:
+                self._collect(multi, matches)
+
+        return matches
+
+    @staticmethod
+    def _collect(node: _Node, matches: dict["_Session", int]):
+        for session, qos in node.subscribers.items():
+            if matches.get(session, -1) < qos:
+                matches[session] = qos
+
+
+@dataclass
+class BrokerStats:
+    connections: int = 0
+    received: int = 0
+    delivered: int = 0
+
+
+class _Session(asyncio.Protocol):
+    def __init__(self, broker: "Broker"):
+        self._broker = broker
+        self._buffer = bytearray()
+        self._packet_id = 0
+        self.transport: Optional[asyncio.Transport] = None
+        self.client_id = b""
+        self.connected = False
+        self.filters: set[bytes] = set()
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]):
+        self._broker.remove(self)
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        try:
+            for packet_type, flags, body in split_packets(self._buffer):
+                self._handle(packet_type, flags, body)
+        except (MqttError, struct.error, ValueError) as e:
+            LOGGER.warning("closing connection of %s: %s", self.client_id, e)
+            self.transport.close()
+
+    def send(self, data: bytes):
+        # the subscriptions are dropped when the connection is lost, the client may
+        # have closed it in the meantime
+        if not self.transport.is_closing():
+            self.transport.write(data)
+
+    def deliver(self, topic: bytes, payload: bytes, qos: int):
+        if qos:
+            self._packet_id = self._packet_id % 0xFFFF + 1
+        self.send(publish_packet(topic, payload, qos, self._packet_id))
+
+    def _handle(self, packet_type: int, flags: int, body: bytes):
+        if not self.connected and packet_type != ControlPacket.CONNECT:
+            raise MqttError(f"packet {packet_type} before CONNECT")
+
+        if packet_type == ControlPacket.PUBLISH:
+            topic, payload, qos, packet_id = parse_publish(flags, body)
+            if qos:
+                self.send(packet(ControlPacket.PUBACK, _U16.pack(packet_id)))
+            self._broker.publish(topic, payload, qos)
+        elif packet_type == ControlPacket.PUBACK:
+            # the messages are not stored, nothing to retransmit
+            pass
+        elif packet_type == ControlPacket.SUBSCRIBE:
+            packet_id = _U16.unpack_from(body)[0]
+            granted = bytearray()
+            for topic_filter, qos in self._filters(body[2:], with_qos=True):
+                self.filters.add(topic_filter)
+                self._broker.subscriptions.add(topic_filter, self, min(qos, MAX_QOS))
+                granted.append(min(qos, MAX_QOS))
+            self.send(packet(ControlPacket.SUBACK, _U16.pack(packet_id) + granted))
+        elif packet_type == ControlPacket.UNSUBSCRIBE:
+            for topic_filter, _ in self._filters(body[2:], with_qos=False):
+                self.filters.discard(topic_filter)
+                self._broker.subscriptions.remove(topic_filter, self)
+            self.send(packet(ControlPacket.UNSUBACK, body[:2]))
+        elif packet_type == ControlPacket.PINGREQ:
+            self.send(packet(ControlPacket.PINGRESP))
+        elif packet_type == ControlPacket.DISCONNECT:
+            self.transport.close()
+        elif packet_type == ControlPacket.CONNECT:
+            self._connect(body)
+        else:
+            raise MqttError(f"unexpected packet {packet_type}")
+
+    def _connect(self, body: bytes):
+        name_end = 2 + _U16.unpack_from(body)[0]
+        if body[2:name_end] != PROTOCOL_NAME or body[name_end] != PROTOCOL_LEVEL:
+            # unacceptable protocol version
+            self.send(packet(ControlPacket.CONNACK, b"\x00\x01"))
+            raise MqttError("unsupported protocol")
+        # will, credentials and keep alive are accepted and ignored
+        id_start = name_end + 4
+        self.client_id = body[id_start + 2:id_start + 2 + _U16.unpack_from(body, id_start)[0]]
+        self.connected = True
+        self._broker.stats.connections += 1
+        self.send(packet(ControlPacket.CONNACK, b"\x00\x00"))
+
+    @staticmethod
+    def _filters(body: bytes, with_qos: bool):
+        position = 0
+        while position < len(body):
+            end = position + 2 + _U16.unpack_from(body, position)[0]
+            topic_filter = body[position + 2:end]
+            if topic_filter.count(b"/") >= MAX_TOPIC_LEVELS:
+                raise MqttError("too many topic levels")
+            qos = body[end] if with_qos else 0
+            position = end + 1 if with_qos else end
+            yield topic_filter, qos
+
+
+class Broker:
+    """
+    local MQTT 3.1.1 broker, enough for the fleet simulator and the cloud stand-ins:
+    QoS 0 and 1, wildcard subscriptions and clean sessions only (no retained messages,
+    no will, no persistence)
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, sock: Optional[socket.socket] = None):
+        self._host = host
+        self._port = port
+        self._sock = sock
+        self._servers: list[asyncio.AbstractServer] = []
+        self._sessions: set[_Session] = set()
+        self.subscriptions = SubscriptionTree()
+        self.stats = BrokerStats()
+
+    @property
+    def port(self) -> int:
+        return self._servers[0].sockets[0].getsockname()[1]
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        if self._sock is not None:
+            self._servers.append(await loop.create_server(self._session, sock=self._sock))
+        else:
+            self._servers.append(await loop.create_server(self._session, self._host, self._port))
+        LOGGER.info("MQTT broker listening on port %d", self.port)
+
+    async def listen(self, host: str, port: int = 0) -> tuple[str, int]:
+        """
+        accepts connections also on another address, returns it
+        """
+        server = await asyncio.get_running_loop().create_server(self._session, host, port)
+        self._servers.append(server)
+        address = server.sockets[0].getsockname()[:2]
+        LOGGER.info("MQTT broker also listening on %s:%d", *address)
+
+        return address
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        for session in list(self._sessions):
+            session.transport.close()
+        for server in self._servers:
+            await server.wait_closed()
+
+    def publish(self, topic: bytes, payload: bytes, qos: int = 0):
+        self.stats.received += 1
+        subscribers = self.subscriptions.match(topic)
+        if not subscribers:
+            return
+
+        # the same packet is written to all the subscribers at QoS 0
+        frame = None
+        for session, granted in subscribers.items():
+            if min(qos, granted):
+                session.deliver(topic, payload, 1)
+            else:
+                frame = frame or publish_packet(topic, payload)
+                session.send(frame)
+        self.stats.delivered += len(subscribers)
+
+    def remove(self, session: _Session):
+        self._sessions.discard(session)
+        for topic_filter in session.filters:
+            self.subscriptions.remove(topic_filter, session)
+        session.filters.clear()
+
+    def _session(self) -> _Session:
+        session = _Session(self)
+        self._sessions.add(session)
+        return session
+
+
+MessageCallback = Callable[[bytes, bytes], None]
+
+
+class MqttClient(asyncio.Protocol):
+    """
+    asyncio MQTT client, the messages of all the subscriptions go to a single callback
+    with the topic and the payload as bytes
+    """
+
+    def __init__(self, client_id: str, on_message: Optional[MessageCallback] = None):
+        self.client_id = client_id
+        self.on_message = on_message
+        self.transport: Optional[asyncio.Transport] = None
+        self._buffer = bytearray()
+        self._packet_id = 0
+        self._pending: dict[tuple[int, int], asyncio.Future] = {}
+        self._connected: Optional[asyncio.Future] = None
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self.closed: Optional[asyncio.Future] = None
+
+    async def connect(self, host: str, port: int, keep_alive: int = 0):
+        loop = asyncio.get_running_loop()
+        self._connected = loop.create_future()
+        self.closed = loop.create_future()
+        await loop.create_connection(lambda: self, host, port)
+        # clean session
+        body = encode_string(PROTOCOL_NAME) + bytes((PROTOCOL_LEVEL, 0x02)) + _U16.pack(keep_alive) + \
+            encode_string(self.client_id.encode())
+        self.transport.write(packet(ControlPacket.CONNECT, body))
+        await self._connected
+
+    def publish(self, topic: bytes, payload: bytes):
+        """
+        publishes with QoS 0, use drain to wait when the connection is congested
+        """
+        self.transport.write(publish_packet(topic, payload))
+
+    async def publish_acked(self, topic: bytes, payload: bytes):
+        """
+        publishes with QoS 1 and waits for the acknowledge of the broker
+        """
+        packet_id = self._next_id()
+        future = self._expect(ControlPacket.PUBACK, packet_id)
+        self.transport.write(publish_packet(topic, payload, 1, packet_id))
+        await future
+
+    async def subscribe(self, filters: list[bytes], qos: int = 0) -> bytes:
+        """
+        subscribes to the filters with a single packet, returns the granted QoS of each
+        """
+        packet_id = self._next_id()
+        future = self._expect(ControlPacket.SUBACK, packet_id)
+        body = _U16.pack(packet_id) + b"".join(encode_string(topic_filter) + bytes((qos,))
+                                               for topic_filter in filters)
+        self.transport.write(packet(ControlPacket.SUBSCRIBE, body, 0x02))
+        granted = await future
+        if SUBACK_FAILURE in granted:
+            raise MqttError("subscription refused")
+
+        return granted
+
+    async def drain(self):
+        await self._writable.wait()
+
+    async def disconnect(self):
+        if self.transport is not None and not self.transport.is_closing():
+            self.transport.write(packet(ControlPacket.DISCONNECT))
+            self.transport.close()
+        await self.closed
+
+    def connection_made(self, transport: asyncio.BaseTransport):
+        self.transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]):
+        error = exc or ConnectionResetError("connection closed")
+        for future in [self._connected, *self._pending.values()]:
+            if future is not None and not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._writable.set()
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def pause_writing(self):
+        self._writable.clear()
+
+    def resume_writing(self):
+        self._writable.set()
+
+    def data_received(self, data: bytes):
+        self._buffer += data
+        for packet_type, flags, body in split_packets(self._buffer):
+            if packet_type == ControlPacket.PUBLISH:
+                topic, payload, qos, packet_id = parse_publish(flags, body)
+                if qos:
+                    self.transport.write(packet(ControlPacket.PUBACK, _U16.pack(packet_id)))
+                if self.on_message is not None:
+                    self.on_message(topic, payload)
+            elif packet_type == ControlPacket.CONNACK:
+                if body[1]:
+                    self._connected.set_exception(MqttError(f"connection refused with code {body[1]}"))
+                else:
+                    self._connected.set_result(None)
+            elif packet_type in (ControlPacket.PUBACK, ControlPacket.SUBACK):
+                future = self._pending.pop((packet_type, _U16.unpack_from(body)[0]), None)
+                if future is not None and not future.done():
+                    future.set_result(body[2:])
+
+    def _next_id(self) -> int:
+        self._packet_id = self._packet_id % 0xFFFF + 1
+        return self._packet_id
+
+    def _expect(self, packet_type: ControlPacket, packet_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[(packet_type, packet_id)] = future
+        return future
@@ -0,0 +1,169 @@
+from time import time
+from bisect import bisect_right
+from logging import getLogger
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from threading import Condition
+from typing import Any, Callable, Iterable, Optional
+
+from fw_test.cloud.protocol import Message, Action
+from fw_test.cloud.serializer import Field, Layout, layout
+from fw_test.cloud.state import PacketType, PACKET_HEADER, PACKET_STATE_REPORTED_V1, PACKET_STATE_REPORTED_V2
+
+LOGGER = getLogger(__name__)
+
+# changes kept to be found by wait
+HISTORY_SIZE = 1000
+CHANGE_TIMEOUT = 30
+
+HEADER = layout(PACKET_HEADER)
+LAYOUTS = {
+    PacketType.STATE_REPORTED_V1.value: layout(PACKET_STATE_REPORTED_V1),
+    PacketType.STATE_REPORTED_V2.value: layout(PACKET_STATE_REPORTED_V2),
+}
+
+
+@dataclass(frozen=True)
+class Change:
+    device: str
+    field: str
+    old: Any
+    new: Any
+    timestamp: float
+
+    def rose(self, mask: int) -> bool:
+        """
+        true if the change set all the bits of the mask, e.g. SYSTEM_STATUS_HEATING
+        """
+        return self.new & mask == mask and self.old & mask != mask
+
+    def fell(self, mask: int) -> bool:
+        """
+        true if all the bits of the mask were set and the change cleared some of them
+        """
+        return self.old & mask == mask and self.new & mask != mask
+
+
+@lru_cache(maxsize=None)
+def _body(structure_layout: Layout) -> tuple[tuple[Field, ...], tuple[int, ...]]:
+    fields = tuple(field for key, field in structure_layout.fields.items() if key not in PACKET_HEADER)
+    return fields, tuple(field.offset + field.codec.size for field in fields)
+
+
+def changed_fields(structure_layout: Layout, previous: bytes, frame: bytes) -> list[Field]:
+    """
+    fields of the body that differ between two frames of the same layout. The frames are
+    compared as integers, each changed field is found from the lowest changed byte and
+    skipped, so the cost does not depend on the number of fields that didn't change
+    """
+    fields, ends = _body(structure_layout)
+    start = HEADER.size
+    diff = int.from_bytes(previous[start:structure_layout.size], "little") ^ \
+        int.from_bytes(frame[start:structure_layout.size], "little")
+
+    changed = []
+    while diff:
+        position = start + (((diff & -diff).bit_length() - 1) >> 3)
+        index = bisect_right(ends, position)
+        changed.append(fields[index])
+        diff >>= (ends[index] - start) << 3
+        start = ends[index]
+
+    return changed
+
+
+class ChangeFeed:
+    """
+    changes of the reported state of the devices, field by field. The last frame of each
+    device is kept and each new one is compared with it at the byte level: only the changed
+    fields are decoded. A new device, or a device that changed state version (e.g. after an
+    OTA), starts from its frame without changes
+    """
+
+    def __init__(self, history: int = HISTORY_SIZE):
+        self._frames: dict[str, bytes] = {}
+        self._listeners: list[tuple[Callable[[Change], None], Optional[frozenset[str]]]] = []
+        self._condition = Condition()
+        self._history: deque[Change] = deque(maxlen=history)
+
+    def add_listener(self, listener: Callable[[Change], None], fields: Optional[Iterable[str]] = None):
+        """
+        calls the listener with each change of the fields, of any field if None
+        """
+        self._listeners.append((listener, frozenset(fields) if fields is not None else None))
+
+    def on_message(self, message: Message):
+        """
+        listener of the messages of the cloud, see Cloud.add_listener
+        """
+        if message.action != Action.REPORTED_UPDATE or message.response is not None:
+            return
+        structure_layout = LAYOUTS.get(HEADER.read(message.payload, "type"))
+        if structure_layout is not None:
+            mac = structure_layout.read(message.payload, "macAddress")
+            self.update(":".join(f"{byte:02x}" for byte in mac), message.payload)
+
+    def update(self, device: str, frame: bytes, timestamp: Optional[float] = None) -> list[Change]:
+        """
+        takes the frame reported by the device, returns the changes from the previous one
+        """
+        structure_layout = LAYOUTS.get(HEADER.read(frame, "type"))
+        if structure_layout is None or len(frame) < structure_layout.size:
+            raise ValueError("not a reported state frame")
+
+        with self._condition:
+            previous = self._frames.get(device)
+            self._frames[device] = bytes(frame)
+            if previous is None or HEADER.read(previous, "type") != HEADER.read(frame, "type"):
+                return []
+
+            timestamp = time() if timestamp is None else timestamp
+            changes = [
+                Change(device, field.name, field.codec.unpack_from(previous, field.offset)[0],
+                       field.codec.unpack_from(frame, field.offset)[0], timestamp)
+                for field in changed_fields(structure_layout, previous, frame)
+            ]
+            self._history.extend(changes)
+            if changes:
+                self._condition.notify_all()
+
+        for change in changes:
+            for listener, fields in self._listeners:
+                if fields is None or change.field in fields:
+                    try:
+                        listener(change)
+                    except Exception as e:
+                        LOGGER.error("change listener failed on %s: %s", change.field, e)
+
+        return changes
+
+    def value(self, device: str, key: str):
+        """
+        a field of the last frame of the device, None if it reported nothing yet
+        """
+        frame = self._frames.get(device)
+        if frame is None:
+            return None
+        return LAYOUTS[HEADER.read(frame, "type")].read(frame, key)
+
+    def forget(self, device: str):
+        """
+        drops the last frame of the device, its next frame starts without changes
+        """
+        with self._condition:
+            self._frames.pop(device, None)
+
+    def wait(self, predicate: Callable[[Change], bool], since: float, timeout: float = CHANGE_TIMEOUT) -> Change:
+        """
+        waits for a change after the time since (as time()) for which the predicate is true,
+        e.g. lambda change: change.field == "heatingStatus" and change.new == 1
+        """
+        def find() -> Optional[Change]:
+            return next((change for change in self._history if change.timestamp >= since and predicate(change)),
+                        None)
+
+        with self._condition:
+            if not self._condition.wait_for(lambda: find() is not None, timeout):
+                raise TimeoutError("change not reported")
+            return find()
@@ -2,36 +2,52 @@ from queue import Queue
 from logging import getLogger
 from time import time
 from uuid import uuid4
-from typing import Optional
+from typing import Callable, Optional
 
 from boto3 import Session
 
 from fw_test.config import Config
 from fw_test.cloud.mqtt import Mqtt
-from fw_test.cloud.protocol import Protocol, Message, Action
+from fw_test.cloud.local import LocalCloud
+from fw_test.cloud.protocol import Protocol, Message, Action, Response, frame_env_id
 from fw_test.cloud.state import PacketType
 from fw_test.cloud.jobs import Job, JobState, AwsJobs
 from fw_test.firmware import Firmware
+from fw_test.artifacts import ArtifactServer
+from fw_test.trace import Tracer
 
 LOGGER = getLogger(__name__)
 
+# host the device downloads the OTA images from
+OTA_HOST = "reota.irsap.cloud"
+
 
 class Cloud:
     """
     handles the interaction with the cloud
     """
 
-    def __init__(self, config: Config):
-        session = Session(
-            profile_name=config.aws_profile,
-            region_name=config.aws_region,
-        )
+    def __init__(self, config: Config, tracer: Optional[Tracer] = None, artifacts: Optional[ArtifactServer] = None,
+                 local: Optional[LocalCloud] = None):
         self._config = config
-        self._mqtt = Mqtt(config)
+        if local is not None:
+            self._mqtt = local.mqtt(config.aws_iot_client_id)
+            iot = local.iot
+            self._s3 = local.s3
+        else:
+            session = Session(
+                profile_name=config.aws_profile,
+                region_name=config.aws_region,
+            )
+            self._mqtt = Mqtt(config)
+            iot = session.client("iot")
+            self._s3 = session.client("s3")
         self._queue = Queue()
-        self._protocol = Protocol(config, self._mqtt, self._queue.put)
-        self._jobs = AwsJobs(config, session.client("iot"))
-        self._s3 = session.client("s3")
+        self._listeners: list[Callable[[Message], None]] = []
+        self._tracer = tracer if tracer is not None else Tracer()
+        self._protocol = Protocol(config, self._mqtt, self._on_message, self._tracer)
+        self.jobs = AwsJobs(config, iot)
+        self._artifacts = artifacts
 
     def flush(self):
         """
@@ -40,14 +56,39 @@ class Cloud:
         while not self._queue.empty():
             self._queue.get()
 
+    def add_listener(self, listener: Callable[[Message], None]):
+        """
+        calls the listener with each message of the device, on the thread of the MQTT client.
+        The messages are also queued for receive
+        """
+        self._listeners.append(listener)
+
     def publish(self, message: Message):
         """
         publishes the specified message to the cloud.
         Handles the codification of the message into the binary
         format according to the protocol
         """
+        self._tracer.stimulus(
+            "cloud.publish",
+            action=message.action.name,
+            response=message.response.name if message.response else None,
+            env_id=message.state["envId"].hex() if isinstance(message.state.get("envId"), bytes) else None,
+        )
         self._protocol.publish(message)
 
+    def publish_frame(self, action: Action, response: Optional[Response], frame: bytes):
+        """
+        publishes a state already encoded in the binary format
+        """
+        self._tracer.stimulus(
+            "cloud.publish",
+            action=action.name,
+            response=response.name if response else None,
+            env_id=frame_env_id(frame),
+        )
+        self._protocol.publish_frame(action, response, frame)
+
     def receive(self, timeout=10, ignore_connection=True, filter_action: Optional[Action] = None) -> Message:
         """
         waits for a message incoming from the cloud, decodes
@@ -56,29 +97,38 @@ class Cloud:
         packet = self._queue.get(block=True, timeout=timeout)
         start = time()
         if (filter_action is not None and packet.action != filter_action) \
-                or (ignore_connection and packet.action == Action.REPORTED_UPDATE and packet.state["type"] == PacketType.CONNECTION.value):
+                or (ignore_connection and packet.action == Action.REPORTED_UPDATE
+                    and packet.packet_type == PacketType.CONNECTION.value):
             LOGGER.debug("received ingored packet, ignore...")
             return self.receive(timeout=timeout - (time() - start), ignore_connection=True, filter_action=filter_action)
 
         return packet
 
+    def _on_message(self, message: Message):
+        for listener in self._listeners:
+            try:
+                listener(message)
+            except Exception as e:
+                LOGGER.error("cloud listener failed on %s: %s", message.action.name, e)
+        self._queue.put(message)
+
     def job_create(self, job: Job):
         """
         creates an AWS job from the specified job document
         """
-        self._jobs.create(job)
+        self.jobs.create(job)
 
     def job_state(self, job: Job) -> JobState:
         """
         queries the status of an AWS job
         """
-        return self._jobs.state(job)
+        return self.jobs.state(job)
 
     def job_delete(self, job: Job):
         """
         deletes a created AWS job
         """
-        self._jobs.delete(job)
+        self.jobs.delete(job)
 
     def send_ota(self, firmware: Firmware) -> Job: 
         """
@@ -88,15 +138,19 @@ class Cloud:
 
         s3_path = f"firmware/RE/{firmware.hash[-8:]}-{firmware.version.commit}"
         
-        LOGGER.debug("upload file to s3")
-        self._s3.put_object(
-            ACL='public-read',
-            Body=firmware.binary,
-            Bucket=self._config.ota_bucket,
-            Key=s3_path,
-        )
-
-        url = f"http://reota.irsap.cloud/{self._config.ota_bucket}/{s3_path}"
+        if self._artifacts is not None:
+            # the DNS of the AP resolves the OTA host to the fixture
+            self._artifacts.publish(f"/{self._config.ota_bucket}/{s3_path}", firmware)
+        else:
+            LOGGER.debug("upload file to s3")
+            self._s3.put_object(
+                ACL='public-read',
+                Body=firmware.binary,
+                Bucket=self._config.ota_bucket,
+                Key=s3_path,
+            )
+
+        url = f"http://{OTA_HOST}/{self._config.ota_bucket}/{s3_path}"
         job_id = f"RE-{firmware.version}-{str(uuid4())}".replace('.', '-')
         job_document = {
             'operation': "fwInstall",
@@ -0,0 +1,368 @@
+import json
+import socket
+import asyncio
+
+from time import time
+from logging import getLogger
+from threading import Thread, Lock
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+from botocore.exceptions import ClientError
+
+from fw_test.config import Config
+from fw_test.cloud.broker import Broker, MqttClient, SubscriptionTree
+from fw_test.cloud.jobs import JobState
+from fw_test.artifacts import ArtifactServer
+
+LOGGER = getLogger(__name__)
+
+# time the calls from the test thread wait for the event loop of the local cloud
+CALL_TIMEOUT = 5
+ACCOUNT_ID = "000000000000"
+
+TERMINAL_STATES = {JobState.SUCCEEDED, JobState.FAILED, JobState.TIMED_OUT, JobState.REJECTED, JobState.REMOVED,
+                   JobState.CANCELED}
+# states the device can set with an update
+DEVICE_STATES = {JobState.IN_PROGRESS, JobState.SUCCEEDED, JobState.FAILED, JobState.REJECTED}
+
+
+def _error(code: str, message: str, operation: str) -> ClientError:
+    # the same exception boto3 raises, the callers can't tell the stand-in from AWS
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def _datetime(timestamp: Optional[float]) -> Optional[datetime]:
+    return datetime.fromtimestamp(timestamp, timezone.utc) if timestamp is not None else None
+
+
+class LocalCloud:
+    """
+    stand-in of AWS IoT Core and S3 that runs in the fixture: a MQTT broker the device
+    and the tests connect to, the IoT Jobs API on its jobs topics and S3 buckets served
+    by the artifact server. The broker runs in an event loop on its own thread.
+    The device connects to the socket given by the fixture, that can be bound to the
+    AP interface, the clients of the fixture to a second listener on the loopback
+    """
+
+    def __init__(self, config: Config, sock: socket.socket, artifacts: ArtifactServer):
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, name="local-cloud", daemon=True)
+        self._thread.start()
+
+        self.broker = Broker(sock=sock)
+        self.run(self.broker.start())
+        # address of the broker for the clients of the fixture
+        self.address = self.run(self.broker.listen("127.0.0.1"))
+        self.iot = LocalIot(self, config.aws_region)
+        self.s3 = LocalS3(artifacts)
+
+    def run(self, coroutine, timeout: float = CALL_TIMEOUT):
+        """
+        runs a coroutine in the event loop of the local cloud and waits for its result
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def call(self, function: Callable, *args):
+        """
+        calls a function in the event loop of the local cloud, without waiting
+        """
+        self._loop.call_soon_threadsafe(function, *args)
+
+    def client(self, client_id: str, on_message: Callable[[bytes, bytes], None]) -> MqttClient:
+        client = MqttClient(client_id, on_message)
+        self.run(client.connect(*self.address))
+        return client
+
+    def mqtt(self, client_id: str) -> "LocalMqtt":
+        return LocalMqtt(self, client_id)
+
+    def stop(self):
+        self.iot.stop()
+        self.run(self.broker.stop())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+class LocalMqtt:
+    """
+    replaces Mqtt with a connection to the local broker
+    """
+
+    def __init__(self, cloud: LocalCloud, client_id: str):
+        self._cloud = cloud
+        self._callbacks = SubscriptionTree()
+        self._client = cloud.client(client_id, self._on_message)
+
+    def publish(self, topic: str, message: bytes):
+        LOGGER.info("publish on %s message of %s bytes", topic, len(message))
+        self._cloud.run(self._client.publish_acked(topic.encode(), message))
+
+    def subscribe(self, topic_filter: str, callback: Callable[[str, bytes], None]):
+        LOGGER.info("subscribing to topic filter %s", topic_filter)
+        self._callbacks.add(topic_filter.encode(), callback, 1)
+        self._cloud.run(self._client.subscribe([topic_filter.encode()], qos=1))
+
+    def stop(self):
+        self._cloud.run(self._client.disconnect())
+
+    def _on_message(self, topic: bytes, payload: bytes):
+        for callback in self._callbacks.match(topic):
+            callback(topic.decode(), payload)
+
+
+@dataclass
+class _Execution:
+    job_id: str
+    thing_name: str
+    document: dict
+    execution_number: int
+    queued_at: float
+    in_progress_timeout: Optional[float]
+    status: JobState = JobState.QUEUED
+    status_details: dict = field(default_factory=dict)
+    started_at: Optional[float] = None
+    updated_at: Optional[float] = None
+    version: int = 1
+
+    def summary(self) -> dict:
+        summary = {
+            "jobId": self.job_id,
+            "queuedAt": int(self.queued_at),
+            "lastUpdatedAt": int(self.updated_at or self.queued_at),
+            "executionNumber": self.execution_number,
+            "versionNumber": self.version,
+        }
+        if self.started_at is not None:
+            summary["startedAt"] = int(self.started_at)
+
+        return summary
+
+    def to_dict(self) -> dict:
+        return {
+            **self.summary(),
+            "thingName": self.thing_name,
+            "jobDocument": self.document,
+            "status": self.status.name,
+            "statusDetails": self.status_details,
+        }
+
+
+class LocalIot:
+    """
+    subset of the boto3 IoT client used by AwsJobs, with the executions delivered to the
+    devices on the topics of the IoT Jobs MQTT API ($aws/things/<thing>/jobs/...)
+    """
+
+    def __init__(self, cloud: LocalCloud, region: str):
+        self._cloud = cloud
+        self._region = region
+        self._lock = Lock()
+        self._jobs: dict[str, list[_Execution]] = {}
+        # executions of each thing, in the order they were queued
+        self._things: dict[str, list[_Execution]] = {}
+        self._execution_number = 0
+        self._client = cloud.client("local-iot-jobs", self._on_request)
+        cloud.run(self._client.subscribe([b"$aws/things/+/jobs/get", b"$aws/things/+/jobs/start-next",
+                                          b"$aws/things/+/jobs/+/get", b"$aws/things/+/jobs/+/update"], qos=1))
+
+    def stop(self):
+        self._cloud.run(self._client.disconnect())
+
+    def thing_arn(self, thing_name: str) -> str:
+        return f"arn:aws:iot:{self._region}:{ACCOUNT_ID}:thing/{thing_name}"
+
+    def describe_thing(self, thingName: str) -> dict:
+        # any thing exists, as if registered with its MAC address
+        return {"thingName": thingName, "thingArn": self.thing_arn(thingName), "attributes": {}, "version": 1}
+
+    def create_job(self, jobId: str, targets: list[str], document: str, description: str = "",
+                   targetSelection: str = "SNAPSHOT", timeoutConfig: Optional[dict] = None, **kwargs) -> dict:
+        timeout = (timeoutConfig or {}).get("inProgressTimeoutInMinutes")
+        with self._lock:
+            if jobId in self._jobs:
+                raise _error("ResourceAlreadyExistsException", f"job {jobId} already exists", "CreateJob")
+
+            now = time()
+            executions = []
+            for target in targets:
+                self._execution_number += 1
+                execution = _Execution(jobId, target.rsplit("thing/", 1)[-1], json.loads(document),
+                                       self._execution_number, now, timeout * 60 if timeout else None)
+                executions.append(execution)
+                self._things.setdefault(execution.thing_name, []).append(execution)
+            self._jobs[jobId] = executions
+
+            for execution in executions:
+                self._notify(execution.thing_name)
+
+        LOGGER.info("local job %s created for %s", jobId, [execution.thing_name for execution in executions])
+
+        return {"jobArn": f"arn:aws:iot:{self._region}:{ACCOUNT_ID}:job/{jobId}", "jobId": jobId,
+                "description": description}
+
+    def list_job_executions_for_job(self, jobId: str, **kwargs) -> dict:
+        with self._lock:
+            self._expire()
+            executions = self._job(jobId, "ListJobExecutionsForJob")
+
+            return {"executionSummaries": [{
+                "thingArn": self.thing_arn(execution.thing_name),
+                "jobExecutionSummary": {
+                    "status": execution.status.name,
+                    "queuedAt": _datetime(execution.queued_at),
+                    "startedAt": _datetime(execution.started_at),
+                    "lastUpdatedAt": _datetime(execution.updated_at or execution.queued_at),
+                    "executionNumber": execution.execution_number,
+                },
+            } for execution in executions]}
+
+    def delete_job(self, jobId: str, force: bool = False, **kwargs) -> dict:
+        with self._lock:
+            executions = self._job(jobId, "DeleteJob")
+            if not force and any(execution.status == JobState.IN_PROGRESS for execution in executions):
+                raise _error("InvalidRequestException", f"job {jobId} is in progress, use force", "DeleteJob")
+
+            del self._jobs[jobId]
+            for execution in executions:
+                self._things[execution.thing_name].remove(execution)
+                self._notify(execution.thing_name)
+
+        LOGGER.info("local job %s deleted", jobId)
+
+        return {}
+
+    def _job(self, job_id: str, operation: str) -> list[_Execution]:
+        executions = self._jobs.get(job_id)
+        if executions is None:
+            raise _error("ResourceNotFoundException", f"job {job_id} not found", operation)
+
+        return executions
+
+    def _pending(self, thing_name: str) -> list[_Execution]:
+        return [execution for execution in self._things.get(thing_name, []) if execution.status not in TERMINAL_STATES]
+
+    def _next(self, thing_name: str) -> Optional[_Execution]:
+        pending = self._pending(thing_name)
+        in_progress = [execution for execution in pending if execution.status == JobState.IN_PROGRESS]
+
+        return (in_progress or pending or [None])[0]
+
+    def _expire(self):
+        """
+        times out the executions in progress for longer than the timeout of their job
+        """
+        now = time()
+        for executions in self._jobs.values():
+            for execution in executions:
+                if execution.status == JobState.IN_PROGRESS and execution.in_progress_timeout is not None \
+                        and now - execution.started_at > execution.in_progress_timeout:
+                    LOGGER.info("local job %s timed out on %s", execution.job_id, execution.thing_name)
+                    self._set_status(execution, JobState.TIMED_OUT, execution.status_details)
+                    self._notify(execution.thing_name)
+
+    def _set_status(self, execution: _Execution, status: JobState, details: dict):
+        execution.status = status
+        execution.status_details = details
+        execution.updated_at = time()
+        if status == JobState.IN_PROGRESS and execution.started_at is None:
+            execution.started_at = execution.updated_at
+        execution.version += 1
+
+    def _notify(self, thing_name: str):
+        base = f"$aws/things/{thing_name}/jobs"
+        pending = self._pending(thing_name)
+        self._publish(f"{base}/notify", {"jobs": {
+            state.name: [execution.summary() for execution in pending if execution.status == state]
+            for state in (JobState.QUEUED, JobState.IN_PROGRESS)
+            if any(execution.status == state for execution in pending)
+        }})
+        following = self._next(thing_name)
+        self._publish(f"{base}/notify-next", {"execution": following.to_dict()} if following is not None else {})
+
+    def _publish(self, topic: str, message: dict, request: Optional[dict] = None):
+        message = {**message, "timestamp": int(time())}
+        if request and "clientToken" in request:
+            message["clientToken"] = request["clientToken"]
+        self._cloud.call(self._client.publish, topic.encode(), json.dumps(message).encode())
+
+    def _on_request(self, topic: bytes, payload: bytes):
+        _, _, thing_name, _, *action = topic.decode().split("/")
+        base = f"$aws/things/{thing_name}/jobs"
+        try:
+            request = json.loads(payload) if payload else {}
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            self._publish(f"{base}/{'/'.join(action)}/rejected", {"code": "InvalidJson", "message": "invalid JSON"})
+            return
+
+        with self._lock:
+            self._expire()
+            if action == ["get"]:
+                pending = self._pending(thing_name)
+                self._publish(f"{base}/get/accepted", {
+                    "inProgressJobs": [execution.summary() for execution in pending
+                                       if execution.status == JobState.IN_PROGRESS],
+                    "queuedJobs": [execution.summary() for execution in pending if execution.status == JobState.QUEUED],
+                }, request)
+            elif action == ["start-next"]:
+                execution = self._next(thing_name)
+                if execution is not None and execution.status == JobState.QUEUED:
+                    self._set_status(execution, JobState.IN_PROGRESS, request.get("statusDetails", {}))
+                self._publish(f"{base}/start-next/accepted",
+                              {"execution": execution.to_dict()} if execution is not None else {}, request)
+            elif action[1] == "get":
+                execution = self._next(thing_name) if action[0] == "$next" else self._execution(thing_name, action[0])
+                if execution is None and action[0] != "$next":
+                    self._reject(base, action, "ResourceNotFound", f"no execution of job {action[0]}", request)
+                else:
+                    self._publish(f"{base}/{action[0]}/get/accepted",
+                                  {"execution": execution.to_dict()} if execution is not None else {}, request)
+            else:
+                self._update(base, thing_name, action, request)
+
+    def _update(self, base: str, thing_name: str, action: list[str], request: dict):
+        execution = self._execution(thing_name, action[0])
+        if execution is None:
+            return self._reject(base, action, "ResourceNotFound", f"no execution of job {action[0]}", request)
+
+        try:
+            status = JobState[request.get("status", "")]
+        except KeyError:
+            return self._reject(base, action, "InvalidRequest", f"invalid status {request.get('status')}", request)
+        if "expectedVersion" in request and request["expectedVersion"] != execution.version:
+            return self._reject(base, action, "VersionMismatch", f"version is {execution.version}", request)
+        if execution.status in TERMINAL_STATES or status not in DEVICE_STATES:
+            return self._reject(base, action, "InvalidStateTransition",
+                                f"{execution.status.name} to {status.name}", request)
+
+        self._set_status(execution, status, request.get("statusDetails", execution.status_details))
+        LOGGER.info("local job %s on %s is %s", execution.job_id, thing_name, status.name)
+        self._publish(f"{base}/{action[0]}/update/accepted", {"executionState": {
+            "status": status.name, "statusDetails": execution.status_details, "versionNumber": execution.version,
+        }}, request)
+        if status in TERMINAL_STATES:
+            self._notify(thing_name)
+
+    def _reject(self, base: str, action: list[str], code: str, message: str, request: dict):
+        LOGGER.warning("local jobs request %s rejected: %s", "/".join(action), message)
+        self._publish(f"{base}/{'/'.join(action)}/rejected", {"code": code, "message": message}, request)
+
+    def _execution(self, thing_name: str, job_id: str) -> Optional[_Execution]:
+        return next((execution for execution in self._things.get(thing_name, []) if execution.job_id == job_id), None)
+
+
+class LocalS3:
+    """
+    subset of the boto3 S3 client used by Cloud, the objects are served by the
+    artifact server at /<bucket>/<key>
+    """
+
+    def __init__(self, artifacts: ArtifactServer):
+        self._artifacts = artifacts
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs) -> dict:
+        return {"ETag": self._artifacts.put(f"/{Bucket}/{Key}", Body)}
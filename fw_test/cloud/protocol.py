@@ -5,10 +5,14 @@ from typing import Optional, Tuple, Callable
 
 from fw_test.cloud.mqtt import Mqtt
 from fw_test.config import Config
-from fw_test.cloud.state import from_binary, to_binary
+from fw_test.cloud.serializer import layout
+from fw_test.cloud.state import STRUCTURE, PACKET_HEADER, from_binary, to_binary
+from fw_test.trace import Tracer
 
 LOGGER = getLogger(__name__)
 
+PACKET_TYPE_OFFSET = layout(PACKET_HEADER).fields["type"].offset
+
 
 class Action(Enum):
     GET = auto()
@@ -40,7 +44,36 @@ TOPIC_RESPONSE = {
 class Message:
     action: Action
     response: Optional[Response]
-    state: dict
+    # None for the messages received: the payload is decoded the first time the state is used
+    state: Optional[dict]
+    # the binary frame, for the messages received
+    payload: bytes = b""
+
+    def __post_init__(self):
+        if self.state is None:
+            del self.state
+
+    def __getattr__(self, name: str):
+        # only called until the state of a received message is decoded
+        if name != "state":
+            raise AttributeError(name)
+        self.state = from_binary(self.payload)
+        return self.state
+
+    @property
+    def packet_type(self) -> int:
+        """
+        type of the packet of a message received, read from the header of the payload
+        """
+        return self.payload[PACKET_TYPE_OFFSET]
+
+
+def frame_env_id(frame: bytes) -> Optional[str]:
+    """
+    environment of a binary frame in hex, None if its packet has none
+    """
+    structure = STRUCTURE.get(frame[PACKET_TYPE_OFFSET]) if len(frame) > PACKET_TYPE_OFFSET else None
+    return layout(structure).read(frame, "envId").hex() if structure and "envId" in structure else None
 
 
 class Protocol:
@@ -48,8 +81,9 @@ class Protocol:
     class that implements the device/cloud protocol
     """
 
-    def __init__(self, config: Config, mqtt: Mqtt, callback: Callable[[Message], None]):
+    def __init__(self, config: Config, mqtt: Mqtt, callback: Callable[[Message], None], tracer: Tracer):
         self._mqtt = mqtt
+        self._tracer = tracer
         self._topic_base = f"re/things/{config.mac_address}/shadow"
 
         # start required subscription
@@ -57,25 +91,34 @@ class Protocol:
         self._callback = callback
 
     def publish(self, message: Message):
-        topic = self._topic_for(message)
-        payload = to_binary(message.state)
+        self.publish_frame(message.action, message.response, to_binary(message.state))
 
-        self._mqtt.publish(topic, payload)
+    def publish_frame(self, action: Action, response: Optional[Response], payload: bytes):
+        """
+        publishes a state already encoded
+        """
+        self._mqtt.publish(self._topic_for(action, response), payload)
 
     def _on_message(self, topic: str, payload: bytes):
         LOGGER.info("received message on topic %s", topic)
 
         action, response = self._topic_parse(topic)
-        state = from_binary(payload)
-        message = Message(action, response, state)
+        self._tracer.response(
+            "cloud.message",
+            action=action.name,
+            response=response.name if response else None,
+            env_id=frame_env_id(payload),
+        )
+        # the listeners that compare frames, e.g. ChangeFeed, never decode the whole state
+        message = Message(action, response, None, payload)
 
         self._callback(message)
 
-    def _topic_for(self, message: Message) -> str:
-        parts = [self._topic_base, TOPIC_ACTION[message.action]]
+    def _topic_for(self, action: Action, response: Optional[Response]) -> str:
+        parts = [self._topic_base, TOPIC_ACTION[action]]
 
-        if message.response:
-            parts.append(TOPIC_RESPONSE[message.response])
+        if response:
+            parts.append(TOPIC_RESPONSE[response])
 
         return "/".join(parts)
 
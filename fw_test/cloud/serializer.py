@@ -1,6 +1,9 @@
 import re
 import struct
 
+from dataclasses import dataclass
+from functools import lru_cache
+
 TYPE_RE = re.compile(r"(.[1-9][0-9]*)(\[([0-9]+)])?")
 
 TYPE_TO_STRUCT = {
@@ -70,3 +73,54 @@ def sizeof(structure: dict) -> int:
         fmt += to_struct_fmt(data_type)
 
     return struct.calcsize(fmt)
+
+
+@dataclass(frozen=True)
+class Field:
+    name: str
+    offset: int
+    codec: struct.Struct
+
+
+class Layout:
+    """
+    compiled binary layout of a structure, with the offset of each field to read
+    and write a single field of a packet in place
+    """
+
+    def __init__(self, structure: dict):
+        fmt = "<"
+        self.fields: dict[str, Field] = {}
+        for key, data_type in structure.items():
+            field_fmt = to_struct_fmt(data_type)
+            self.fields[key] = Field(key, struct.calcsize(fmt), struct.Struct("<" + field_fmt))
+            fmt += field_fmt
+
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+
+    def pack(self, message: dict) -> bytes:
+        return self.struct.pack(*(message[key] for key in self.fields))
+
+    def unpack(self, message: bytes) -> dict:
+        return dict(zip(self.fields, self.struct.unpack(message)))
+
+    def read(self, message: bytes, key: str):
+        field = self.fields[key]
+        return field.codec.unpack_from(message, field.offset)[0]
+
+    def write(self, buffer: bytearray, key: str, value):
+        field = self.fields[key]
+        field.codec.pack_into(buffer, field.offset, value)
+
+
+@lru_cache(maxsize=None)
+def _layout(items: tuple[tuple[str, str], ...]) -> Layout:
+    return Layout(dict(items))
+
+
+def layout(structure: dict) -> Layout:
+    """
+    compiled layout of a structure, computed once for each structure
+    """
+    return _layout(tuple(structure.items()))
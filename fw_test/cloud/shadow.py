@@ -0,0 +1,258 @@
+from time import time, monotonic
+from queue import Queue
+from logging import getLogger
+from threading import Thread, Condition
+from typing import Callable, Optional
+
+from fw_test.cloud.cloud import Cloud
+from fw_test.cloud.protocol import Message, Action, Response
+from fw_test.cloud.serializer import Field, layout
+from fw_test.cloud.state import PacketType, PACKET_HEADER, PACKET_CONNECTION, PACKET_STATE_DESIRED_V1, \
+    PACKET_STATE_DESIRED_V2, PACKET_STATE_REPORTED_V1, PACKET_STATE_REPORTED_V2, to_binary
+
+LOGGER = getLogger(__name__)
+
+# time the answers to the GETs wait to be published
+ANSWER_TIMEOUT = 10
+
+HEADER = layout(PACKET_HEADER)
+CONNECTION = layout(PACKET_CONNECTION)
+LAYOUTS = {
+    PacketType.STATE_DESIRED_V1.value: layout(PACKET_STATE_DESIRED_V1),
+    PacketType.STATE_DESIRED_V2.value: layout(PACKET_STATE_DESIRED_V2),
+    PacketType.STATE_REPORTED_V1.value: layout(PACKET_STATE_REPORTED_V1),
+    PacketType.STATE_REPORTED_V2.value: layout(PACKET_STATE_REPORTED_V2),
+}
+
+
+def _writable(structure: dict) -> tuple[Field, ...]:
+    return tuple(field for key, field in layout(structure).fields.items() if key not in PACKET_HEADER)
+
+
+# the fields the cloud can write are at the same offsets in the desired and reported
+# states, the ones of the V1 states are a prefix of the V2 ones
+WRITABLE_V1 = _writable(PACKET_STATE_DESIRED_V1)
+WRITABLE_V2 = _writable(PACKET_STATE_DESIRED_V2)
+
+
+class ShadowError(RuntimeError):
+    pass
+
+
+def _frame_layout(frame: bytes):
+    return LAYOUTS.get(HEADER.read(frame, "type"))
+
+
+class Shadow:
+    """
+    desired and reported state of a device as the cloud keeps them, as binary frames.
+    The fields where the reported state differs from the desired one (the delta) are
+    found comparing the frames field by field, without decoding them
+    """
+
+    def __init__(self):
+        self.desired: Optional[bytearray] = None
+        self.reported: Optional[bytes] = None
+        # token of the last GET of the device
+        self.client_token: Optional[int] = None
+        # token of the last GET answered by the cloud
+        self.answered_token: Optional[int] = None
+        self.connected = False
+        self.delta: set[str] = set()
+        self.updated = 0.0
+
+    @property
+    def version(self) -> int:
+        return HEADER.read(self.desired, "version") if self.desired is not None else 0
+
+    @property
+    def reported_version(self) -> Optional[int]:
+        return HEADER.read(self.reported, "version") if self.reported is not None else None
+
+    @property
+    def in_sync(self) -> bool:
+        """
+        true if the device reported the last desired version and no field differs
+        """
+        return self.desired is not None and self.reported_version == self.version and not self.delta
+
+    def set_desired(self, state: dict):
+        """
+        replaces the desired state, with the version it specifies
+        """
+        self.desired = bytearray(to_binary(dict(state)))
+        self._compare(self._fields())
+
+    def update_desired(self, **fields) -> bytes:
+        """
+        changes some fields of the desired state and increments its version, returns the frame
+        """
+        if self.desired is None:
+            raise ShadowError("no desired state to update, the shadow must serve a state first")
+        desired_layout = _frame_layout(self.desired)
+        for key, value in fields.items():
+            desired_layout.write(self.desired, key, value)
+        desired_layout.write(self.desired, "version", self.version + 1)
+        desired_layout.write(self.desired, "timestamp", int(time()))
+        self._compare([field for field in self._fields() if field.name in fields])
+
+        return bytes(self.desired)
+
+    def report(self, frame: bytes):
+        self.reported = frame
+        self._compare(self._fields())
+
+    def value(self, key: str, reported: bool = True):
+        """
+        a single field of the reported (or desired) state, None if there is no such state
+        """
+        frame = self.reported if reported else self.desired
+        if frame is None:
+            return None
+        return _frame_layout(frame).read(frame, key)
+
+    def answer(self, client_token: int) -> Optional[bytes]:
+        """
+        the desired state to answer a GET with, None if the device has no shadow yet
+        """
+        if self.desired is None:
+            return None
+        frame = bytearray(self.desired)
+        HEADER.write(frame, "clientToken", client_token)
+        HEADER.write(frame, "timestamp", int(time()))
+
+        return bytes(frame)
+
+    def _fields(self) -> tuple[Field, ...]:
+        if self.desired is None or self.reported is None:
+            return ()
+        types = {HEADER.read(self.desired, "type"), HEADER.read(self.reported, "type")}
+        if types & {PacketType.STATE_DESIRED_V1.value, PacketType.STATE_REPORTED_V1.value}:
+            return WRITABLE_V1
+        return WRITABLE_V2
+
+    def _compare(self, fields):
+        self.updated = monotonic()
+        if self.desired is None or self.reported is None:
+            self.delta = set()
+            return
+
+        if len(fields) > 1:
+            end = fields[-1].offset + fields[-1].codec.size
+            if self.desired[fields[0].offset:end] == self.reported[fields[0].offset:end]:
+                # nothing differs, the common case after the device applied the state
+                self.delta.difference_update(field.name for field in fields)
+                return
+
+        for field in fields:
+            end = field.offset + field.codec.size
+            if self.desired[field.offset:end] == self.reported[field.offset:end]:
+                self.delta.discard(field.name)
+            else:
+                self.delta.add(field.name)
+
+
+class ShadowService:
+    """
+    cloud side of the shadow of the device: keeps the desired and reported states from
+    the messages of the device, answers its GETs when serving and sends the desired updates.
+    The answers are published by a thread of the service, the messages are received on the
+    thread of the MQTT client
+    """
+
+    def __init__(self, cloud: Cloud):
+        self._cloud = cloud
+        self._condition = Condition()
+        self._serving = False
+        self._outbox: Queue[Optional[tuple[Action, Response, bytes, Optional[int]]]] = Queue()
+        self.shadow = Shadow()
+
+        self._thread = Thread(target=self._sender, name="shadow", daemon=True)
+        self._thread.start()
+        cloud.add_listener(self._on_message)
+
+    @property
+    def serving(self) -> bool:
+        return self._serving
+
+    def serve(self, state: Optional[dict]):
+        """
+        answers the GETs of the device with the state, or rejects them if None
+        """
+        with self._condition:
+            if state is None:
+                self.shadow.desired = None
+                self.shadow.delta = set()
+            else:
+                self.shadow.set_desired(state)
+            self._serving = True
+
+    def release(self):
+        """
+        stops answering the GETs, the test answers by itself
+        """
+        with self._condition:
+            self._serving = False
+
+    def desire(self, **fields):
+        """
+        changes fields of the desired state and sends them to the device as a desired update
+        """
+        with self._condition:
+            frame = self.shadow.update_desired(**fields)
+        self._cloud.publish_frame(Action.DESIRED_UPDATE, None, frame)
+
+    def wait(self, predicate: Callable[[Shadow], bool], timeout: float = ANSWER_TIMEOUT) -> Shadow:
+        """
+        waits until the predicate on the shadow is true, e.g. lambda shadow: shadow.in_sync
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: predicate(self.shadow), timeout):
+                raise TimeoutError("shadow condition not reached")
+            return self.shadow
+
+    def stop(self):
+        self._outbox.put(None)
+        self._thread.join()
+
+    def _on_message(self, message: Message):
+        frame = message.payload
+        if message.action == Action.GET and message.response is None:
+            token = HEADER.read(frame, "clientToken")
+            with self._condition:
+                self.shadow.client_token = token
+                if self._serving:
+                    answer = self.shadow.answer(token)
+                    if answer is not None:
+                        self._outbox.put((Action.GET, Response.ACCEPTED, answer, token))
+                    else:
+                        self._outbox.put((Action.GET, Response.REJECTED, _rejected(token), token))
+                self._condition.notify_all()
+        elif message.action == Action.REPORTED_UPDATE:
+            packet_type = HEADER.read(frame, "type")
+            with self._condition:
+                if packet_type == PacketType.CONNECTION.value:
+                    self.shadow.connected = bool(CONNECTION.read(frame, "connected"))
+                elif packet_type in LAYOUTS:
+                    self.shadow.report(frame)
+                self._condition.notify_all()
+
+    def _sender(self):
+        while True:
+            item = self._outbox.get()
+            if item is None:
+                return
+            action, response, frame, token = item
+            try:
+                self._cloud.publish_frame(action, response, frame)
+            except Exception as e:
+                LOGGER.error("failed to answer the GET %s: %s", token, e)
+                continue
+            with self._condition:
+                self.shadow.answered_token = token
+                self._condition.notify_all()
+
+
+def _rejected(client_token: int) -> bytes:
+    return to_binary({"clientToken": client_token, "timestamp": int(time()), "version": 0,
+                      "type": PacketType.HEADER})
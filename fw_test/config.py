@@ -1,9 +1,24 @@
 import tomllib
 
 from dataclasses import dataclass
+from enum import StrEnum, auto
 from typing import Self
 
 
+class Backend(StrEnum):
+    # the real test fixture (Raspberry Pi connected to the device)
+    RASPBERRY = auto()
+    # a virtual radiator that runs in the test process
+    SIMULATED = auto()
+
+
+class CloudBackend(StrEnum):
+    # AWS IoT Core, IoT Jobs and S3
+    AWS = auto()
+    # the stand-ins of fw_test.cloud.local that run in the fixture
+    LOCAL = auto()
+
+
 @dataclass(frozen=True)
 class Config:
     mac_address: str
@@ -17,10 +32,26 @@ class Config:
     serial_port: str
     prev_firmware_path: str
     ota_bucket: str
+    backend: Backend = Backend.RASPBERRY
+    # OTA images are served by the fixture instead of S3
+    ota_local: bool = False
+    # bytes of the traffic of the device kept in memory by the capture on the AP
+    # interface, dumped when a test fails. 0 disables the capture
+    wifi_capture_size: int = 0
+    # name of the fixture in the results store, the host name if not set
+    fixture_id: str = ""
+    cloud: CloudBackend = CloudBackend.AWS
+    # port of the MQTT broker of the local cloud, the device connects to it without TLS
+    cloud_local_port: int = 1883
 
     @classmethod
     def load_file(cls, path: str) -> Self:
         with open(path, "rb") as f:
             config = tomllib.load(f)
 
+        if "backend" in config:
+            config["backend"] = Backend(config["backend"])
+        if "cloud" in config:
+            config["cloud"] = CloudBackend(config["cloud"])
+
         return cls(**config)
@@ -0,0 +1,138 @@
+import re
+
+from time import monotonic
+from logging import getLogger
+from threading import Lock, Timer
+from queue import Queue, Full, Empty
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+LOGGER = getLogger(__name__)
+
+# lines that are not a reply to a command are kept for serial_readline,
+# when nobody reads them the oldest are discarded
+LINE_BUFFER_SIZE = 1000
+
+COMMAND_TIMEOUT = 5
+
+
+@dataclass(frozen=True)
+class ConsoleReply:
+    command: str
+    # match of the reply pattern on the reply line
+    match: re.Match
+    # all the lines received between the command and its reply (included)
+    lines: list[str]
+    latency: float
+
+
+# compared by identity, two equal commands can be pending at the same time
+@dataclass(eq=False)
+class _PendingCommand:
+    command: str
+    reply: re.Pattern
+    future: Future
+    sent_at: float
+    lines: list[str] = field(default_factory=list)
+    timer: Optional[Timer] = None
+
+
+class Console:
+    """
+    command channel over the debug serial console. Commands are written one at a time,
+    each one waits for the first line that matches its reply pattern, that is delivered
+    by the serial reader thread. Many commands can wait for their reply at the same time
+    """
+
+    def __init__(self, write: Callable[[bytes], None]):
+        self._write = write
+        self._write_lock = Lock()
+        self._pending_lock = Lock()
+        self._pending: list[_PendingCommand] = []
+        self._lines: Queue[str] = Queue(maxsize=LINE_BUFFER_SIZE)
+
+    def command(self, command: str, reply: str | re.Pattern, timeout: float = COMMAND_TIMEOUT) -> Future:
+        """
+        sends a command, the returned future resolves to a ConsoleReply
+        """
+        pending = _PendingCommand(command, re.compile(reply), Future(), monotonic())
+        # the command fails when the timeout expires, even if the device sends nothing
+        pending.timer = Timer(timeout, self._expire, (pending,))
+        pending.timer.daemon = True
+
+        # the command is registered before writing it, so that a fast reply can't be lost
+        with self._pending_lock:
+            self._pending.append(pending)
+        pending.timer.start()
+
+        LOGGER.debug("console command: %s", command)
+        self.write(command + "\n")
+
+        return pending.future
+
+    def write(self, data: str):
+        """
+        writes raw data on the console, without waiting for any reply
+        """
+        with self._write_lock:
+            self._write(data.encode("ascii"))
+
+    def script(self, commands: list[tuple[str, str | re.Pattern]],
+               timeout: float = COMMAND_TIMEOUT) -> list[ConsoleReply]:
+        """
+        sends all the commands without waiting for the replies, then waits for all of them
+        """
+        futures = [self.command(command, reply, timeout) for command, reply in commands]
+
+        return [future.result(timeout=timeout) for future in futures]
+
+    def readline(self, timeout: float) -> str:
+        """
+        returns the next line that is not a reply to a command
+        """
+        try:
+            return self._lines.get(timeout=timeout)
+        except Empty:
+            raise TimeoutError("no line received on the console")
+
+    def handle_line(self, line: str):
+        """
+        called by the reader thread for each line received
+        """
+        now = monotonic()
+        replied = None
+        with self._pending_lock:
+            self._pending = [pending for pending in self._pending if not pending.future.cancelled()]
+            for pending in self._pending:
+                pending.lines.append(line)
+
+            for pending in self._pending:
+                match = pending.reply.search(line)
+                if match:
+                    self._pending.remove(pending)
+                    replied = pending, ConsoleReply(pending.command, match, pending.lines, now - pending.sent_at)
+                    break
+
+        # the futures are resolved out of the lock, their callbacks can send other commands
+        if replied is not None:
+            pending, reply = replied
+            pending.timer.cancel()
+            if not pending.future.cancelled():
+                pending.future.set_result(reply)
+            return
+
+        try:
+            self._lines.put_nowait(line)
+        except Full:
+            self._lines.get_nowait()
+            self._lines.put_nowait(line)
+
+    def _expire(self, pending: _PendingCommand):
+        with self._pending_lock:
+            if pending not in self._pending:
+                return
+            self._pending.remove(pending)
+
+        if not pending.future.cancelled():
+            pending.future.set_exception(TimeoutError(f"no reply to console command {pending.command!r}"))
@@ -1,9 +1,21 @@
+from typing import Optional
+
 from fw_test.wifi import Wifi
-from fw_test.cloud import Cloud
+from fw_test.cloud import Cloud, ChangeFeed, ShadowService
 from fw_test.io import IO
-from fw_test.config import Config
+from fw_test.config import Config, Backend, CloudBackend
 from fw_test.firmware import Firmware
 from fw_test.api import LocalApi
+from fw_test.simulator import Simulator
+from fw_test.trace import Tracer
+from fw_test.device import DeviceTracker
+from fw_test.pairing import PairingService
+from fw_test.profiler import Profiler
+from fw_test.artifacts import ArtifactServer
+from fw_test.cloud.cloud import OTA_HOST
+from fw_test.cloud.local import LocalCloud
+
+HTTP_PORT = 80
 
 
 class Context:
@@ -11,12 +23,55 @@ class Context:
     main context exposed to the test runner
     """
 
-    def __init__(self, config_path: str, firmware_path: str):
+    def __init__(self, config_path: str, firmware_path: str, profiler: Optional[Profiler] = None):
         self.config = Config.load_file(config_path)
         self.firmware = Firmware.load_file(firmware_path)
         self.prev_firmware = Firmware.load_file(self.config.prev_firmware_path)
-        self.io = IO(self.config)
-        self.wifi = Wifi(self.config)
-        self.cloud = Cloud(self.config)
-        self.api = LocalApi(self.config)
+        self.tracer = Tracer()
+        self.simulator = None
+
+        if self.config.backend == Backend.SIMULATED:
+            self.simulator = Simulator(self.config, self.firmware)
+            self.io = IO(self.config, gpio=self.simulator.gpio, serial_port=self.simulator.console.port,
+                         tracer=self.tracer)
+            self.wifi = self.simulator.wifi
+            self.api = LocalApi(self.config, base_url=self.simulator.api.url, tracer=self.tracer)
+        else:
+            self.io = IO(self.config, tracer=self.tracer)
+            self.wifi = Wifi(self.config)
+            self.api = LocalApi(self.config, tracer=self.tracer)
+
+        # instrumented before the references to their methods are taken
+        if profiler is not None:
+            profiler.instrument(self.io, "io")
+            profiler.instrument(self.wifi, "wifi")
+            profiler.instrument(self.api, "api")
+
+        self.device = DeviceTracker(self.io, self.tracer, self.firmware.version)
+
+        self.artifacts = None
+        if self.config.ota_local or self.config.cloud == CloudBackend.LOCAL:
+            self.artifacts = ArtifactServer(self.wifi.listen(HTTP_PORT))
+            self.wifi.dns.set(OTA_HOST, self.wifi.address)
+
+        self.local_cloud = None
+        if self.config.cloud == CloudBackend.LOCAL:
+            self.local_cloud = LocalCloud(self.config, self.wifi.listen(self.config.cloud_local_port), self.artifacts)
+            self.wifi.dns.set(self.config.aws_iot_endpoint, self.wifi.address)
+            # the OTA images reach the artifact server through the S3 stand-in
+            self.cloud = Cloud(self.config, tracer=self.tracer, local=self.local_cloud)
+        else:
+            self.cloud = Cloud(self.config, tracer=self.tracer, artifacts=self.artifacts)
+        if profiler is not None:
+            profiler.instrument(self.cloud, "cloud")
+            profiler.instrument(self.cloud.jobs, "jobs")
+            profiler.instrument(self.device, "device")
+        self.shadow = ShadowService(self.cloud)
+        self.changes = ChangeFeed()
+        self.cloud.add_listener(self.changes.on_message)
+        self.pairing = PairingService(self.config, self.io, self.wifi, self.api, self.cloud, self.shadow, self.device,
+                                      self.tracer)
+        if profiler is not None:
+            profiler.instrument(self.shadow, "shadow")
+            profiler.instrument(self.pairing, "pairing")
 
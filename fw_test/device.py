@@ -0,0 +1,245 @@
+import re
+import heapq
+import itertools
+
+from time import monotonic
+from logging import getLogger
+from threading import Condition
+from dataclasses import dataclass, replace
+from enum import IntEnum
+from typing import Callable, Optional
+
+from fw_test.io import IO
+from fw_test.pins import LedColor
+from fw_test.firmware import FirmwareVersion
+from fw_test.trace import Tracer, TraceEvent
+
+LOGGER = getLogger(__name__)
+
+# line printed on the debug console by the firmware at boot
+BOOT_MILESTONE_RE = re.compile(r"\$\$FIRMWARE_VERSION=([0-9]+\.[0-9]+-[a-z0-9]+)#")
+BOOT_TIMEOUT = 10
+# time the status LED must keep the expected color
+LED_STABLE_TIME = 0.5
+NO_ENV_ID = (b"\0" * 16).hex()
+
+
+class DeviceStateError(RuntimeError):
+    pass
+
+
+class Provisioning(IntEnum):
+    # no Wi-Fi network configured
+    FACTORY = 0
+    # Wi-Fi network configured, not paired with the cloud
+    PROVISIONED = 1
+    # paired with an environment on the cloud
+    PAIRED = 2
+
+
+# color of the status LED in each provisioning state, once the device settled
+PROVISIONING_LED = {
+    Provisioning.FACTORY: LedColor.RED,
+    Provisioning.PROVISIONED: LedColor.YELLOW,
+    Provisioning.PAIRED: LedColor.OFF,
+}
+
+
+@dataclass(frozen=True)
+class DeviceState:
+    """
+    what is known of the device, None for unknown
+    """
+    firmware: Optional[FirmwareVersion] = None
+    provisioning: Optional[Provisioning] = None
+    # the inputs of the device were used since the last boot, the runtime
+    # state (set point, standby, pilot wire mode) may have changed
+    dirty: bool = True
+
+
+@dataclass(frozen=True)
+class DeviceRequirement:
+    """
+    state a test needs the device in before it starts
+    """
+    provisioning: Provisioning = Provisioning.FACTORY
+    # None for the firmware under test
+    firmware: Optional[FirmwareVersion] = None
+
+
+@dataclass(frozen=True)
+class Transition:
+    """
+    an operation that brings the device to another state, cost is its duration in seconds
+    """
+    name: str
+    cost: float
+    # state after the transition, None if it can't be applied
+    apply: Callable[[DeviceState, FirmwareVersion], Optional[DeviceState]]
+
+
+def _after_boot(state: DeviceState) -> bool:
+    # a paired device asks its state to the cloud at boot, until it gets the answer
+    # (see PairingService) its runtime state is not known
+    return state.provisioning == Provisioning.PAIRED
+
+
+TRANSITIONS = (
+    Transition("reset", 3, lambda state, factory: replace(state, dirty=_after_boot(state))),
+    Transition("restore_firmware", 3.2,
+               lambda state, factory: replace(state, firmware=factory, dirty=_after_boot(state))),
+    Transition("hard_reset", 10, lambda state, factory: replace(state, provisioning=Provisioning.FACTORY, dirty=False)),
+)
+
+
+def satisfies(state: DeviceState, requirement: DeviceRequirement, factory: FirmwareVersion) -> bool:
+    return state.firmware == (requirement.firmware or factory) and state.provisioning == requirement.provisioning \
+        and not state.dirty
+
+
+def plan(state: DeviceState, requirement: DeviceRequirement, factory: FirmwareVersion,
+         transitions: tuple[Transition, ...] = TRANSITIONS) -> list[Transition]:
+    """
+    cheapest sequence of transitions that brings the device from the state to the requirement
+    """
+    counter = itertools.count()
+    queue = [(0.0, next(counter), state, [])]
+    visited = set()
+    while queue:
+        cost, _, current, path = heapq.heappop(queue)
+        if satisfies(current, requirement, factory):
+            return path
+        if current in visited:
+            continue
+        visited.add(current)
+
+        for transition in transitions:
+            following = transition.apply(current, factory)
+            if following is not None and following not in visited:
+                heapq.heappush(queue, (cost + transition.cost, next(counter), following, path + [transition]))
+
+    raise DeviceStateError(f"no transition brings the device from {state} to {requirement}")
+
+
+class DeviceTracker:
+    """
+    follows the state of the device from the events of the tracer (console milestones,
+    cloud messages, inputs and API requests) and brings it to the state required by a
+    test with the cheapest transitions
+    """
+
+    def __init__(self, io: IO, tracer: Tracer, factory_firmware: FirmwareVersion):
+        self._io = io
+        self._factory = factory_firmware
+        self._condition = Condition()
+        self._boots = 0
+        self._transitions = TRANSITIONS
+        self._operations: dict[str, Callable[[], None]] = {
+            "reset": io.reset,
+            "restore_firmware": io.restore_firmware,
+            "hard_reset": io.hard_reset,
+        }
+        self.state = DeviceState()
+        tracer.add_listener(self._on_event)
+
+    def add_transition(self, transition: Transition, operation: Callable[[], None]):
+        """
+        makes another operation available to reach the required states
+        """
+        self._transitions += (transition,)
+        self._operations[transition.name] = operation
+
+    def ensure(self, requirement: DeviceRequirement = DeviceRequirement()):
+        """
+        brings the device to the required state, skipping the operations that are not needed
+        """
+        self._observe_led()
+        if self._reach(requirement):
+            return
+
+        # the device was not in the state it was believed to be, start from scratch
+        LOGGER.warning("device state %s not verified, reset it", self.state)
+        with self._condition:
+            self.state = DeviceState()
+        if not self._reach(requirement):
+            raise DeviceStateError(f"the device did not reach {requirement}")
+
+    def update(self, **changes):
+        """
+        corrects the known state with what was found out by other means, e.g. the
+        device left the access point
+        """
+        with self._condition:
+            self.state = replace(self.state, **changes)
+        LOGGER.debug("device state %s", self.state)
+
+    def wait_for_boot(self, boots: int, timeout: float = BOOT_TIMEOUT) -> bool:
+        """
+        waits until the device booted after the specified count of boots
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._boots > boots, timeout)
+
+    def _reach(self, requirement: DeviceRequirement) -> bool:
+        path = plan(self.state, requirement, self._factory, self._transitions)
+        LOGGER.info("device state %s, transitions: %s", self.state,
+                    ", ".join(transition.name for transition in path) or "none")
+
+        for transition in path:
+            start = monotonic()
+            with self._condition:
+                boots = self._boots
+                following = transition.apply(self.state, self._factory)
+            self._operations[transition.name]()
+            if transition.name in ("reset", "restore_firmware") and not self.wait_for_boot(boots):
+                LOGGER.warning("no boot message from the device after %s", transition.name)
+
+            # the events of the operation may already have brought the device out of the
+            # states the transition applies to, e.g. the answer of the pairing
+            with self._condition:
+                self.state = transition.apply(self.state, self._factory) or following
+            LOGGER.debug("%s took %.1fs", transition.name, monotonic() - start)
+
+        return self._io.wait_for_led(PROVISIONING_LED[requirement.provisioning], stable=LED_STABLE_TIME)
+
+    def _observe_led(self):
+        color = self._io.status_led_color()
+        provisioning = {led: provisioning for provisioning, led in PROVISIONING_LED.items()}.get(color)
+        # with the LED off the device may be paired or not running
+        if provisioning is not None and provisioning != Provisioning.PAIRED:
+            with self._condition:
+                self.state = replace(self.state, provisioning=provisioning)
+
+    def _on_event(self, event: TraceEvent):
+        attributes = event.attributes
+        with self._condition:
+            state = self.state
+            match event.source:
+                case "serial":
+                    boot = BOOT_MILESTONE_RE.search(attributes.get("line", ""))
+                    if boot is not None:
+                        state = replace(state, firmware=FirmwareVersion.from_str(boot.group(1)),
+                                        dirty=_after_boot(state))
+                        self._boots += 1
+                        self._condition.notify_all()
+                case "io.write" if attributes.get("pin") in ("BUTTON_PLUS", "BUTTON_MINUS"):
+                    state = replace(state, dirty=True)
+                case "io.waveform":
+                    state = replace(state, dirty=True)
+                case "api.provision":
+                    state = replace(state, provisioning=Provisioning.PROVISIONED, dirty=True)
+                case "api.firmware_update":
+                    # known again at the next boot
+                    state = replace(state, firmware=None)
+                case "cloud.publish":
+                    state = replace(state, dirty=True)
+                    if attributes.get("action") == "GET" and attributes.get("response") == "ACCEPTED" \
+                            and attributes.get("env_id") not in (None, NO_ENV_ID):
+                        state = replace(state, provisioning=Provisioning.PAIRED)
+                case "cloud.message":
+                    if attributes.get("action") == "REPORTED_UPDATE" and attributes.get("env_id") == NO_ENV_ID:
+                        state = replace(state, provisioning=Provisioning.FACTORY)
+
+            if state != self.state:
+                LOGGER.debug("device state %s", state)
+                self.state = state
@@ -1,8 +1,10 @@
 import re
+import mmap
 import hashlib
 
 from logging import getLogger
-from dataclasses import dataclass
+from functools import cached_property
+from dataclasses import dataclass, field
 from typing import Self, Optional
 
 LOGGER = getLogger(__name__)
@@ -39,23 +41,45 @@ class Firmware:
     represents the firmware of a device
     """
     version: FirmwareVersion
-    binary: bytes
+    # None if the firmware is read from its file when needed, see binary
+    data: Optional[bytes]
     hash: str
+    # file the firmware was loaded from
+    path: Optional[str] = None
+    size: int = field(default=None)
+
+    def __post_init__(self):
+        if self.size is None:
+            object.__setattr__(self, "size", len(self.binary))
+
+    @cached_property
+    def binary(self) -> bytes:
+        """
+        the image of the firmware, read from the file the first time
+        """
+        if self.data is not None:
+            return self.data
+
+        with open(self.path, "rb") as f:
+            return f.read()
 
     @classmethod
     def load_file(cls, path: str) -> Self:
         """
-        load a firmware from a file
+        load a firmware from a file. The file is memory mapped to find the version and
+        compute the hash, the image is read only if binary is used
         """
         LOGGER.info("loading firmware from %s", path)
 
-        with open(path, "rb") as f:
-            binary = f.read()
-
-        major, minor, commit = FW_VERSION_RE.search(binary).groups()
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            major, minor, commit = FW_VERSION_RE.search(image).groups()
+            digest = hashlib.sha256(image).hexdigest()
+            size = len(image)
 
         return cls(
-            binary=binary, 
-            hash=hashlib.sha256(binary).hexdigest(),
+            data=None,
+            hash=digest,
+            path=path,
+            size=size,
             version=FirmwareVersion(int(major), int(minor), commit.decode('ascii'))
         )
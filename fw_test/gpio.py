@@ -0,0 +1,73 @@
+from enum import Enum, auto
+from typing import Callable, Protocol
+
+from fw_test.waveform import WaveformPlayer
+
+
+class GpioMode(Enum):
+    INPUT = auto()
+    OUTPUT = auto()
+
+
+class Gpio(Protocol):
+    """
+    interface of a GPIO backend, pins are numbered as BCM GPIO numbers
+    """
+
+    def setup(self, pin: int, mode: GpioMode):
+        ...
+
+    def input(self, pin: int) -> int:
+        ...
+
+    def output(self, pin: int, value: int):
+        ...
+
+    def add_edge_callback(self, pin: int, callback: Callable[[int, int], None]):
+        """
+        calls callback(pin, value) every time an input changes its value
+        """
+        ...
+
+    def create_waveform_player(self):
+        """
+        returns the object that generates periodic signals on the outputs,
+        with the start(waveform), stop_pins(pins) and stop() methods
+        """
+        ...
+
+    def cleanup(self):
+        ...
+
+
+class RaspberryGpio:
+    """
+    GPIO backend that drives the header of the Raspberry Pi
+    """
+
+    def __init__(self):
+        # imported here so that the framework can be imported
+        # on machines that are not a Raspberry Pi
+        from RPi import GPIO
+
+        self._gpio = GPIO
+        self._gpio.setmode(GPIO.BCM)
+
+    def setup(self, pin: int, mode: GpioMode):
+        self._gpio.setup(pin, self._gpio.IN if mode == GpioMode.INPUT else self._gpio.OUT)
+
+    def input(self, pin: int) -> int:
+        return self._gpio.input(pin)
+
+    def output(self, pin: int, value: int):
+        self._gpio.output(pin, value)
+
+    def add_edge_callback(self, pin: int, callback: Callable[[int, int], None]):
+        self._gpio.add_event_detect(pin, self._gpio.BOTH,
+                                    callback=lambda channel: callback(channel, self.input(channel)))
+
+    def create_waveform_player(self) -> WaveformPlayer:
+        return WaveformPlayer(self.output)
+
+    def cleanup(self):
+        self._gpio.cleanup()
@@ -1,90 +1,45 @@
-from enum import Enum
-from time import sleep
+from time import sleep, monotonic
+from dataclasses import replace
+from functools import partial
+from threading import Condition
 from logging import getLogger
-from threading import Thread
+from typing import Optional
+from concurrent.futures import Future
 
-from RPi import GPIO
 from serial import Serial
 from serial.threaded import LineReader, ReaderThread
 
 from fw_test.config import Config
+from fw_test.console import Console, ConsoleReply, COMMAND_TIMEOUT
 from fw_test.firmware import Firmware
+from fw_test.gpio import Gpio, GpioMode, RaspberryGpio
+from fw_test.pins import IOValue, IOPin, LedColor, INPUT_PINS, BUTTON_UP_VALUE, BUTTON_PRESS_TIME, \
+    BUTTON_RELEASE_TIME
+from fw_test.sequence import Sequence, SequencePlayer, SequenceResult, Step
+from fw_test.trace import Tracer
+from fw_test.waveform import Waveform, FilPiloteMode, fil_pilote, current_feedback
 
 LOGGER = getLogger(__name__)
 CONSOLE_BAUDRATE = 115200
+LED_TIMEOUT = 10
+# the LED is read again at this interval in case an edge was missed
+LED_POLL_INTERVAL = 0.2
 
 
 class SerialReader(LineReader):
     TERMINATOR = b"\n"
     ENCODING = "latin-1"
 
+    def __init__(self, tracer: Tracer, console: Console):
+        super().__init__()
+        self._tracer = tracer
+        self._console = console
+
     def handle_line(self, line):
+        line = line.strip()
+        self._tracer.response("serial", line=line)
         LOGGER.debug("RE: %s", line)
-
-
-class IOValue(Enum):
-    LOW = GPIO.LOW
-    HIGH = GPIO.HIGH
-
-    def __int__(self):
-        return 1 if self.value == IOValue.HIGH else 0
-
-
-class LedColor(Enum):
-    OFF = (0, 0, 0)
-    RED = (1, 0, 0)
-    GREEN = (0, 1, 0)
-    BLUE = (0, 0, 1)
-    YELLOW = (1, 1, 0)
-    CYAN = (0, 1, 1)
-    MAGENTA = (1, 0, 1)
-    WHITE = (1, 1, 1)
-
-
-BUTTON_DOWN_VALUE = IOValue.LOW
-BUTTON_UP_VALUE = IOValue.HIGH
-
-# Pin assignment
-#                                         Pin 1 Pin2
-#                                      +3V3 [ ] [ ] +5V
-#                            SDA1 / GPIO  2 [ ] [ ] +5V
-#                            SCL1 / GPIO  3 [ ] [ ] GND
-#                           (RESET) GPIO  4 [ ] [ ] GPIO 14 / TXD0
-#                                       GND [ ] [ ] GPIO 15 / RXD0
-#                                   GPIO 17 [ ] [ ] GPIO 18
-#                          (BUZZER) GPIO 27 [ ] [ ] GND
-#                           (LED_R) GPIO 22 [ ] [ ] GPIO 23 (LED_G)
-#                                      +3V3 [ ] [ ] GPIO 24 (LED_B)
-#             (FIL_PILOTE_N) MOSI / GPIO 10 [ ] [ ] GND
-#             (FIL_PILOTE_P) MISO / GPIO  9 [ ] [ ] GPIO 25 (RELAY)
-#         (CURRENT_FEEDBACK) SCLK / GPIO 11 [ ] [ ] GPIO  8 / CE0# (BUTTON_MINUS)
-#                                       GND [ ] [ ] GPIO  7 / CE1# (BUTTON_PLUS)
-#                           ID_SD / GPIO  0 [ ] [ ] GPIO  1 / ID_SC
-#                            (BOOT) GPIO  5 [ ] [ ] GND
-#                         (RESTORE) GPIO  6 [ ] [ ] GPIO 12
-#                                   GPIO 13 [ ] [ ] GND
-#                            MISO / GPIO 19 [ ] [ ] GPIO 16 / CE2#
-#                           (TRIAC) GPIO 26 [ ] [ ] GPIO 20 / MOSI
-#                                       GND [ ] [ ] GPIO 21 / SCLK
-#                                       Pin 39 Pin 40
-class IOPin(Enum):
-    # outputs
-    RESET = 4
-    BOOT = 5
-    RESTORE = 6
-    BUTTON_PLUS = 7
-    BUTTON_MINUS = 8
-    FIL_PILOTE_P = 9
-    FIL_PILOTE_N = 10
-    CURRENT_FEEDBACK = 11
-
-    # inputs
-    LED_R = 22
-    LED_G = 23
-    LED_B = 24
-    RELAY = 25
-    TRIAC = 26
-    BUZZER = 27
+        self._console.handle_line(line)
 
 
 class IO:
@@ -93,52 +48,62 @@ class IO:
     handles the interaction with the embedded device inputs/outputs
     """
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, gpio: Optional[Gpio] = None, serial_port: Optional[str] = None,
+                 tracer: Optional[Tracer] = None, time_scale: float = 1.0):
         self._config = config
-        self._serial = Serial(port=config.serial_port, baudrate=CONSOLE_BAUDRATE, timeout=10)
-        self._reader = Thread(target=self.serial_read, daemon=True)
-        self._reader = ReaderThread(self._serial, SerialReader)
+        # the simulator tests play the sequences faster, against a simulated
+        # clock that runs as much faster (see Simulator)
+        self._time_scale = time_scale
+        self._gpio = gpio if gpio is not None else RaspberryGpio()
+        self._tracer = tracer if tracer is not None else Tracer()
+        self._serial = Serial(port=serial_port or config.serial_port, baudrate=CONSOLE_BAUDRATE, timeout=10)
+        self._console = Console(self._serial.write)
+        self._reader = ReaderThread(self._serial, partial(SerialReader, self._tracer, self._console))
         self._reader.start()
+        self._edges = Condition()
 
-        GPIO.setmode(GPIO.BCM)
-        
-        def setup(pin: IOPin, mode: int):
-            LOGGER.debug("setup pin %s (%s) as %s", pin.name, pin.value, "INPUT" if mode == GPIO.IN else "OUTPUT")
-            GPIO.setup(pin.value, mode)
+        def setup(pin: IOPin, mode: GpioMode):
+            LOGGER.debug("setup pin %s (%s) as %s", pin.name, pin.value, mode.name)
+            self._gpio.setup(pin.value, mode)
 
         # setup all inputs
-        setup(IOPin.LED_R, GPIO.IN)
-        setup(IOPin.LED_G, GPIO.IN)
-        setup(IOPin.LED_B, GPIO.IN)
-        setup(IOPin.TRIAC, GPIO.IN)
-        setup(IOPin.RELAY, GPIO.IN)
-        setup(IOPin.BUZZER, GPIO.IN)
+        setup(IOPin.LED_R, GpioMode.INPUT)
+        setup(IOPin.LED_G, GpioMode.INPUT)
+        setup(IOPin.LED_B, GpioMode.INPUT)
+        setup(IOPin.TRIAC, GpioMode.INPUT)
+        setup(IOPin.RELAY, GpioMode.INPUT)
+        setup(IOPin.BUZZER, GpioMode.INPUT)
 
         # setup all outputs
-        setup(IOPin.RESET, GPIO.OUT)
-        setup(IOPin.BOOT, GPIO.OUT)
-        setup(IOPin.RESTORE, GPIO.OUT)
-        setup(IOPin.BUTTON_PLUS, GPIO.OUT)
-        setup(IOPin.BUTTON_MINUS, GPIO.OUT)
-        setup(IOPin.FIL_PILOTE_P, GPIO.OUT)
-        setup(IOPin.FIL_PILOTE_N, GPIO.OUT)
-        setup(IOPin.CURRENT_FEEDBACK, GPIO.OUT)
+        setup(IOPin.RESET, GpioMode.OUTPUT)
+        setup(IOPin.BOOT, GpioMode.OUTPUT)
+        setup(IOPin.RESTORE, GpioMode.OUTPUT)
+        setup(IOPin.BUTTON_PLUS, GpioMode.OUTPUT)
+        setup(IOPin.BUTTON_MINUS, GpioMode.OUTPUT)
+        setup(IOPin.FIL_PILOTE_P, GpioMode.OUTPUT)
+        setup(IOPin.FIL_PILOTE_N, GpioMode.OUTPUT)
+        setup(IOPin.CURRENT_FEEDBACK, GpioMode.OUTPUT)
 
         self.write(IOPin.BUTTON_MINUS, BUTTON_UP_VALUE)
         self.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
 
+        for pin in INPUT_PINS:
+            self._gpio.add_edge_callback(pin.value, self._on_edge)
+
+        self._player = SequencePlayer(self.write)
+        self._waveforms = self._gpio.create_waveform_player()
+
     def reset(self):
         """
         reboots the device by controlling the RESET signal
         """
         LOGGER.info("reset board")
-        self.write(IOPin.RESET, IOValue.LOW)
-
-        sleep(0.1)
-
-        self.write(IOPin.BOOT, IOValue.LOW)
-        self.write(IOPin.RESTORE, IOValue.LOW)
-        self.write(IOPin.RESET, IOValue.HIGH)
+        self.play(Sequence()
+            .set(0, IOPin.RESET, IOValue.LOW)
+            .set(0.1, IOPin.BOOT, IOValue.LOW)
+            .set(0.1, IOPin.RESTORE, IOValue.LOW)
+            .set(0.1, IOPin.RESET, IOValue.HIGH)
+            .compile())
 
     def flash_firmware(self, firmware: Firmware):
         """
@@ -152,55 +117,112 @@ class IO:
         """
         LOGGER.info("restore board firmware")
 
-        self.write(IOPin.RESET, IOValue.LOW)
-        self.write(IOPin.RESTORE, IOValue.HIGH)
+        self.play(Sequence()
+            .set(0, IOPin.RESET, IOValue.LOW)
+            .set(0, IOPin.RESTORE, IOValue.HIGH)
+            .set(0.1, IOPin.RESET, IOValue.HIGH)
+            .compile())
 
-        sleep(0.1)
-        self.write(IOPin.RESET, IOValue.HIGH)
-
-        sleep(0.1)
+        sleep(0.1 * self._time_scale)
         self.reset()
 
     def read(self, pin: IOPin) -> IOValue:
         """
         reads the current value for a pin
         """
-        return IOValue(GPIO.input(pin.value))
+        return IOValue(self._gpio.input(pin.value))
 
     def write(self, pin: IOPin, value: IOValue):
         """
         sets the value for a pin
         """
         LOGGER.debug("set pin %s(%s) %s(%s)", pin.name, pin.value, value.name, value.value)
-        GPIO.output(pin.value, value.value)
+        self._tracer.stimulus("io.write", pin=pin.name, value=value.name)
+        self._gpio.output(pin.value, value.value)
 
-    def serial_readline(self) -> str:
+    def serial_readline(self, timeout: float = 10) -> str:
         """
-        reads one line of text form the debug serial port
+        reads one line of text form the debug serial port,
+        replies to commands are not returned
         """
-        return self._serial.readline().decode("ascii")
+        return self._console.readline(timeout)
 
     def serial_write(self, data: str):
         """
         writes data to the serial port
         """
-        self._serial.write(data.encode("ascii"))
+        self._console.write(data)
+
+    def serial_command(self, command: str, reply: str, timeout: float = COMMAND_TIMEOUT) -> Future:
+        """
+        sends a command on the debug console, the returned future resolves to
+        the ConsoleReply of the first line that matches the reply pattern
+        """
+        return self._console.command(command, reply, timeout)
+
+    def serial_script(self, commands: list[tuple[str, str]], timeout: float = COMMAND_TIMEOUT) -> list[ConsoleReply]:
+        """
+        sends many commands back-to-back and waits for all their replies
+        """
+        return self._console.script(commands, timeout)
+
+    def play(self, steps: list[Step]) -> SequenceResult:
+        """
+        plays a compiled sequence of output changes with accurate timing,
+        returns the timestamps at which each step was actually applied
+        """
+        if self._time_scale != 1.0:
+            steps = [replace(step, offset_ns=round(step.offset_ns * self._time_scale)) for step in steps]
+
+        return self._player.play(steps)
+
+    def start_waveform(self, waveform: Waveform):
+        """
+        generates a periodic signal on the outputs, replacing
+        the one that was being generated on the same pins
+        """
+        LOGGER.debug("start waveform on %s", sorted(pin.name for pin in waveform.pins))
+        self._tracer.stimulus("io.waveform", pins=tuple(sorted(pin.name for pin in waveform.pins)))
+        self._waveforms.start(waveform)
+
+    def stop_waveform(self, pins: frozenset[IOPin]):
+        """
+        stops the periodic signal generated on the pins
+        """
+        self._waveforms.stop_pins(pins)
+
+    def set_fil_pilote(self, mode: FilPiloteMode):
+        """
+        drives the pilot wire input of the device with the specified mode
+        """
+        LOGGER.info("set fil pilote %s", mode.name)
+        self.start_waveform(fil_pilote(mode))
+
+    def set_current_feedback(self, load_on: bool):
+        """
+        simulates the current sensor of the load
+        """
+        LOGGER.info("set current feedback %s", "on" if load_on else "off")
+        self.start_waveform(current_feedback(load_on))
 
     def stop(self):
+        LOGGER.debug("stop waveforms")
+        self._waveforms.stop()
+
+        LOGGER.debug("stop sequence player")
+        self._player.stop()
+
         LOGGER.debug("stop serial reader")
         self._reader.stop()
 
-        GPIO.cleanup() 
-
+        self._gpio.cleanup()
 
-    def serial_read(self):
-        try:
-            while True:
-                line = self._serial.readline()
-                LOGGER.debug("RE: %s", line.decode("latin-1").strip())
-        except:
-            LOGGER.debug("serial reader stop")
-            return
+    def _on_edge(self, pin: int, value: int):
+        pin, value = IOPin(pin), IOValue(value)
+        LOGGER.debug("pin %s(%s) changed to %s", pin.name, pin.value, value.name)
+        self._tracer.response("gpio", pin=pin.name, value=value.name)
+        with self._edges:
+            self._edges.notify_all()
 
     def status_led_color(self) -> LedColor:
         """
@@ -213,6 +235,29 @@ class IO:
 
         return LedColor((r, g, b))
 
+    def wait_for_led(self, color: LedColor, timeout: float = LED_TIMEOUT, stable: float = 0.0) -> bool:
+        """
+        waits until the status LED shows the color for at least stable seconds,
+        returns false on timeout
+        """
+        deadline = monotonic() + timeout
+        since = None
+        with self._edges:
+            while True:
+                now = monotonic()
+                if self.status_led_color() == color:
+                    since = now if since is None else since
+                    if now - since >= stable:
+                        return True
+                else:
+                    since = None
+
+                if now >= deadline:
+                    LOGGER.info("status LED is %s, expected %s", self.status_led_color(), color)
+                    return False
+                wait = LED_POLL_INTERVAL if since is None else min(LED_POLL_INTERVAL, since + stable - now)
+                self._edges.wait(min(wait, deadline - now))
+
     def is_load_active(self) -> bool:
         """ 
         return ture if the relay is on
@@ -222,34 +267,16 @@ class IO:
 
 
     def hard_reset(self):
-        self.write(IOPin.BUTTON_PLUS, BUTTON_DOWN_VALUE)
-        self.write(IOPin.BUTTON_MINUS, BUTTON_DOWN_VALUE)
-
-        sleep(7)
-
-        self.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
-        self.write(IOPin.BUTTON_MINUS, BUTTON_UP_VALUE)
-
-        sleep(0.5)
-
-        self.write(IOPin.BUTTON_PLUS, BUTTON_DOWN_VALUE)
-
-        sleep(0.5)
-
-        self.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
+        self.play(Sequence()
+            .press(IOPin.BUTTON_PLUS, at=0, duration=7)
+            .press(IOPin.BUTTON_MINUS, at=0, duration=7)
+            .press(IOPin.BUTTON_PLUS, at=7.5, duration=0.5)
+            .compile())
 
-        sleep(2)
+        sleep(2 * self._time_scale)
 
-    def press_plus(self, press_time=0.2):
-        self.write(IOPin.BUTTON_PLUS, BUTTON_DOWN_VALUE)
+    def press_plus(self, press_time=BUTTON_PRESS_TIME, count=1, release_time=BUTTON_RELEASE_TIME):
+        self.play(Sequence.presses(IOPin.BUTTON_PLUS, count, press_time, release_time).compile())
 
-        sleep(press_time)
-
-        self.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
-
-    def press_minus(self, press_time=0.2):
-        self.write(IOPin.BUTTON_MINUS, BUTTON_DOWN_VALUE)
-
-        sleep(press_time)
-
-        self.write(IOPin.BUTTON_MINUS, BUTTON_UP_VALUE)
+    def press_minus(self, press_time=BUTTON_PRESS_TIME, count=1, release_time=BUTTON_RELEASE_TIME):
+        self.play(Sequence.presses(IOPin.BUTTON_MINUS, count, press_time, release_time).compile())
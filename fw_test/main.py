@@ -0,0 +1,234 @@
+import sys
+import json
+import asyncio
+import argparse
+import logging
+
+from time import monotonic
+from dataclasses import asdict
+
+from fw_test.api import LocalApi, BASE_URL
+from fw_test.bench import Benchmark, Workload, Endpoint
+from fw_test.cloud.broker import Broker
+from fw_test.scheduler import Scheduler, DurationHistory, PytestRunner, load_inventory, collect
+from fw_test.config import Config, Backend
+from fw_test.results import ResultsStore, regressions, REGRESSION_THRESHOLD
+from fw_test.firmware import Firmware
+from fw_test.simulator import Simulator
+from fw_test.simulator.fleet import Fleet, GetResponder, DEFAULT_METRIC_INTERVAL
+from fw_test.wifi import Wifi
+
+
+def bench(args: argparse.Namespace) -> int:
+    """
+    measures the local API of the device (or of the simulator) under load
+    """
+    config = Config.load_file(args.config)
+    workload = Workload(
+        endpoints=tuple(Endpoint(endpoint) for endpoint in args.endpoint or [Endpoint.STATE.value]),
+        concurrency=args.concurrency,
+        rate=args.rate,
+        duration=args.duration,
+        timeout=args.timeout,
+    )
+
+    simulator = None
+    wifi = None
+    if config.backend == Backend.SIMULATED:
+        if args.firmware is None:
+            raise SystemExit("--firmware is required with the simulated backend")
+        simulator = Simulator(config, Firmware.load_file(args.firmware))
+        base_url = simulator.api.url
+    else:
+        wifi = Wifi(config)
+        wifi.client_connect()
+        base_url = args.url
+
+    # no retries, every failure of the device is counted
+    api = LocalApi(config, base_url=base_url, pool_size=workload.concurrency, retries=0)
+    try:
+        report = Benchmark(api, workload).run()
+    finally:
+        api.close()
+        if wifi is not None:
+            wifi.stop()
+        if simulator is not None:
+            simulator.stop()
+
+    json.dump(report.summary(), sys.stdout, indent=2)
+    print()
+
+    return 1 if report.unresponsive_at is not None else 0
+
+
+def schedule(args: argparse.Namespace) -> int:
+    """
+    runs the test suite distributed on the fixtures of the inventory
+    """
+    fixtures = load_inventory(args.inventory)
+    items = collect(args.pytest_args)
+    history = DurationHistory(args.durations)
+    if args.results_db:
+        # the tests that never ran with the scheduler are estimated from the stored runs
+        store = ResultsStore(args.results_db)
+        try:
+            for nodeid, duration in store.latest_durations().items():
+                history.durations.setdefault(nodeid, duration)
+        finally:
+            store.close()
+    runner = PytestRunner(args.log_dir, args.pytest_args, pytest_args=args.pytest_option or [])
+
+    start = monotonic()
+    results = Scheduler(fixtures, history, runner).run(items)
+
+    for result in sorted(results, key=lambda result: result.nodeid):
+        print(f"{'PASSED' if result.passed else 'FAILED'} {result.nodeid} "
+              f"[{result.fixture or 'no fixture'}, {result.duration:.1f}s] {result.log_path or ''}")
+    print(f"{sum(result.passed for result in results)}/{len(results)} passed on {len(fixtures)} fixtures "
+          f"in {monotonic() - start:.1f}s")
+
+    return 0 if all(result.passed for result in results) else 1
+
+
+def results(args: argparse.Namespace) -> int:
+    """
+    prints a measure on the last firmware builds and the builds where it regressed
+    """
+    store = ResultsStore(args.db)
+    try:
+        query = {
+            "test": store.test_durations,
+            "operation": store.operation_times,
+            "latency": store.latencies,
+        }[args.kind]
+        points = query(args.name, builds=args.builds, fixture_id=args.fixture)
+    finally:
+        store.close()
+
+    regressed = regressions(points, args.threshold)
+    json.dump({
+        "points": [asdict(point) for point in points],
+        "regressions": [{"from": previous.firmware_version, "to": following.firmware_version,
+                         "previous": previous.mean, "following": following.mean} for previous, following in regressed],
+    }, sys.stdout, indent=2)
+    print()
+
+    return 1 if regressed else 0
+
+
+def fleet(args: argparse.Namespace) -> int:
+    """
+    runs a fleet of virtual devices against a broker, a local one if not given
+    """
+    async def run():
+        broker = None
+        host, port = args.host, args.port
+        if port is None:
+            broker = Broker(host)
+            await broker.start()
+            port = broker.port
+        responder = None
+        if broker is not None or args.answer_gets:
+            responder = GetResponder({"metricInterval": args.metric_interval})
+            await responder.start(host, port)
+        try:
+            return await Fleet(args.devices, args.connections, args.metric_interval).run(host, port, args.duration)
+        finally:
+            if responder is not None:
+                await responder.stop()
+            if broker is not None:
+                await broker.stop()
+
+    stats = asyncio.run(run())
+    json.dump(stats.summary(), sys.stdout, indent=2)
+    print()
+
+    return 0 if stats.synced == stats.devices else 1
+
+
+def broker(args: argparse.Namespace) -> int:
+    """
+    runs the local MQTT broker until interrupted
+    """
+    async def run():
+        server = Broker(args.host, args.port)
+        await server.start()
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.stop()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="fw-test", description="firmware test toolkit")
+    parser.add_argument("--config", default="config.toml", help="configuration file of the fixture")
+    parser.add_argument("--verbose", "-v", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    bench_parser = commands.add_parser("bench", help="load test of the local API of the device")
+    bench_parser.add_argument("--endpoint", action="append", choices=[endpoint.value for endpoint in Endpoint],
+                              help="endpoint to request, can be repeated (default: state)")
+    bench_parser.add_argument("--concurrency", type=int, default=1, help="parallel connections")
+    bench_parser.add_argument("--rate", type=float, help="requests per second, as fast as possible if not set")
+    bench_parser.add_argument("--duration", type=float, default=30, help="seconds")
+    bench_parser.add_argument("--timeout", type=float, default=5, help="timeout of each request in seconds")
+    bench_parser.add_argument("--firmware", help="firmware file, for the simulated backend")
+    bench_parser.add_argument("--url", default=BASE_URL, help="base URL of the local API")
+    bench_parser.set_defaults(handler=bench)
+
+    schedule_parser = commands.add_parser("schedule", help="run the tests distributed on several fixtures")
+    schedule_parser.add_argument("--inventory", default="inventory.toml", help="fixtures and their capabilities")
+    schedule_parser.add_argument("--durations", default=".fw_test_durations.json",
+                                 help="durations of the previous runs, used to start the longest tests first")
+    schedule_parser.add_argument("--log-dir", default="logs", help="directory of the output of each test")
+    schedule_parser.add_argument("--results-db", help="results store, estimates the tests missing in --durations")
+    schedule_parser.add_argument("--pytest-option", action="append", metavar="OPTION",
+                                 help="option added to the pytest run of each test on the fixtures, "
+                                      "e.g. --pytest-option=-x (repeatable)")
+    schedule_parser.add_argument("pytest_args", nargs="*", help="tests to run, as passed to pytest")
+    schedule_parser.set_defaults(handler=schedule)
+
+    results_parser = commands.add_parser("results", help="trend of a measure on the last firmware builds")
+    results_parser.add_argument("kind", choices=["test", "operation", "latency"],
+                                help="duration of a test, time spent in an operation or latency pair")
+    results_parser.add_argument("name", help="test node id, operation (e.g. pairing.ensure) or latency pair name")
+    results_parser.add_argument("--db", default="results.sqlite", help="results store")
+    results_parser.add_argument("--builds", type=int, default=50, help="number of builds")
+    results_parser.add_argument("--fixture", help="only the runs of this fixture")
+    results_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD,
+                                help="relative growth reported as regression")
+    results_parser.set_defaults(handler=results)
+
+    fleet_parser = commands.add_parser("fleet", help="load test of the cloud with virtual devices")
+    fleet_parser.add_argument("--devices", type=int, default=1000, help="number of virtual devices")
+    fleet_parser.add_argument("--connections", type=int, default=4, help="MQTT connections shared by the devices")
+    fleet_parser.add_argument("--metric-interval", type=int, default=DEFAULT_METRIC_INTERVAL,
+                              help="seconds between the reports of each device")
+    fleet_parser.add_argument("--duration", type=float, default=60, help="seconds")
+    fleet_parser.add_argument("--host", default="127.0.0.1", help="MQTT broker")
+    fleet_parser.add_argument("--port", type=int, help="port of the broker, a local broker is started if not set")
+    fleet_parser.add_argument("--answer-gets", action="store_true",
+                              help="answer the GETs of the devices, always done with the local broker")
+    fleet_parser.set_defaults(handler=fleet)
+
+    broker_parser = commands.add_parser("broker", help="local MQTT broker")
+    broker_parser.add_argument("--host", default="127.0.0.1")
+    broker_parser.add_argument("--port", type=int, default=1883)
+    broker_parser.set_defaults(handler=broker)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+from uuid import UUID, uuid4
+from logging import getLogger
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from fw_test.api import LocalApi
+from fw_test.cloud import Cloud, Action, ShadowService
+from fw_test.config import Config
+from fw_test.device import DeviceTracker, DeviceRequirement, DeviceState, Provisioning, Transition, \
+    PROVISIONING_LED, LED_STABLE_TIME
+from fw_test.io import IO
+from fw_test.trace import Tracer, TraceEvent
+from fw_test.wifi import ApConfiguration, StationStage, StationError
+
+LOGGER = getLogger(__name__)
+
+# time the device takes to ask its state to the cloud once it got an address
+PAIRING_TIMEOUT = 60
+# the station must already be connected, the check only waits for the events in flight
+STATION_CHECK_TIMEOUT = 0.5
+# estimated durations of the transitions, in seconds
+PAIR_COST = 45
+RESUME_COST = 15
+
+
+class PairingError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class PairingSession:
+    """
+    the environment the device is paired with and the state the cloud answered with
+    """
+    env_id: UUID
+    client_token: int
+    ap_config: ApConfiguration
+    state: dict
+
+
+def _pair(state: DeviceState, factory) -> Optional[DeviceState]:
+    # the provisioning API is only available on a device that is not provisioned
+    if state.provisioning != Provisioning.FACTORY:
+        return None
+    return replace(state, provisioning=Provisioning.PAIRED, dirty=False)
+
+
+def _resume(state: DeviceState, factory) -> Optional[DeviceState]:
+    if state.provisioning != Provisioning.PAIRED:
+        return None
+    return replace(state, dirty=False)
+
+
+class PairingService:
+    """
+    pairs the device with an environment and keeps it paired between the tests:
+    the pairing is checked before each test and done again only when the device lost it
+    """
+
+    def __init__(self, config: Config, io: IO, wifi, api: LocalApi, cloud: Cloud, shadow: ShadowService,
+                 device: DeviceTracker, tracer: Tracer):
+        self._config = config
+        self._io = io
+        self._wifi = wifi
+        self._api = api
+        self._cloud = cloud
+        self._shadow = shadow
+        self._device = device
+        self._ap_config: Optional[ApConfiguration] = None
+        self._state: Optional[dict] = None
+        self.session: Optional[PairingSession] = None
+
+        device.add_transition(Transition("pair", PAIR_COST, _pair), self._pair)
+        device.add_transition(Transition("resume", RESUME_COST, _resume), self._resume)
+        tracer.add_listener(self._on_event)
+
+    @property
+    def active(self) -> bool:
+        """
+        true if the device is still believed to be paired by this service
+        """
+        return self.session is not None and self._device.state.provisioning == Provisioning.PAIRED
+
+    def ensure(self, ap_config: ApConfiguration, state: dict) -> PairingSession:
+        """
+        brings the device paired with an environment, connected to the access point and with
+        the specified state from the cloud. The pairing of the previous test is reused if the
+        device still has it, otherwise the device is rebooted and given the state again, or
+        paired from scratch
+        """
+        self._ap_config = ap_config
+        self._state = state
+
+        if not self.active:
+            if self.session is not None or self._device.state.provisioning == Provisioning.PAIRED:
+                # the tracker and the service disagree, the provisioning must be found out again
+                LOGGER.info("pairing of the device not known")
+                self._device.update(provisioning=None)
+            self.session = None
+        elif self.session.ap_config != ap_config or not self._connected():
+            LOGGER.info("device not connected to the access point, pair it again")
+            self._device.update(provisioning=None)
+            self.session = None
+        elif self.session.state != state:
+            LOGGER.info("the device has another state, give it the new one")
+            self._device.update(dirty=True)
+
+        self._device.ensure(DeviceRequirement(Provisioning.PAIRED))
+        if self.session is None:
+            raise PairingError("the device is paired but the pairing was not done by this service")
+
+        return self.session
+
+    def release(self):
+        """
+        stops the access point and the answers of the shadow, the device is no more
+        considered paired by this service
+        """
+        self._shadow.release()
+        if self.session is not None:
+            LOGGER.info("release the pairing with environment %s", self.session.env_id)
+            self.session = None
+            self._wifi.stop_ap()
+
+    def _connected(self) -> bool:
+        try:
+            self._wifi.wait_for_station(self._config.mac_address, StationStage.LEASED, timeout=STATION_CHECK_TIMEOUT)
+            return True
+        except (TimeoutError, StationError) as e:
+            LOGGER.debug("station check failed: %s", e)
+            return False
+
+    def _pair(self):
+        if self._ap_config is None or self._state is None:
+            raise PairingError("no access point and state to pair the device with")
+
+        env_id = uuid4()
+        LOGGER.info("pair the device with environment %s", env_id)
+        self.session = None
+        # after a hard reset the device reboots, its API is available once it shows it is not provisioned
+        if not self._io.wait_for_led(PROVISIONING_LED[Provisioning.FACTORY], stable=LED_STABLE_TIME):
+            raise PairingError("the device is not in the factory state")
+
+        self._shadow.serve({**self._state, "envId": env_id.bytes})
+        # a GET left from a previous pairing must not be taken for the one of this pairing
+        self._cloud.flush()
+        self._wifi.client_connect()
+        response = self._api.provision(self._ap_config, env_id)
+        if response.get("status") != "success":
+            raise PairingError(f"provision failed: {response}")
+
+        self._wifi.start_ap(self._ap_config)
+        self._wifi.wait_for_station(self._config.mac_address, StationStage.LEASED)
+        self._answer(env_id)
+
+    def _resume(self):
+        if self.session is None or self._state is None:
+            raise PairingError("no pairing to resume")
+
+        LOGGER.info("reboot the device and give it the state again")
+        self._shadow.serve({**self._state, "envId": self.session.env_id.bytes})
+        self._cloud.flush()
+        self._io.reset()
+        self._wifi.wait_for_station(self._config.mac_address, StationStage.LEASED)
+        self._answer(self.session.env_id)
+
+    def _answer(self, env_id: UUID):
+        msg = self._cloud.receive(timeout=PAIRING_TIMEOUT, filter_action=Action.GET)
+        client_token = msg.state["clientToken"]
+        # the shadow answers the GET with the state
+        self._shadow.wait(lambda shadow: shadow.answered_token == client_token)
+        self.session = PairingSession(env_id, client_token, self._ap_config, self._state)
+
+    def _on_event(self, event: TraceEvent):
+        # a test that pairs the device by itself replaces the pairing of the service
+        session = self.session
+        if session is not None and event.source == "cloud.publish" and event.attributes.get("action") == "GET" \
+                and event.attributes.get("env_id") not in (None, session.env_id.hex):
+            LOGGER.info("device paired with another environment by the test")
+            self.session = None
@@ -0,0 +1,73 @@
+from enum import Enum
+
+
+class IOValue(Enum):
+    LOW = 0
+    HIGH = 1
+
+    def __int__(self):
+        return self.value
+
+
+class LedColor(Enum):
+    OFF = (0, 0, 0)
+    RED = (1, 0, 0)
+    GREEN = (0, 1, 0)
+    BLUE = (0, 0, 1)
+    YELLOW = (1, 1, 0)
+    CYAN = (0, 1, 1)
+    MAGENTA = (1, 0, 1)
+    WHITE = (1, 1, 1)
+
+
+BUTTON_DOWN_VALUE = IOValue.LOW
+BUTTON_UP_VALUE = IOValue.HIGH
+
+# press and pause between presses, the timing the tests have always used on the fixtures
+BUTTON_PRESS_TIME = 0.2
+BUTTON_RELEASE_TIME = 0.1
+
+# Pin assignment
+#                                         Pin 1 Pin2
+#                                      +3V3 [ ] [ ] +5V
+#                            SDA1 / GPIO  2 [ ] [ ] +5V
+#                            SCL1 / GPIO  3 [ ] [ ] GND
+#                           (RESET) GPIO  4 [ ] [ ] GPIO 14 / TXD0
+#                                       GND [ ] [ ] GPIO 15 / RXD0
+#                                   GPIO 17 [ ] [ ] GPIO 18
+#                          (BUZZER) GPIO 27 [ ] [ ] GND
+#                           (LED_R) GPIO 22 [ ] [ ] GPIO 23 (LED_G)
+#                                      +3V3 [ ] [ ] GPIO 24 (LED_B)
+#             (FIL_PILOTE_N) MOSI / GPIO 10 [ ] [ ] GND
+#             (FIL_PILOTE_P) MISO / GPIO  9 [ ] [ ] GPIO 25 (RELAY)
+#         (CURRENT_FEEDBACK) SCLK / GPIO 11 [ ] [ ] GPIO  8 / CE0# (BUTTON_MINUS)
+#                                       GND [ ] [ ] GPIO  7 / CE1# (BUTTON_PLUS)
+#                           ID_SD / GPIO  0 [ ] [ ] GPIO  1 / ID_SC
+#                            (BOOT) GPIO  5 [ ] [ ] GND
+#                         (RESTORE) GPIO  6 [ ] [ ] GPIO 12
+#                                   GPIO 13 [ ] [ ] GND
+#                            MISO / GPIO 19 [ ] [ ] GPIO 16 / CE2#
+#                           (TRIAC) GPIO 26 [ ] [ ] GPIO 20 / MOSI
+#                                       GND [ ] [ ] GPIO 21 / SCLK
+#                                       Pin 39 Pin 40
+class IOPin(Enum):
+    # outputs
+    RESET = 4
+    BOOT = 5
+    RESTORE = 6
+    BUTTON_PLUS = 7
+    BUTTON_MINUS = 8
+    FIL_PILOTE_P = 9
+    FIL_PILOTE_N = 10
+    CURRENT_FEEDBACK = 11
+
+    # inputs
+    LED_R = 22
+    LED_G = 23
+    LED_B = 24
+    RELAY = 25
+    TRIAC = 26
+    BUZZER = 27
+
+
+INPUT_PINS = (IOPin.LED_R, IOPin.LED_G, IOPin.LED_B, IOPin.RELAY, IOPin.TRIAC, IOPin.BUZZER)
@@ -0,0 +1,174 @@
+import time
+import inspect
+import functools
+
+from time import monotonic_ns
+from logging import getLogger
+from threading import Lock, local
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from types import ModuleType
+from typing import Any, Iterator, Optional
+
+LOGGER = getLogger(__name__)
+
+NS_PER_SECOND = 1_000_000_000
+# spans listed in the report, from the slowest
+SLOWEST_SPANS = 10
+
+_sleep = time.sleep
+
+
+class SpanKind(Enum):
+    # a call to the framework (IO, Wi-Fi, cloud, jobs, local API)
+    CALL = auto()
+    # a fixed sleep of a test
+    SLEEP = auto()
+
+
+@dataclass
+class Span:
+    name: str
+    kind: SpanKind
+    start_ns: int
+    end_ns: int = 0
+    children: list["Span"] = field(default_factory=list)
+    # test that was running when the span was recorded
+    test: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_ns - self.start_ns) / NS_PER_SECOND
+
+    def walk(self) -> Iterator["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "kind": self.kind.name.lower(),
+            "start_ns": self.start_ns,
+            "duration_s": self.duration,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    def render(self, depth: int = 0) -> list[str]:
+        lines = [f"{'  ' * depth}{self.name} {self.duration * 1000:.1f}ms"]
+        for child in self.children:
+            lines.extend(child.render(depth + 1))
+
+        return lines
+
+
+def operations(spans: list[Span]) -> dict[str, dict]:
+    """
+    count, total and maximum time of the spans of each operation, nested ones included
+    """
+    result: dict[str, dict] = {}
+    for root in spans:
+        for span in root.walk():
+            operation = result.setdefault(span.name, {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            operation["count"] += 1
+            operation["total_s"] += span.duration
+            operation["max_s"] = max(operation["max_s"], span.duration)
+
+    return result
+
+
+class Profiler:
+    """
+    records the calls to the framework and the sleeps of the tests as nested spans,
+    to find out where the time of the test run goes
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._local = local()
+        # spans that were not taken by a test report yet
+        self._pending: list[Span] = []
+        self.spans: list[Span] = []
+
+    @contextmanager
+    def span(self, name: str, kind: SpanKind = SpanKind.CALL):
+        stack = self._stack()
+        span = Span(name, kind, monotonic_ns())
+        if stack:
+            stack[-1].children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.end_ns = monotonic_ns()
+            stack.pop()
+            if not stack:
+                with self._lock:
+                    self._pending.append(span)
+                    self.spans.append(span)
+
+    def sleep(self, seconds: float):
+        with self.span("sleep", SpanKind.SLEEP):
+            _sleep(seconds)
+
+    def instrument(self, target: Any, prefix: str):
+        """
+        records a span for each call to the public methods of the object. Only the
+        object is changed, the references to its methods taken before are not
+        """
+        for name, member in inspect.getmembers(type(target)):
+            if name.startswith("_") or not inspect.isfunction(member):
+                continue
+            setattr(target, name, self._wrap(getattr(target, name), f"{prefix}.{name}"))
+
+    def patch_sleep(self, module: ModuleType):
+        """
+        replaces the names bound to time.sleep in the module (from time import sleep)
+        """
+        for name, value in list(vars(module).items()):
+            if value is _sleep:
+                setattr(module, name, self.sleep)
+
+    def take(self, test: Optional[str] = None) -> list[Span]:
+        """
+        spans completed since the last call, assigned to the test
+        """
+        with self._lock:
+            spans, self._pending = self._pending, []
+        for span in spans:
+            span.test = test
+
+        return spans
+
+    def summary(self) -> dict:
+        """
+        total time of each operation, time spent in fixed sleeps versus in the framework
+        and the slowest spans
+        """
+        with self._lock:
+            roots = list(self.spans)
+
+        slowest = sorted(((root.test, span) for root in roots for span in root.walk()),
+                         key=lambda item: item[1].duration, reverse=True)[:SLOWEST_SPANS]
+
+        return {
+            # the spans nest, only the outer ones are counted
+            "sleep_s": sum(root.duration for root in roots if root.kind == SpanKind.SLEEP),
+            "wait_s": sum(root.duration for root in roots if root.kind == SpanKind.CALL),
+            "operations": dict(sorted(operations(roots).items(), key=lambda item: item[1]["total_s"], reverse=True)),
+            "slowest": [{"name": span.name, "test": test, "duration_s": span.duration} for test, span in slowest],
+        }
+
+    def _stack(self) -> list[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _wrap(self, method, name: str):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return method(*args, **kwargs)
+
+        return wrapper
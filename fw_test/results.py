@@ -0,0 +1,233 @@
+import sqlite3
+
+from time import time
+from uuid import uuid4
+from logging import getLogger
+from queue import Queue, Empty
+from threading import Thread
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Optional
+
+from fw_test.firmware import Firmware
+
+LOGGER = getLogger(__name__)
+
+# writes are committed in a single transaction every BATCH_SIZE rows or FLUSH_INTERVAL seconds
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2.0
+# relative growth of a measure between two builds reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    finished_at REAL,
+    fixture_id TEXT NOT NULL,
+    firmware_version TEXT NOT NULL,
+    firmware_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tests (
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    nodeid TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    setup_s REAL NOT NULL,
+    call_s REAL NOT NULL,
+    teardown_s REAL NOT NULL,
+    PRIMARY KEY (run_id, nodeid)
+);
+CREATE TABLE IF NOT EXISTS operations (
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    nodeid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    total_s REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS latencies (
+    run_id TEXT NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    p50_ms REAL NOT NULL,
+    p95_ms REAL NOT NULL,
+    p99_ms REAL NOT NULL,
+    max_ms REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_firmware ON runs (firmware_hash, started_at);
+CREATE INDEX IF NOT EXISTS tests_nodeid ON tests (nodeid, run_id);
+CREATE INDEX IF NOT EXISTS operations_name ON operations (name, run_id);
+CREATE INDEX IF NOT EXISTS latencies_name ON latencies (name, run_id);
+"""
+
+
+@dataclass(frozen=True)
+class TrendPoint:
+    """
+    a measure averaged on the runs of a firmware build
+    """
+    firmware_version: str
+    firmware_hash: str
+    samples: int
+    mean: float
+    # start of the last run of the build
+    last_run: float
+
+
+def regressions(points: list[TrendPoint], threshold: float = REGRESSION_THRESHOLD) -> \
+        list[tuple[TrendPoint, TrendPoint]]:
+    """
+    pairs of consecutive builds (previous, following) where the measure grew by more than
+    the threshold, the points are from the most recent as returned by the queries
+    """
+    return [(previous, following) for following, previous in zip(points, points[1:])
+            if previous.mean > 0 and (following.mean - previous.mean) / previous.mean > threshold]
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    # readers don't block the writer of a run in progress
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+
+    return connection
+
+
+class ResultsStore:
+    """
+    history of the test runs in a SQLite database. The rows are written by a background
+    thread in batches, recording a result only puts it in a queue
+    """
+
+    def __init__(self, path: str, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._queue: Queue[Optional[tuple[str, tuple]]] = Queue()
+        # the schema exists before the first query, also if nothing was written yet
+        _connect(path).close()
+        self._thread = Thread(target=self._writer, name="results-writer", daemon=True)
+        self._thread.start()
+
+    def start_run(self, fixture_id: str, firmware: Firmware) -> str:
+        run_id = uuid4().hex
+        self._put("INSERT INTO runs (id, started_at, fixture_id, firmware_version, firmware_hash) "
+                  "VALUES (?, ?, ?, ?, ?)", (run_id, time(), fixture_id, str(firmware.version), firmware.hash))
+
+        return run_id
+
+    def record_test(self, run_id: str, nodeid: str, outcome: str, phases: dict[str, float],
+                    operations: Optional[dict[str, dict]] = None):
+        """
+        records the outcome of a test, the duration of its phases and the time spent in
+        each operation (from profiler.operations)
+        """
+        self._put("INSERT OR REPLACE INTO tests (run_id, nodeid, outcome, setup_s, call_s, teardown_s) "
+                  "VALUES (?, ?, ?, ?, ?, ?)", (run_id, nodeid, outcome, phases.get("setup", 0.0),
+                                                phases.get("call", 0.0), phases.get("teardown", 0.0)))
+        for name, operation in (operations or {}).items():
+            self._put("INSERT INTO operations (run_id, nodeid, name, count, total_s) VALUES (?, ?, ?, ?, ?)",
+                      (run_id, nodeid, name, operation["count"], operation["total_s"]))
+
+    def record_latencies(self, run_id: str, summary: dict[str, dict]):
+        """
+        records the latencies measured by the tracer (Tracer.summary)
+        """
+        for name, histogram in summary.items():
+            self._put("INSERT INTO latencies (run_id, name, count, p50_ms, p95_ms, p99_ms, max_ms) "
+                      "VALUES (?, ?, ?, ?, ?, ?, ?)", (run_id, name, histogram["count"], histogram["p50_ms"],
+                                                       histogram["p95_ms"], histogram["p99_ms"], histogram["max_ms"]))
+
+    def finish_run(self, run_id: str):
+        self._put("UPDATE runs SET finished_at = ? WHERE id = ?", (time(), run_id))
+
+    def flush(self):
+        """
+        waits until the recorded results are written
+        """
+        self._queue.join()
+
+    def test_durations(self, nodeid: str, builds: int = 50, fixture_id: Optional[str] = None) -> list[TrendPoint]:
+        """
+        duration of the test on the last builds, from the most recent
+        """
+        return self._trend("SELECT {build}, COUNT(*), AVG(t.setup_s + t.call_s + t.teardown_s), MAX(r.started_at) "
+                           "FROM tests t JOIN runs r ON r.id = t.run_id "
+                           "WHERE t.nodeid = ? AND t.outcome = 'passed' {fixture} ", (nodeid,), builds, fixture_id)
+
+    def operation_times(self, name: str, builds: int = 50, fixture_id: Optional[str] = None) -> list[TrendPoint]:
+        """
+        time a test spends in an operation, e.g. pairing.ensure, on the last builds
+        """
+        return self._trend("SELECT {build}, COUNT(*), AVG(o.total_s), MAX(r.started_at) "
+                           "FROM operations o JOIN runs r ON r.id = o.run_id WHERE o.name = ? {fixture} ",
+                           (name,), builds, fixture_id)
+
+    def latencies(self, name: str, builds: int = 50, fixture_id: Optional[str] = None) -> list[TrendPoint]:
+        """
+        median latency of a stimulus/response pair on the last builds
+        """
+        return self._trend("SELECT {build}, COUNT(*), AVG(l.p50_ms), MAX(r.started_at) "
+                           "FROM latencies l JOIN runs r ON r.id = l.run_id WHERE l.name = ? {fixture} ",
+                           (name,), builds, fixture_id)
+
+    def latest_durations(self, fixture_id: Optional[str] = None) -> dict[str, float]:
+        """
+        duration of the last passed run of each test
+        """
+        query = "SELECT t.nodeid, t.setup_s + t.call_s + t.teardown_s FROM tests t JOIN runs r ON r.id = t.run_id " \
+                "WHERE t.outcome = 'passed' " + ("AND r.fixture_id = ? " if fixture_id else "") + \
+                "ORDER BY r.started_at"
+        with self._reader() as connection:
+            # the later runs overwrite the earlier ones
+            return dict(connection.execute(query, (fixture_id,) if fixture_id else ()).fetchall())
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _put(self, statement: str, parameters: tuple):
+        self._queue.put((statement, parameters))
+
+    def _trend(self, query: str, parameters: tuple, builds: int, fixture_id: Optional[str]) -> list[TrendPoint]:
+        query = query.format(build="r.firmware_version, r.firmware_hash",
+                             fixture="AND r.fixture_id = ?" if fixture_id else "")
+        query += "GROUP BY r.firmware_hash ORDER BY MAX(r.started_at) DESC LIMIT ?"
+        parameters = (*parameters, *((fixture_id,) if fixture_id else ()), builds)
+        with self._reader() as connection:
+            return [TrendPoint(*row) for row in connection.execute(query, parameters).fetchall()]
+
+    def _reader(self):
+        self.flush()
+        return closing(_connect(self._path))
+
+    def _writer(self):
+        connection = _connect(self._path)
+        stop = False
+        while not stop:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+                while True:
+                    if item is None:
+                        stop = True
+                    else:
+                        batch.append(item)
+                    if stop or len(batch) >= self._batch_size:
+                        break
+                    item = self._queue.get_nowait()
+            except Empty:
+                pass
+
+            if batch:
+                try:
+                    with connection:
+                        for statement, parameters in batch:
+                            connection.execute(statement, parameters)
+                except sqlite3.Error as e:
+                    LOGGER.error("failed to write %d results: %s", len(batch), e)
+
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+
+        connection.close()
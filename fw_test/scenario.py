@@ -0,0 +1,242 @@
+from time import monotonic
+from logging import getLogger
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Any, Callable, Optional
+
+from fw_test.context import Context
+
+LOGGER = getLogger(__name__)
+
+
+class ScenarioError(RuntimeError):
+    pass
+
+
+class StepStatus(Enum):
+    PASSED = auto()
+    FAILED = auto()
+    TIMED_OUT = auto()
+    # not run because a step failed before it could start
+    SKIPPED = auto()
+
+
+@dataclass(frozen=True)
+class Step:
+    """
+    an operation of a scenario, started once all the steps it comes after have passed
+    """
+    name: str
+    action: Callable[[Context], Any]
+    after: tuple[str, ...] = ()
+    # seconds, None to wait for the step as long as it takes
+    timeout: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class StepResult:
+    name: str
+    status: StepStatus
+    # monotonic times, from the start of the scenario
+    start: float = 0.0
+    end: float = 0.0
+    value: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+@dataclass(frozen=True)
+class ScenarioReport:
+    steps: dict[str, StepResult]
+    duration: float
+    # chain of dependent steps that determined the duration of the scenario
+    critical_path: list[str]
+
+    @property
+    def passed(self) -> bool:
+        return all(step.status == StepStatus.PASSED for step in self.steps.values())
+
+    def summary(self) -> str:
+        lines = [f"scenario {'passed' if self.passed else 'failed'} in {self.duration:.1f}s, "
+                 f"critical path {' -> '.join(self.critical_path) or 'none'}"]
+        for step in sorted(self.steps.values(), key=lambda step: step.start):
+            marker = "*" if step.name in self.critical_path else " "
+            lines.append(f"{marker} {step.name}: {step.status.name.lower()} "
+                         f"{step.start:7.2f}s -> {step.end:7.2f}s ({step.duration:.2f}s)")
+
+        return "\n".join(lines)
+
+
+def critical_path(steps: dict[str, Step], results: dict[str, StepResult]) -> list[str]:
+    """
+    from the step that ended last, goes back through the dependency that ended last each time
+    """
+    ran = [result for result in results.values() if result.status != StepStatus.SKIPPED]
+    if not ran:
+        return []
+
+    path = [max(ran, key=lambda result: result.end).name]
+    while steps[path[-1]].after:
+        path.append(max(steps[path[-1]].after, key=lambda name: results[name].end))
+
+    return path[::-1]
+
+
+def topological_order(steps: dict[str, Step]) -> list[str]:
+    """
+    order in which the steps can be run one after the other, fails if the dependencies
+    refer to unknown steps or have a cycle
+    """
+    for step in steps.values():
+        unknown = set(step.after) - steps.keys()
+        if unknown:
+            raise ScenarioError(f"step {step.name} comes after unknown steps {', '.join(sorted(unknown))}")
+
+    order = []
+    remaining = {name: set(step.after) for name, step in steps.items()}
+    while remaining:
+        ready = [name for name, after in remaining.items() if not after]
+        if not ready:
+            raise ScenarioError(f"dependency cycle between the steps {', '.join(sorted(remaining))}")
+
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for after in remaining.values():
+            after.difference_update(ready)
+
+    return order
+
+
+class Scenario:
+    """
+    steps of a test with their dependencies: the steps that don't depend on each other
+    run at the same time on a thread pool, so the scenario lasts as much as its longest
+    chain of dependent steps instead of the sum of all of them
+    """
+
+    def __init__(self, ctx: Context, max_workers: Optional[int] = None):
+        self._ctx = ctx
+        self._max_workers = max_workers
+        self._steps: dict[str, Step] = {}
+        self._started: dict[str, float] = {}
+        self._ended: dict[str, float] = {}
+        self._results: dict[str, StepResult] = {}
+        self.report: Optional[ScenarioReport] = None
+
+    def add(self, step: Step):
+        if step.name in self._steps:
+            raise ScenarioError(f"duplicated step {step.name}")
+        self._steps[step.name] = step
+
+    def step(self, name: Optional[str] = None, after: tuple[str, ...] = (), timeout: Optional[float] = None):
+        """
+        decorator that adds the function as a step, named after the function by default
+        """
+        def decorator(action: Callable[[Context], Any]) -> Callable[[Context], Any]:
+            self.add(Step(name or action.__name__, action, tuple(after), timeout))
+            return action
+
+        return decorator
+
+    def result(self, name: str) -> Any:
+        """
+        value returned by a step that passed, for the steps that come after it
+        """
+        return self._results[name].value
+
+    def run(self) -> ScenarioReport:
+        """
+        runs the steps, raises the error of the first step that failed once the
+        steps already started have completed
+        """
+        order = topological_order(self._steps)
+        self._results = {}
+        self._started.clear()
+        self._ended.clear()
+        self.report = None
+        origin = monotonic()
+
+        pool = ThreadPoolExecutor(max_workers=self._max_workers or len(self._steps) or 1,
+                                  thread_name_prefix="scenario")
+        running: dict[Future, str] = {}
+        deadlines: dict[str, float] = {}
+        failure: Optional[StepResult] = None
+        try:
+            while True:
+                if failure is None:
+                    for name in order:
+                        step = self._steps[name]
+                        # deadlines has the steps already started
+                        if name in self._results or name in deadlines:
+                            continue
+                        if all(self._passed(dependency) for dependency in step.after):
+                            LOGGER.debug("start step %s", name)
+                            running[pool.submit(self._run, step)] = name
+                            deadlines[name] = monotonic() + step.timeout if step.timeout is not None else float("inf")
+
+                if not running:
+                    break
+
+                timeout = min(deadlines[name] for name in running.values()) - monotonic()
+                done, _ = wait(running, timeout=max(0.0, timeout) if timeout != float("inf") else None,
+                               return_when=FIRST_COMPLETED)
+
+                now = monotonic()
+                for future in done:
+                    name = running.pop(future)
+                    start, end = self._started.get(name, now) - origin, self._ended.get(name, now) - origin
+                    error = future.exception()
+                    if error is None:
+                        result = StepResult(name, StepStatus.PASSED, start, end, future.result())
+                    else:
+                        result = StepResult(name, StepStatus.FAILED, start, end, error=error)
+                    self._finish(result)
+                    failure = failure or (result if error is not None else None)
+
+                for future, name in list(running.items()):
+                    if deadlines[name] <= now:
+                        # the thread can't be stopped, it is left running
+                        del running[future]
+                        timeout = self._steps[name].timeout
+                        result = StepResult(name, StepStatus.TIMED_OUT, self._started.get(name, now) - origin,
+                                            now - origin, error=TimeoutError(f"step {name} took more than {timeout}s"))
+                        self._finish(result)
+                        failure = failure or result
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        for name in order:
+            if name not in self._results:
+                self._results[name] = StepResult(name, StepStatus.SKIPPED)
+
+        self.report = ScenarioReport(
+            steps={name: self._results[name] for name in order},
+            duration=monotonic() - origin,
+            critical_path=critical_path(self._steps, self._results),
+        )
+        LOGGER.info("%s", self.report.summary())
+
+        if failure is not None:
+            raise failure.error
+
+        return self.report
+
+    def _run(self, step: Step) -> Any:
+        self._started[step.name] = monotonic()
+        try:
+            return step.action(self._ctx)
+        finally:
+            self._ended[step.name] = monotonic()
+
+    def _passed(self, name: str) -> bool:
+        result = self._results.get(name)
+        return result is not None and result.status == StepStatus.PASSED
+
+    def _finish(self, result: StepResult):
+        LOGGER.debug("step %s %s in %.2fs", result.name, result.status.name.lower(), result.duration)
+        self._results[result.name] = result
@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import shlex
+import tomllib
+import statistics
+import subprocess
+
+from time import monotonic
+from logging import getLogger
+from threading import Thread, Lock
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, Optional
+
+import pytest
+
+LOGGER = getLogger(__name__)
+
+# estimated duration of a test that never ran
+DEFAULT_DURATION = 60
+# weight of the last run in the estimated duration
+DURATION_SMOOTHING = 0.5
+
+
+@dataclass(frozen=True)
+class FixtureSpec:
+    """
+    a test fixture (a Raspberry Pi with its device) of the inventory
+    """
+    name: str
+    # configuration file of the fixture, relative to the working directory of the tests
+    config: str
+    # capabilities of the fixture, e.g. "prev_firmware" or "dual_radio"
+    tags: frozenset[str] = frozenset()
+    # the tests are run over ssh on this host, locally if not set
+    host: Optional[str] = None
+    workdir: Optional[str] = None
+
+
+def load_inventory(path: str) -> list[FixtureSpec]:
+    with open(path, "rb") as f:
+        inventory = tomllib.load(f)
+
+    return [FixtureSpec(
+        name=fixture["name"],
+        config=fixture["config"],
+        tags=frozenset(fixture.get("tags", [])),
+        host=fixture.get("host"),
+        workdir=fixture.get("workdir"),
+    ) for fixture in inventory["fixture"]]
+
+
+@dataclass(frozen=True)
+class ScheduledTest:
+    nodeid: str
+    # capabilities the fixture needs, from the requires marker
+    requires: frozenset[str] = frozenset()
+    # fixture the test must run on, from the affinity marker
+    affinity: Optional[str] = None
+
+    def runs_on(self, fixture: FixtureSpec) -> bool:
+        return self.requires <= fixture.tags and self.affinity in (None, fixture.name)
+
+
+@dataclass(frozen=True)
+class RunResult:
+    nodeid: str
+    fixture: Optional[str]
+    passed: bool
+    duration: float
+    log_path: Optional[str] = None
+
+
+class _Collector:
+    def __init__(self):
+        self.items: list[ScheduledTest] = []
+
+    def pytest_collection_modifyitems(self, items: list[pytest.Item]):
+        for item in items:
+            requires = frozenset(tag for marker in item.iter_markers("requires") for tag in marker.args)
+            affinity = item.get_closest_marker("affinity")
+            self.items.append(ScheduledTest(item.nodeid, requires, affinity.args[0] if affinity else None))
+
+
+def collect(args: list[str]) -> list[ScheduledTest]:
+    """
+    collects the tests selected by the pytest arguments, without running them
+    """
+    collector = _Collector()
+    # nothing is run, the results store is not opened
+    code = pytest.main([*args, "--collect-only", "-q", "--results-db="], plugins=[collector])
+    if code not in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED):
+        raise RuntimeError(f"test collection failed: {code!r}")
+
+    return collector.items
+
+
+class DurationHistory:
+    """
+    durations of the previous runs of each test, used to start the longest ones first
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self._path = path
+        self._lock = Lock()
+        self.durations: dict[str, float] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.durations = json.load(f)
+
+    def estimate(self, nodeid: str) -> float:
+        with self._lock:
+            if nodeid in self.durations:
+                return self.durations[nodeid]
+            return statistics.median(self.durations.values()) if self.durations else DEFAULT_DURATION
+
+    def update(self, nodeid: str, duration: float):
+        with self._lock:
+            previous = self.durations.get(nodeid)
+            self.durations[nodeid] = duration if previous is None else \
+                DURATION_SMOOTHING * duration + (1 - DURATION_SMOOTHING) * previous
+
+    def save(self):
+        if self._path is None:
+            return
+
+        with self._lock, open(self._path, "w") as f:
+            json.dump(self.durations, f, indent=2, sort_keys=True)
+
+
+def plan(items: list[ScheduledTest], fixtures: list[FixtureSpec], history: DurationHistory) -> \
+        tuple[dict[str, list[ScheduledTest]], list[ScheduledTest]]:
+    """
+    assigns the tests to the fixtures, longest first to the least loaded fixture that can
+    run them. Returns the queue of each fixture and the tests no fixture can run
+    """
+    queues: dict[str, list[ScheduledTest]] = {fixture.name: [] for fixture in fixtures}
+    load = {fixture.name: 0.0 for fixture in fixtures}
+    unschedulable = []
+    for item in sorted(items, key=lambda item: history.estimate(item.nodeid), reverse=True):
+        candidates = [fixture.name for fixture in fixtures if item.runs_on(fixture)]
+        if not candidates:
+            unschedulable.append(item)
+            continue
+
+        name = min(candidates, key=lambda name: load[name])
+        queues[name].append(item)
+        load[name] += history.estimate(item.nodeid)
+
+    return queues, unschedulable
+
+
+class Scheduler:
+    """
+    runs the tests on the fixtures in parallel. Each fixture takes the tests of its own
+    queue, from the longest; once it is empty it steals the shortest test it can run
+    from the fixture with the most remaining work. The runner takes the tests of a fixture
+    as they are scheduled and gives the outcome and the log of each one, in order
+    """
+
+    def __init__(self, fixtures: list[FixtureSpec], history: DurationHistory,
+                 runner: Callable[[FixtureSpec, Iterator[ScheduledTest]], Iterator[tuple[bool, Optional[str]]]]):
+        self._fixtures = fixtures
+        self._history = history
+        self._runner = runner
+        self._lock = Lock()
+        self._queues: dict[str, deque[ScheduledTest]] = {}
+        self.results: list[RunResult] = []
+
+    def run(self, items: list[ScheduledTest]) -> list[RunResult]:
+        queues, unschedulable = plan(items, self._fixtures, self._history)
+        self._queues = {name: deque(queue) for name, queue in queues.items()}
+        for item in unschedulable:
+            LOGGER.error("no fixture can run %s (requires %s, affinity %s)", item.nodeid, set(item.requires),
+                         item.affinity)
+            self.results.append(RunResult(item.nodeid, None, False, 0.0))
+
+        workers = [Thread(target=self._worker, args=(fixture,), daemon=True) for fixture in self._fixtures]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self._history.save()
+
+        return self.results
+
+    def _worker(self, fixture: FixtureSpec):
+        # tests given to the runner without a result yet
+        taken: deque[ScheduledTest] = deque()
+
+        def items() -> Iterator[ScheduledTest]:
+            while (item := self._next(fixture)) is not None:
+                LOGGER.info("%s: run %s", fixture.name, item.nodeid)
+                taken.append(item)
+                yield item
+
+        while True:
+            start = monotonic()
+            try:
+                for passed, log_path in self._runner(fixture, items()):
+                    now = monotonic()
+                    self._record(fixture, taken.popleft(), passed, now - start, log_path)
+                    start = now
+                return
+            except Exception as e:
+                # a new session runs the tests left
+                LOGGER.error("%s: test session failed: %s", fixture.name, e)
+                while taken:
+                    self._record(fixture, taken.popleft(), False, monotonic() - start, None)
+
+    def _record(self, fixture: FixtureSpec, item: ScheduledTest, passed: bool, duration: float,
+                log_path: Optional[str]):
+        LOGGER.info("%s: %s %s in %.1fs", fixture.name, item.nodeid, "passed" if passed else "failed", duration)
+        self._history.update(item.nodeid, duration)
+        with self._lock:
+            self.results.append(RunResult(item.nodeid, fixture.name, passed, duration, log_path))
+
+    def _next(self, fixture: FixtureSpec) -> Optional[ScheduledTest]:
+        with self._lock:
+            own = self._queues[fixture.name]
+            if own:
+                return own.popleft()
+
+            # victims with the most estimated work first
+            victims = sorted((name for name in self._queues if name != fixture.name),
+                             key=lambda name: sum(self._history.estimate(item.nodeid) for item in self._queues[name]),
+                             reverse=True)
+            for name in victims:
+                queue = self._queues[name]
+                for item in reversed(queue):
+                    if item.affinity is None and item.runs_on(fixture):
+                        queue.remove(item)
+                        LOGGER.debug("%s: steal %s from %s", fixture.name, item.nodeid, name)
+                        return item
+
+        return None
+
+
+@dataclass
+class PytestRunner:
+    """
+    runs the tests of a fixture in a single pytest session with its configuration, on the
+    local machine or over ssh, so the session fixtures are set up once. The session collects
+    the selection and runs the tests sent on its standard input, see fw_test.worker
+    """
+    log_directory: str
+    # the selection of the tests, as given to collect
+    collect_args: list[str] = field(default_factory=list)
+    pytest_args: list[str] = field(default_factory=list)
+
+    def __call__(self, fixture: FixtureSpec, items: Iterator[ScheduledTest]) -> Iterator[tuple[bool, Optional[str]]]:
+        item = next(items, None)
+        if item is None:
+            return
+
+        command = [sys.executable, "-m", "pytest", "-p", "fw_test.worker", *self.collect_args,
+                   "--config-path", fixture.config, "--capture-dir", os.path.join("captures", fixture.name),
+                   *self.pytest_args]
+        if fixture.host is not None:
+            remote = " ".join(shlex.quote(argument) for argument in ["python3", *command[1:]])
+            if fixture.workdir:
+                remote = f"cd {shlex.quote(fixture.workdir)} && {remote}"
+            command = ["ssh", "-o", "BatchMode=yes", fixture.host, remote]
+
+        directory = os.path.join(self.log_directory, fixture.name)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "session.log"), "ab") as log, \
+                subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=log, text=True,
+                                 bufsize=1, cwd=fixture.workdir if fixture.host is None else None) as process:
+            process.stdin.write(item.nodeid + "\n")
+            while item is not None:
+                # the session runs a test once it knows the next one
+                following = next(items, None)
+                if following is not None:
+                    process.stdin.write(following.nodeid + "\n")
+                else:
+                    process.stdin.close()
+
+                line = process.stdout.readline()
+                if not line:
+                    raise RuntimeError(f"pytest exited with {process.wait()} before running {item.nodeid}")
+                result = json.loads(line)
+
+                log_path = os.path.join(directory, item.nodeid.replace("/", "_").replace("::", "-") + ".log")
+                with open(log_path, "w") as test_log:
+                    test_log.write(result["log"])
+                yield result["passed"], log_path
+
+                item = following
@@ -0,0 +1,196 @@
+import os
+import errno
+import ctypes
+import ctypes.util
+
+from time import monotonic_ns, sleep
+from logging import getLogger
+from threading import Thread
+from queue import Queue
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Callable, Optional, Self
+
+from fw_test.pins import IOPin, IOValue, BUTTON_DOWN_VALUE, BUTTON_UP_VALUE
+
+LOGGER = getLogger(__name__)
+
+# priority of the player thread when real-time scheduling is allowed
+PLAYER_PRIORITY = 50
+
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+NS_PER_SECOND = 1_000_000_000
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def _load_clock_nanosleep() -> Optional[Callable]:
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        function = libc.clock_nanosleep
+    except (OSError, AttributeError, TypeError):
+        return None
+
+    function.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+    function.restype = ctypes.c_int
+
+    return function
+
+
+_clock_nanosleep = _load_clock_nanosleep()
+
+
+def sleep_until(deadline_ns: int):
+    """
+    sleeps until the specified CLOCK_MONOTONIC deadline. The deadline being absolute,
+    delays of previous steps do not accumulate on the next ones
+    """
+    if _clock_nanosleep is None:
+        remaining = deadline_ns - monotonic_ns()
+        if remaining > 0:
+            sleep(remaining / NS_PER_SECOND)
+        return
+
+    deadline = _Timespec(deadline_ns // NS_PER_SECOND, deadline_ns % NS_PER_SECOND)
+    # with an absolute deadline the call can simply be restarted when interrupted by a signal
+    while _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, ctypes.byref(deadline), None) == errno.EINTR:
+        pass
+
+
+@dataclass(frozen=True)
+class Step:
+    offset_ns: int
+    pin: IOPin
+    value: IOValue
+
+
+@dataclass(frozen=True)
+class StepResult:
+    step: Step
+    deadline_ns: int
+    actual_ns: int
+
+    @property
+    def lateness_ns(self) -> int:
+        return self.actual_ns - self.deadline_ns
+
+
+@dataclass(frozen=True)
+class SequenceResult:
+    start_ns: int
+    steps: list[StepResult]
+
+    @property
+    def max_lateness_ns(self) -> int:
+        return max((step.lateness_ns for step in self.steps), default=0)
+
+    @property
+    def mean_lateness_ns(self) -> float:
+        if not self.steps:
+            return 0.0
+
+        return sum(step.lateness_ns for step in self.steps) / len(self.steps)
+
+
+class Sequence:
+    """
+    builder of a list of timed changes of the outputs
+    """
+
+    def __init__(self):
+        self._steps: list[Step] = []
+
+    def set(self, at: float, pin: IOPin, value: IOValue) -> Self:
+        """
+        sets a pin to a value at the specified offset (in seconds) from the start
+        """
+        self._steps.append(Step(round(at * NS_PER_SECOND), pin, value))
+        return self
+
+    def press(self, pin: IOPin, at: float, duration: float) -> Self:
+        """
+        presses a button at the specified offset for the specified duration
+        """
+        return self.set(at, pin, BUTTON_DOWN_VALUE).set(at + duration, pin, BUTTON_UP_VALUE)
+
+    @classmethod
+    def presses(cls, pin: IOPin, count: int, press_time: float, release_time: float) -> Self:
+        """
+        builds a sequence of button presses
+        """
+        sequence = cls()
+        for i in range(count):
+            sequence.press(pin, i * (press_time + release_time), press_time)
+
+        return sequence
+
+    def compile(self) -> list[Step]:
+        """
+        returns the steps ordered by offset, steps with the same
+        offset are kept in the order they were added
+        """
+        return sorted(self._steps, key=lambda step: step.offset_ns)
+
+
+class SequencePlayer:
+    """
+    plays compiled sequences on a dedicated thread, that runs with real-time
+    priority when allowed, waking up at the absolute deadline of each step
+    """
+
+    def __init__(self, write: Callable[[IOPin, IOValue], None]):
+        self._write = write
+        self._queue: Queue[Optional[tuple[list[Step], Future]]] = Queue()
+        self._thread = Thread(target=self._thread_entry, daemon=True)
+        self._thread.start()
+
+    def play(self, steps: list[Step]) -> SequenceResult:
+        """
+        plays the steps and waits for the end of the sequence
+        """
+        return self.play_async(steps).result()
+
+    def play_async(self, steps: list[Step]) -> Future:
+        """
+        enqueues the steps, the returned future resolves with the SequenceResult
+        """
+        future = Future()
+        self._queue.put((steps, future))
+
+        return future
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _thread_entry(self):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(PLAYER_PRIORITY))
+        except (PermissionError, AttributeError, OSError):
+            LOGGER.debug("real-time priority not allowed for the sequence player")
+
+        while (item := self._queue.get()) is not None:
+            steps, future = item
+            try:
+                future.set_result(self._run(steps))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _run(self, steps: list[Step]) -> SequenceResult:
+        start_ns = monotonic_ns()
+        results = []
+        for step in steps:
+            deadline_ns = start_ns + step.offset_ns
+            sleep_until(deadline_ns)
+            actual_ns = monotonic_ns()
+            self._write(step.pin, step.value)
+            results.append(StepResult(step, deadline_ns, actual_ns))
+
+        result = SequenceResult(start_ns, results)
+        LOGGER.debug("played sequence of %d steps, max lateness %d us",
+                     len(steps), result.max_lateness_ns // 1000)
+
+        return result
@@ -0,0 +1,30 @@
+from time import monotonic
+from typing import Callable
+
+from fw_test.config import Config
+from fw_test.firmware import Firmware
+from fw_test.simulator.radiator import Radiator
+from fw_test.simulator.gpio import SimulatedGpio
+from fw_test.simulator.console import SimulatedConsole
+from fw_test.simulator.api import SimulatedApi
+from fw_test.simulator.wifi import SimulatedWifi
+
+
+class Simulator:
+    """
+    virtual radiator with the interfaces the fixture uses to talk with the device
+    """
+
+    def __init__(self, config: Config, firmware: Firmware, clock: Callable[[], float] = monotonic):
+        self.radiator = Radiator(config, firmware.version, clock=clock)
+        self.gpio = SimulatedGpio(self.radiator)
+        self.console = SimulatedConsole(self.radiator)
+        self.api = SimulatedApi(self.radiator)
+        self.wifi = SimulatedWifi(self.radiator)
+
+        self.console.start()
+        self.api.start()
+
+    def stop(self):
+        self.api.stop()
+        self.console.stop()
@@ -0,0 +1,111 @@
+import json
+
+from logging import getLogger
+from threading import Thread
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from fw_test.firmware import FW_VERSION_RE, FirmwareVersion
+from fw_test.simulator.radiator import Radiator
+
+LOGGER = getLogger(__name__)
+
+# networks that the virtual radiator always sees around itself
+NEIGHBOUR_NETWORKS = [
+    {"ssid": "NEIGHBOUR-1", "rssi": -78, "security": "wpa"},
+    {"ssid": "NEIGHBOUR-2", "rssi": -85, "security": "none"},
+]
+
+
+class SimulatedApi:
+    """
+    stand-in for the local HTTP API of the radiator
+    """
+
+    def __init__(self, radiator: Radiator, host: str = "127.0.0.1"):
+        handler = type("Handler", (_Handler,), {"radiator": radiator})
+        self._server = ThreadingHTTPServer((host, 0), handler)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+        host, port = self._server.server_address[:2]
+        self.url = f"http://{host}:{port}"
+
+    def start(self):
+        LOGGER.debug("simulated local API on %s", self.url)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    radiator: Radiator
+
+    def do_GET(self):
+        if not self.radiator.running:
+            return self._unreachable()
+
+        match self.path:
+            case "/irsap/state":
+                firmware = self.radiator.firmware
+                provisioning = self.radiator.provisioning
+                self._reply(200, {
+                    "system": {
+                        "fwVer": f"{firmware.major}.{firmware.minor}-{firmware.commit}",
+                    },
+                    "wifi": {
+                        "ssid": provisioning.ssid if provisioning else "",
+                        "connected": self.radiator.online,
+                    },
+                })
+            case "/irsap/wifi/scan":
+                networks = list(NEIGHBOUR_NETWORKS)
+                if self.radiator.ap is not None:
+                    networks.insert(0, {"ssid": self.radiator.ap.ssid, "rssi": -40, "security": "wpa"})
+                self._reply(200, networks)
+            case _:
+                self._reply(404, {"status": "error"})
+
+    def do_POST(self):
+        if not self.radiator.running:
+            return self._unreachable()
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        match self.path:
+            case "/irsap/provision":
+                payload = json.loads(body)
+                accepted = self.radiator.provision(
+                    ssid=payload["ssid"],
+                    security=payload["security"],
+                    passphrase=payload["passphrase"],
+                    env_id=payload["envId"],
+                )
+                self._reply(200, {"status": "success" if accepted else "error"})
+            case "/gainspan/system/fwuploc":
+                # the multipart envelope is not parsed, it is enough to find the version marker
+                version = FW_VERSION_RE.search(body)
+                if version is None:
+                    return self._reply(400, {"status": "error"})
+
+                major, minor, commit = version.groups()
+                self._reply(200, {"status": "success"})
+                self.radiator.firmware_update(FirmwareVersion(int(major), int(minor), commit.decode("ascii")))
+            case _:
+                self._reply(404, {"status": "error"})
+
+    def log_message(self, format, *args):
+        LOGGER.debug("simulated API: " + format, *args)
+
+    def _reply(self, status: int, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _unreachable(self):
+        # the device is rebooting, drop the connection as the real one would do
+        self.close_connection = True
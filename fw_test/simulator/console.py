@@ -0,0 +1,62 @@
+import os
+import tty
+import select
+
+from logging import getLogger
+from threading import Thread, Event, Lock
+
+from fw_test.simulator.radiator import Radiator
+
+LOGGER = getLogger(__name__)
+POLL_INTERVAL = 0.1
+
+
+class SimulatedConsole:
+    """
+    debug serial console of the virtual radiator, exposed as a pseudo terminal
+    that can be opened as a regular serial port
+    """
+
+    def __init__(self, radiator: Radiator):
+        self._radiator = radiator
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self._write_lock = Lock()
+        self._stop = Event()
+        self._thread = Thread(target=self._thread_entry, daemon=True)
+
+        self.port = os.ttyname(self._slave)
+
+    def start(self):
+        LOGGER.debug("simulated console on %s", self.port)
+        self._radiator.attach_console(self.write_line)
+        self._thread.start()
+
+    def stop(self):
+        self._radiator.attach_console(lambda line: None)
+        self._stop.set()
+        self._thread.join()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def write_line(self, line: str):
+        """
+        prints a line on the console as the firmware would do
+        """
+        with self._write_lock:
+            os.write(self._master, line.encode("latin-1") + b"\r\n")
+
+    def _thread_entry(self):
+        buffer = b""
+        while not self._stop.is_set():
+            readable, _, _ = select.select([self._master], [], [], POLL_INTERVAL)
+            if not readable:
+                continue
+
+            buffer += os.read(self._master, 1024)
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                line = line.decode("latin-1").strip()
+                if line:
+                    for reply in self._radiator.command(line):
+                        self.write_line(reply)
@@ -0,0 +1,301 @@
+import asyncio
+
+from array import array
+from heapq import heapify, heappop, heappush
+from time import monotonic, time
+from logging import getLogger
+from dataclasses import dataclass
+from typing import Optional
+
+from fw_test.cloud.broker import MqttClient
+from fw_test.cloud.serializer import Layout, layout
+from fw_test.cloud.state import PacketType, PACKET_HEADER, PACKET_CONNECTION, PACKET_STATE_DESIRED_V1, \
+    PACKET_STATE_DESIRED_V2, PACKET_STATE_REPORTED_V2, SYSTEM_STATUS_WORKING
+
+LOGGER = getLogger(__name__)
+
+DEFAULT_METRIC_INTERVAL = 20
+DEFAULT_SET_POINT = 120
+ROOM_TEMPERATURE = 100
+# devices are subscribed with one SUBSCRIBE packet for this many devices
+SUBSCRIBE_BATCH = 500
+# frames written before giving the event loop the chance to read the incoming ones
+WRITE_BATCH = 1000
+
+HEADER = layout(PACKET_HEADER)
+CONNECTION = layout(PACKET_CONNECTION)
+# the fields the devices read are at the same offsets in the V1 and V2 desired states
+DESIRED = layout(PACKET_STATE_DESIRED_V1)
+REPORTED = layout(PACKET_STATE_REPORTED_V2)
+
+TOPIC_PREFIX = b"re/things/"
+# locally administered addresses, the last four bytes are the index of the device
+MAC_PREFIX = "02:00"
+_MAC_PREFIX_BYTES = bytes.fromhex(MAC_PREFIX.replace(":", ""))
+_MAC_LENGTH = 17
+_INDEX_START = len(TOPIC_PREFIX) + len(MAC_PREFIX) + 1
+_INDEX_LENGTH = _MAC_LENGTH - len(MAC_PREFIX) - 1
+_BASE_LENGTH = len(TOPIC_PREFIX) + _MAC_LENGTH + len(b"/shadow")
+_ACTION_START = _BASE_LENGTH + 1
+
+
+def mac_address(index: int) -> str:
+    return MAC_PREFIX + "".join(f":{byte:02x}" for byte in index.to_bytes(4, "big"))
+
+
+def topic_base(mac: str) -> bytes:
+    return TOPIC_PREFIX + mac.encode() + b"/shadow"
+
+
+def _template(structure_layout: Layout, packet_type: PacketType) -> bytearray:
+    buffer = bytearray(structure_layout.size)
+    structure_layout.write(buffer, "type", packet_type.value)
+    structure_layout.write(buffer, "length", structure_layout.size)
+    return buffer
+
+
+class FleetState:
+    """
+    state of the virtual devices, one array for each field indexed by the device
+    instead of an object for each device
+    """
+
+    def __init__(self, size: int, metric_interval: int):
+        self.size = size
+        self.version = array("I", bytes(4 * size))
+        self.client_token = array("I", bytes(4 * size))
+        self.set_point = array("B", [DEFAULT_SET_POINT]) * size
+        self.metric_interval = array("H", [metric_interval]) * size
+        self.temperature = array("h", [ROOM_TEMPERATURE]) * size
+        # the device got the answer to its GET
+        self.synced = bytearray(size)
+        self.env_ids = bytearray(16 * size)
+        # topic base of each device, one after the other
+        self.topics = b"".join(topic_base(mac_address(index)) for index in range(size))
+
+    def topic_base(self, index: int) -> bytes:
+        return self.topics[_BASE_LENGTH * index:_BASE_LENGTH * (index + 1)]
+
+    def env_id(self, index: int) -> bytes:
+        return bytes(self.env_ids[16 * index:16 * index + 16])
+
+
+@dataclass
+class FleetStats:
+    devices: int = 0
+    sent: int = 0
+    received: int = 0
+    # devices that got the answer to the GET and desired updates applied
+    synced: int = 0
+    desired_updates: int = 0
+    duration: float = 0.0
+
+    @property
+    def frames_per_second(self) -> float:
+        return (self.sent + self.received) / self.duration if self.duration else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "devices": self.devices,
+            "sent": self.sent,
+            "received": self.received,
+            "synced": self.synced,
+            "desired_updates": self.desired_updates,
+            "duration_s": self.duration,
+            "frames_per_second": self.frames_per_second,
+        }
+
+
+class Fleet:
+    """
+    virtual devices speaking the binary shadow protocol of the firmware, multiplexed on a
+    few MQTT connections. Each device sends the connection packet and the GET, applies
+    the desired states and reports its state after each of them and every metricInterval
+    """
+
+    def __init__(self, devices: int, connections: int = 4, metric_interval: int = DEFAULT_METRIC_INTERVAL,
+                 firmware_version: tuple[int, int] = (1, 0)):
+        self.state = FleetState(devices, metric_interval)
+        self.stats = FleetStats(devices=devices)
+        self._connections = connections
+        self._clients: list[MqttClient] = []
+        self._reported = _template(REPORTED, PacketType.STATE_REPORTED_V2)
+        REPORTED.write(self._reported, "firmwareVersion", bytes(firmware_version))
+        REPORTED.write(self._reported, "connected", 1)
+        REPORTED.write(self._reported, "systemStatus", SYSTEM_STATUS_WORKING)
+        self._get = _template(HEADER, PacketType.HEADER)
+        self._connection = _template(CONNECTION, PacketType.CONNECTION)
+        CONNECTION.write(self._connection, "connected", 1)
+        # metric reports due, as (time, device)
+        self._schedule: list[tuple[float, int]] = []
+        self._token = 0
+
+    async def run(self, host: str, port: int, duration: float) -> FleetStats:
+        """
+        connects the fleet to the broker and runs it for the duration in seconds
+        """
+        start = monotonic()
+        self._clients = [MqttClient(f"fleet-{number}", self._on_message) for number in range(self._connections)]
+        await asyncio.gather(*(client.connect(host, port) for client in self._clients))
+        try:
+            await self._subscribe()
+            await self._start(start)
+            await self._report(start + duration)
+        finally:
+            await asyncio.gather(*(client.disconnect() for client in self._clients))
+
+        self.stats.duration = monotonic() - start
+        LOGGER.info("fleet of %d devices: %s", self.state.size, self.stats.summary())
+
+        return self.stats
+
+    async def _subscribe(self):
+        for first in range(0, self.state.size, SUBSCRIBE_BATCH):
+            requests = {}
+            for index in range(first, min(first + SUBSCRIBE_BATCH, self.state.size)):
+                base = self.state.topic_base(index)
+                requests.setdefault(index % self._connections, []).extend(
+                    (base + b"/get/+", base + b"/desired-update/accepted"))
+            await asyncio.gather(*(self._clients[number].subscribe(filters) for number, filters in requests.items()))
+
+    async def _start(self, start: float):
+        now = int(time())
+        for index in range(self.state.size):
+            base = self.state.topic_base(index)
+            CONNECTION.write(self._connection, "timestamp", now)
+            self._publish(index, base + b"/reported-update", self._connection)
+            self._send_get(index, base)
+            await self._yield(index)
+
+        # the reports are spread on the first interval, as devices switched on at different times
+        self._schedule = [(start + self.state.metric_interval[index] * (1 + index / self.state.size), index)
+                          for index in range(self.state.size)]
+        heapify(self._schedule)
+
+    async def _report(self, deadline: float):
+        sent = 0
+        while True:
+            now = monotonic()
+            if now >= deadline:
+                return
+            while self._schedule and self._schedule[0][0] <= now:
+                due, index = heappop(self._schedule)
+                if self.state.synced[index]:
+                    self._send_reported(index)
+                else:
+                    # no answer to the GET yet, the firmware asks again
+                    self._send_get(index, self.state.topic_base(index))
+                heappush(self._schedule, (due + self.state.metric_interval[index], index))
+                sent += 1
+                await self._yield(sent)
+
+            following = self._schedule[0][0] if self._schedule else deadline
+            await asyncio.sleep(max(0.0, min(following, deadline) - monotonic()))
+
+    async def _yield(self, count: int):
+        if count % WRITE_BATCH == WRITE_BATCH - 1:
+            for client in self._clients:
+                await client.drain()
+            await asyncio.sleep(0)
+
+    def _on_message(self, topic: bytes, payload: bytes):
+        self.stats.received += 1
+        try:
+            index = int(topic[_INDEX_START:_INDEX_START + _INDEX_LENGTH].replace(b":", b""), 16)
+        except ValueError:
+            LOGGER.warning("message on unexpected topic %s", topic)
+            return
+        if index >= self.state.size:
+            return
+        action = topic[_ACTION_START:]
+
+        if action == b"get/accepted" or action == b"get/rejected":
+            # rejected when there is no shadow yet, the device reports its own state
+            if action == b"get/accepted":
+                self._apply(index, payload)
+            if not self.state.synced[index]:
+                self.state.synced[index] = 1
+                self.stats.synced += 1
+        elif action == b"desired-update/accepted":
+            if not self._apply(index, payload):
+                return
+            self.stats.desired_updates += 1
+        else:
+            return
+
+        self._send_reported(index)
+
+    def _apply(self, index: int, payload: bytes) -> bool:
+        """
+        applies a desired state, unless older than the one of the device
+        """
+        if len(payload) < DESIRED.size or \
+                HEADER.read(payload, "type") not in (PacketType.STATE_DESIRED_V1.value,
+                                                     PacketType.STATE_DESIRED_V2.value):
+            LOGGER.warning("invalid desired state for device %d", index)
+            return False
+        version = DESIRED.read(payload, "version")
+        if version < self.state.version[index]:
+            return False
+
+        state = self.state
+        state.version[index] = version
+        state.set_point[index] = DESIRED.read(payload, "manualSetPoint")
+        state.metric_interval[index] = DESIRED.read(payload, "metricInterval") or DEFAULT_METRIC_INTERVAL
+        state.env_ids[16 * index:16 * index + 16] = DESIRED.read(payload, "envId")
+
+        return True
+
+    def _send_get(self, index: int, base: bytes):
+        self._token = self._token % 0xFFFFFFFF + 1
+        self.state.client_token[index] = self._token
+        HEADER.write(self._get, "clientToken", self._token)
+        HEADER.write(self._get, "timestamp", int(time()))
+        self._publish(index, base + b"/get", self._get)
+
+    def _send_reported(self, index: int):
+        state = self.state
+        buffer = self._reported
+        REPORTED.write(buffer, "clientToken", state.client_token[index])
+        REPORTED.write(buffer, "timestamp", int(time()))
+        REPORTED.write(buffer, "version", state.version[index])
+        REPORTED.write(buffer, "manualSetPoint", state.set_point[index])
+        REPORTED.write(buffer, "currentSetPoint", state.set_point[index])
+        REPORTED.write(buffer, "metricInterval", state.metric_interval[index])
+        REPORTED.write(buffer, "temperature", state.temperature[index])
+        REPORTED.write(buffer, "envId", state.env_id(index))
+        REPORTED.write(buffer, "macAddress", _MAC_PREFIX_BYTES + index.to_bytes(4, "big"))
+        self._publish(index, state.topic_base(index) + b"/reported-update", buffer)
+
+    def _publish(self, index: int, topic: bytes, payload: bytearray):
+        # the payload is copied in the packet, the buffer is reused by the next frame
+        self._clients[index % self._connections].publish(topic, bytes(payload))
+        self.stats.sent += 1
+
+
+class GetResponder:
+    """
+    answers the GETs of the fleet with a desired state, as the cloud does for paired devices
+    """
+
+    def __init__(self, desired: Optional[dict] = None):
+        desired_layout = layout(PACKET_STATE_DESIRED_V2)
+        self._payload = _template(desired_layout, PacketType.STATE_DESIRED_V2)
+        for key, value in {"metricInterval": DEFAULT_METRIC_INTERVAL, "manualSetPoint": DEFAULT_SET_POINT,
+                           **(desired or {})}.items():
+            desired_layout.write(self._payload, key, value)
+        self.client = MqttClient("fleet-responder", self._on_get)
+        self.answered = 0
+
+    async def start(self, host: str, port: int):
+        await self.client.connect(host, port)
+        await self.client.subscribe([TOPIC_PREFIX + b"+/shadow/get"])
+
+    async def stop(self):
+        await self.client.disconnect()
+
+    def _on_get(self, topic: bytes, payload: bytes):
+        HEADER.write(self._payload, "clientToken", HEADER.read(payload, "clientToken"))
+        HEADER.write(self._payload, "timestamp", int(time()))
+        self.client.publish(topic + b"/accepted", bytes(self._payload))
+        self.answered += 1
@@ -0,0 +1,64 @@
+from logging import getLogger
+from threading import Thread, Event
+from typing import Callable
+
+from fw_test.gpio import GpioMode
+from fw_test.io import IOPin, IOValue
+from fw_test.simulator.radiator import Radiator
+from fw_test.simulator.waveform import SimulatedWaveformPlayer
+
+LOGGER = getLogger(__name__)
+
+# the outputs of the radiator also change with time (e.g. the keyboard
+# timeout), so edges are detected by sampling them
+EDGE_POLL_INTERVAL = 0.005
+
+
+class SimulatedGpio:
+    """
+    GPIO backend whose pins are wired to the virtual radiator
+    """
+
+    def __init__(self, radiator: Radiator):
+        self._radiator = radiator
+        self._modes: dict[int, GpioMode] = {}
+        self._callbacks: dict[int, Callable[[int, int], None]] = {}
+        self._levels: dict[int, int] = {}
+        self._stop = Event()
+        self._poller = Thread(target=self._poll_entry, daemon=True)
+
+    def setup(self, pin: int, mode: GpioMode):
+        self._modes[pin] = mode
+
+    def input(self, pin: int) -> int:
+        return self._radiator.read(IOPin(pin)).value
+
+    def output(self, pin: int, value: int):
+        if self._modes.get(pin) != GpioMode.OUTPUT:
+            raise RuntimeError("pin is not configured as an output", pin)
+
+        self._radiator.write(IOPin(pin), IOValue(value))
+
+    def add_edge_callback(self, pin: int, callback: Callable[[int, int], None]):
+        self._levels[pin] = self.input(pin)
+        self._callbacks[pin] = callback
+        if not self._poller.is_alive():
+            self._poller.start()
+
+    def create_waveform_player(self) -> SimulatedWaveformPlayer:
+        return SimulatedWaveformPlayer(self._radiator)
+
+    def cleanup(self):
+        self._stop.set()
+        if self._poller.is_alive():
+            self._poller.join()
+        self._modes.clear()
+        self._callbacks.clear()
+
+    def _poll_entry(self):
+        while not self._stop.wait(EDGE_POLL_INTERVAL):
+            for pin, callback in list(self._callbacks.items()):
+                value = self.input(pin)
+                if self._levels[pin] != value:
+                    self._levels[pin] = value
+                    callback(pin, value)
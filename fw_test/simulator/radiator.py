@@ -0,0 +1,359 @@
+from time import monotonic
+from logging import getLogger
+from threading import RLock
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from fw_test.config import Config
+from fw_test.firmware import FirmwareVersion
+from fw_test.pins import IOPin, IOValue, LedColor, BUTTON_DOWN_VALUE
+from fw_test.sequence import NS_PER_SECOND
+from fw_test.waveform import Waveform, FilPiloteMode
+from fw_test.wifi import ApConfiguration
+
+LOGGER = getLogger(__name__)
+
+# time the firmware takes to boot, the LED is off in the meantime
+BOOT_TIME = 0.5
+
+# button presses shorter than this are ignored by the firmware
+DEBOUNCE_TIME = 0.03
+
+# holding both buttons for this time arms the factory reset,
+# that is confirmed by a press of the plus button
+HARD_RESET_HOLD_TIME = 5
+HARD_RESET_CONFIRM_TIME = 3
+
+# holding minus for this time toggles the standby
+STANDBY_HOLD_TIME = 5
+
+# after this time from the last press the keyboard LED turns off
+KEYBOARD_TIMEOUT = 4.5
+
+# set point values are in tenths of degree
+DEFAULT_SET_POINT = 120
+SET_POINT_STEP = 5
+SET_POINT_MIN = 50
+SET_POINT_MAX = 300
+
+# the room temperature never changes in the virtual radiator
+ROOM_TEMPERATURE = 100
+
+# set points imposed by the pilot wire
+ECO_SET_POINT_OFFSET = 35
+FROST_SET_POINT = 70
+
+
+@dataclass(frozen=True)
+class Provisioning:
+    ssid: str
+    security: str
+    passphrase: str
+    env_id: str
+
+
+class Radiator:
+    """
+    deterministic model of the electric radiator, reacts to the pins
+    driven by the fixture and computes the value of the pins read by
+    the fixture as the real firmware would do
+    """
+
+    def __init__(self, config: Config, firmware: FirmwareVersion, clock: Callable[[], float] = monotonic):
+        self._config = config
+        self._clock = clock
+        self._lock = RLock()
+        self._console: Callable[[str], None] = lambda line: None
+
+        self.factory_firmware = firmware
+        self.firmware = firmware
+        self.provisioning: Optional[Provisioning] = None
+        self.ap: Optional[ApConfiguration] = None
+        self.set_point = DEFAULT_SET_POINT
+        self.standby = False
+
+        self._outputs = {pin: IOValue.HIGH for pin in IOPin}
+        self._pressed_at: dict[IOPin, float] = {}
+        self._chord_since: Optional[float] = None
+        self._chord = False
+        self._reset_armed_until = 0.0
+        self._keyboard_until = 0.0
+        self._running = True
+        self._boot_time = self._clock() - BOOT_TIME
+        self._boots = 0
+        self._presses = 0
+        # playing waveforms with the time of the radiator clock they started at
+        self._waveforms: dict[frozenset[IOPin], tuple[Waveform, float]] = {}
+
+    def attach_console(self, write: Callable[[str], None]):
+        """
+        sets the function used to print lines on the debug console
+        """
+        self._console = write
+
+    @property
+    def running(self) -> bool:
+        with self._lock:
+            return self._running and self._clock() - self._boot_time >= BOOT_TIME
+
+    @property
+    def online(self) -> bool:
+        """
+        true if the radiator is connected to the network it was provisioned with
+        """
+        with self._lock:
+            return self.running \
+                and self.provisioning is not None \
+                and self.ap is not None \
+                and self.ap.ssid == self.provisioning.ssid \
+                and self.ap.passphrase == self.provisioning.passphrase
+
+    @property
+    def fil_pilote_mode(self) -> FilPiloteMode:
+        """
+        mode requested on the pilot wire, decoded from the half-waves that are present
+        """
+        with self._lock:
+            positive = negative = False
+            for waveform, _ in self._waveforms.values():
+                for step in waveform.steps:
+                    if step.value == IOValue.HIGH:
+                        positive |= step.pin == IOPin.FIL_PILOTE_P
+                        negative |= step.pin == IOPin.FIL_PILOTE_N
+
+            match positive, negative:
+                case True, True:
+                    return FilPiloteMode.ECO
+                case True, False:
+                    return FilPiloteMode.OFF
+                case False, True:
+                    return FilPiloteMode.FROST
+                case _:
+                    return FilPiloteMode.COMFORT
+
+    @property
+    def effective_set_point(self) -> int:
+        with self._lock:
+            match self.fil_pilote_mode:
+                case FilPiloteMode.ECO:
+                    return self.set_point - ECO_SET_POINT_OFFSET
+                case FilPiloteMode.FROST:
+                    return FROST_SET_POINT
+                case _:
+                    return self.set_point
+
+    @property
+    def heating(self) -> bool:
+        with self._lock:
+            return self.running \
+                and not self.standby \
+                and self.fil_pilote_mode != FilPiloteMode.OFF \
+                and self.effective_set_point > ROOM_TEMPERATURE
+
+    def led_color(self) -> LedColor:
+        with self._lock:
+            now = self._clock()
+            if not self.running:
+                return LedColor.OFF
+            if self.standby:
+                return LedColor.MAGENTA
+            if now < self._keyboard_until:
+                return LedColor.RED if self.heating else LedColor.CYAN
+            if self.provisioning is None:
+                return LedColor.RED
+            if not self.online:
+                return LedColor.YELLOW
+
+            return LedColor.OFF
+
+    def read(self, pin: IOPin) -> IOValue:
+        """
+        value of an output of the radiator, that is an input of the fixture
+        """
+        with self._lock:
+            r, g, b = self.led_color().value
+            values = {
+                IOPin.LED_R: r,
+                IOPin.LED_G: g,
+                IOPin.LED_B: b,
+                IOPin.RELAY: int(self.heating),
+                IOPin.TRIAC: 0,
+                IOPin.BUZZER: 0,
+            }
+            if pin in values:
+                return IOValue(values[pin])
+
+            for pins, (waveform, start) in self._waveforms.items():
+                if pin in pins:
+                    return waveform.level(pin, round((self._clock() - start) * NS_PER_SECOND))
+
+            return self._outputs[pin]
+
+    def write(self, pin: IOPin, value: IOValue):
+        """
+        the fixture changed the value of one of the radiator inputs
+        """
+        with self._lock:
+            previous = self._outputs[pin]
+            self._outputs[pin] = value
+            if previous == value:
+                return
+
+            if pin == IOPin.RESET:
+                if value == IOValue.LOW:
+                    self._running = False
+                else:
+                    self._boot(restore=self._outputs[IOPin.RESTORE] == IOValue.HIGH)
+            elif pin in (IOPin.BUTTON_PLUS, IOPin.BUTTON_MINUS):
+                if value == BUTTON_DOWN_VALUE:
+                    self._button_down(pin)
+                else:
+                    self._button_up(pin)
+
+    def set_waveform(self, waveform: Waveform):
+        """
+        the fixture started a periodic signal on some of the radiator inputs
+        """
+        with self._lock:
+            self.clear_waveforms(waveform.pins)
+            self._waveforms[waveform.pins] = (waveform, self._clock())
+            if waveform.pins & {IOPin.FIL_PILOTE_P, IOPin.FIL_PILOTE_N}:
+                self._log(f"fil pilote {self.fil_pilote_mode.name}")
+            if IOPin.CURRENT_FEEDBACK in waveform.pins:
+                self._log(f"current feedback {'on' if waveform.steps else 'off'}")
+
+    def clear_waveforms(self, pins: frozenset[IOPin]):
+        with self._lock:
+            for playing in list(self._waveforms):
+                if playing & pins:
+                    del self._waveforms[playing]
+
+    def provision(self, ssid: str, security: str, passphrase: str, env_id: str) -> bool:
+        with self._lock:
+            if not self.running or self.provisioning is not None:
+                return False
+
+            self.provisioning = Provisioning(ssid, security, passphrase, env_id)
+            self._log(f"provisioned on {ssid}")
+
+            return True
+
+    def set_ap(self, ap: Optional[ApConfiguration]):
+        """
+        called when the access point of the fixture is started or stopped
+        """
+        with self._lock:
+            was_online = self.online
+            self.ap = ap
+            if self.online != was_online:
+                self._log("wifi connected" if self.online else "wifi disconnected")
+
+    def firmware_update(self, version: FirmwareVersion):
+        with self._lock:
+            self._log(f"firmware update to {version}")
+            self.firmware = version
+            self._boot(restore=False)
+
+    def factory_reset(self):
+        with self._lock:
+            self._log("factory reset")
+            self.provisioning = None
+            self.set_point = DEFAULT_SET_POINT
+            self.standby = False
+            self._keyboard_until = 0.0
+
+    def command(self, line: str) -> list[str]:
+        """
+        executes a command received on the debug console
+        """
+        with self._lock:
+            match line.split():
+                case ["version"]:
+                    return [f"version {self.firmware}"]
+                case ["state"]:
+                    return [
+                        f"led {self.led_color().name}",
+                        f"setpoint {self.set_point}",
+                        f"standby {int(self.standby)}",
+                        f"heating {int(self.heating)}",
+                        f"filpilote {self.fil_pilote_mode.name}",
+                        f"provisioned {int(self.provisioning is not None)}",
+                        f"online {int(self.online)}",
+                    ]
+                case ["counters"]:
+                    return [f"counters boots={self._boots} presses={self._presses}"]
+                case ["reboot"]:
+                    self._boot(restore=False)
+                    return []
+                case _:
+                    return [f"unknown command: {line}"]
+
+    def _boot(self, restore: bool):
+        if restore:
+            self.firmware = self.factory_firmware
+
+        self._running = True
+        self._boot_time = self._clock()
+        self._boots += 1
+        self.standby = False
+        self._keyboard_until = 0.0
+        self._pressed_at.clear()
+        self._chord = False
+        self._reset_armed_until = 0.0
+
+        self._log("boot" + (" (restore)" if restore else ""))
+        self._log(f"$$FIRMWARE_VERSION={self.firmware.major}.{self.firmware.minor}-{self.firmware.commit}#")
+
+    def _button_down(self, pin: IOPin):
+        now = self._clock()
+        self._pressed_at[pin] = now
+        if len(self._pressed_at) == 2:
+            self._chord = True
+            self._chord_since = now
+
+    def _button_up(self, pin: IOPin):
+        now = self._clock()
+        pressed_at = self._pressed_at.pop(pin, None)
+        if pressed_at is None or not self.running:
+            return
+
+        if self._chord:
+            if self._chord_since is not None and now - self._chord_since >= HARD_RESET_HOLD_TIME:
+                self._log("factory reset armed")
+                self._reset_armed_until = now + HARD_RESET_CONFIRM_TIME
+            self._chord_since = None
+            if not self._pressed_at:
+                self._chord = False
+            return
+
+        duration = now - pressed_at
+        if duration < DEBOUNCE_TIME:
+            return
+
+        self._presses += 1
+
+        if pin == IOPin.BUTTON_PLUS and now < self._reset_armed_until:
+            self._reset_armed_until = 0.0
+            self.factory_reset()
+            return
+
+        if pin == IOPin.BUTTON_MINUS and duration >= STANDBY_HOLD_TIME:
+            self.standby = not self.standby
+            self._keyboard_until = 0.0
+            self._log(f"standby {int(self.standby)}")
+            return
+
+        if self.standby:
+            return
+
+        # the first press only wakes up the keyboard
+        if now < self._keyboard_until:
+            step = SET_POINT_STEP if pin == IOPin.BUTTON_PLUS else -SET_POINT_STEP
+            self.set_point = max(SET_POINT_MIN, min(SET_POINT_MAX, self.set_point + step))
+            self._log(f"set point {self.set_point}")
+
+        self._keyboard_until = now + KEYBOARD_TIMEOUT
+
+    def _log(self, line: str):
+        LOGGER.debug("simulator: %s", line)
+        self._console(line)
@@ -0,0 +1,22 @@
+from fw_test.pins import IOPin
+from fw_test.waveform import Waveform
+from fw_test.simulator.radiator import Radiator
+
+
+class SimulatedWaveformPlayer:
+    """
+    hands the waveforms to the virtual radiator, that computes the level of
+    the pins from the time elapsed since the start, instead of toggling them
+    """
+
+    def __init__(self, radiator: Radiator):
+        self._radiator = radiator
+
+    def start(self, waveform: Waveform):
+        self._radiator.set_waveform(waveform)
+
+    def stop_pins(self, pins: frozenset[IOPin]):
+        self._radiator.clear_waveforms(pins)
+
+    def stop(self):
+        self._radiator.clear_waveforms(frozenset(IOPin))
@@ -0,0 +1,123 @@
+import socket
+
+from time import monotonic, sleep
+from logging import getLogger
+from typing import Optional
+
+from fw_test.wifi import ApConfiguration, StationStage, StationEvent, StationError
+from fw_test.wifi.station import STATION_TIMEOUT, normalize_mac
+from fw_test.wifi.impairment import Impairment, Timeline, TimelinePlayer
+from fw_test.wifi.dns import DnsTable
+from fw_test.simulator.radiator import Radiator
+
+LOGGER = getLogger(__name__)
+
+
+class SimulatedWifi:
+    """
+    Wi-Fi of the fixture when the device is simulated, the access point
+    only exists for the virtual radiator
+    """
+
+    def __init__(self, radiator: Radiator):
+        self._radiator = radiator
+        self._timeline: Optional[TimelinePlayer] = None
+        self.impairment: Optional[Impairment] = None
+        # the virtual radiator doesn't resolve names, the table is kept for the tests that set it
+        self.dns = DnsTable()
+
+    def client_connect(self):
+        """
+        connect to the device AP interface
+        """
+        LOGGER.info("connecting to the simulated device")
+
+    def client_disconnect(self):
+        """
+        disconnects from the device AP interface
+        """
+        LOGGER.info("disconnecting from the simulated device")
+
+    def start_ap(self, ap_config: ApConfiguration):
+        """
+        starts the host AP interface with the specified configuration
+        """
+        LOGGER.info("start simulated AP with configuration %s", ap_config)
+        self._radiator.set_ap(ap_config)
+
+    def stop_ap(self):
+        """
+        stops the host AP interface
+        """
+        LOGGER.debug("stop simulated AP")
+        self._radiator.set_ap(None)
+        self.clear_impairments()
+
+    def impair(self, impairment: Optional[Impairment]):
+        """
+        the simulated device has no network traffic, the impairment is only recorded
+        """
+        LOGGER.info("simulated impairment: %s", impairment.name if impairment else "none")
+        self.impairment = impairment
+
+    def start_timeline(self, timeline: Timeline):
+        self.stop_timeline()
+        self._timeline = TimelinePlayer(self.impair, timeline)
+
+    def stop_timeline(self):
+        if self._timeline is not None:
+            self._timeline.stop()
+            self._timeline = None
+
+    def clear_impairments(self):
+        self.stop_timeline()
+        self.impair(None)
+
+    def wait_for_station(self, mac: str, stage: StationStage, timeout: float = STATION_TIMEOUT) -> StationEvent:
+        """
+        waits until the virtual radiator reaches a stage of the connection to the AP,
+        it goes through all of them at once when it connects
+        """
+        deadline = monotonic() + timeout
+        while True:
+            ap = self._radiator.ap
+            provisioning = self._radiator.provisioning
+            if ap is not None and provisioning is not None and self._radiator.running \
+                    and ap.ssid == provisioning.ssid and ap.passphrase != provisioning.passphrase:
+                raise StationError(f"station {normalize_mac(mac)} rejected: wrong passphrase")
+
+            current = StationStage.LEASED if self._radiator.online else StationStage.DISCONNECTED
+            if current == stage or (stage != StationStage.DISCONNECTED and current > stage):
+                return StationEvent(monotonic(), normalize_mac(mac), current)
+
+            if monotonic() > deadline:
+                raise TimeoutError(f"station {normalize_mac(mac)} did not reach {stage.name}, "
+                                   f"last stage {current.name}")
+            sleep(0.01)
+
+    @property
+    def address(self) -> str:
+        return "127.0.0.1"
+
+    def listen(self, port: int) -> socket.socket:
+        """
+        the virtual radiator is in the same process, any free port works
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind((self.address, 0))
+        sock.listen()
+
+        return sock
+
+    def dns_latencies(self) -> dict[str, dict]:
+        return {}
+
+    def clear_capture(self):
+        pass
+
+    def dump_capture(self, path: str) -> Optional[str]:
+        # there is no traffic to capture
+        return None
+
+    def stop(self):
+        self.clear_impairments()
@@ -0,0 +1,65 @@
+import socket
+import hashlib
+
+import pytest
+import requests
+
+from fw_test.artifacts import ArtifactServer
+from fw_test.firmware import Firmware, FirmwareVersion
+
+BINARY = bytes(range(256)) * 64
+FIRMWARE = Firmware(FirmwareVersion(1, 2, "abc"), BINARY, hashlib.sha256(BINARY).hexdigest())
+
+
+@pytest.fixture
+def server():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    server = ArtifactServer(sock)
+    server.publish("/bucket/fw.bin", FIRMWARE)
+    yield server, f"http://127.0.0.1:{sock.getsockname()[1]}/bucket/fw.bin"
+    server.stop()
+
+
+def test_full_download(server):
+    server, url = server
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == BINARY
+    assert response.headers["Accept-Ranges"] == "bytes"
+
+    transfer, = server.transfers
+    assert transfer.status == 200 and transfer.complete and transfer.sent == len(BINARY)
+
+
+def test_range(server):
+    server, url = server
+    response = requests.get(url, headers={"Range": "bytes=1000-"})
+    assert response.status_code == 206
+    assert response.content == BINARY[1000:]
+    assert response.headers["Content-Range"] == f"bytes 1000-{len(BINARY) - 1}/{len(BINARY)}"
+
+    response = requests.get(url, headers={"Range": "bytes=-10"})
+    assert response.content == BINARY[-10:]
+
+    assert requests.get(url, headers={"Range": f"bytes={len(BINARY)}-"}).status_code == 416
+    # an invalid range is ignored
+    response = requests.get(url, headers={"Range": "bytes=5-3"})
+    assert response.status_code == 200 and response.content == BINARY
+    assert server.transfers[0].range == (1000, len(BINARY) - 1)
+
+
+def test_conditional(server):
+    server, url = server
+    etag = requests.head(url).headers["ETag"]
+    assert requests.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    # the range is ignored if the file changed
+    response = requests.get(url, headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert response.status_code == 200
+    assert response.content == BINARY
+
+
+def test_not_found(server):
+    server, url = server
+    assert requests.get(url + ".old").status_code == 404
@@ -0,0 +1,48 @@
+import pytest
+
+from fw_test import bench
+from fw_test.api import LocalApi
+from fw_test.bench import Benchmark, Workload, Endpoint, Outcome
+from fw_test.firmware import Firmware
+from fw_test.io import IOPin, IOValue
+from fw_test.simulator import Simulator
+from fw_test.tests.test_simulator import CONFIG
+
+
+@pytest.fixture
+def simulator(tmp_path):
+    firmware = tmp_path / "fw.bin"
+    firmware.write_bytes(b"\0" * 64 + b"$$FIRMWARE_VERSION=1.2-abcdef#")
+    simulator = Simulator(CONFIG, Firmware.load_file(str(firmware)))
+    yield simulator
+    simulator.stop()
+
+
+def test_rate(simulator):
+    api = LocalApi(CONFIG, base_url=simulator.api.url, pool_size=2, retries=0)
+    workload = Workload(endpoints=(Endpoint.STATE, Endpoint.SCAN), concurrency=2, rate=50, duration=0.5)
+    report = Benchmark(api, workload).run()
+    api.close()
+
+    summary = report.summary()
+    assert report.unresponsive_at is None
+    # requests are started at 0, 20ms, ..., 480ms and alternate between the endpoints
+    assert summary["endpoints"]["state"]["requests"] == 13
+    assert summary["endpoints"]["scan"]["requests"] == 12
+    assert summary["endpoints"]["state"]["error_rate"] == 0
+    assert "p99_ms" in summary["endpoints"]["state"]["latency"]
+
+
+def test_unresponsive(simulator, monkeypatch):
+    monkeypatch.setattr(bench, "UNRESPONSIVE_TIMEOUT", 0.2)
+    # the device drops the connections while it is held in reset
+    simulator.radiator.write(IOPin.RESET, IOValue.LOW)
+
+    api = LocalApi(CONFIG, base_url=simulator.api.url, retries=0)
+    report = Benchmark(api, Workload(duration=10)).run()
+    api.close()
+
+    assert report.unresponsive_at is not None
+    assert report.duration < 5
+    result = report.results[Endpoint.STATE]
+    assert result.outcomes[Outcome.RESET] == result.count
@@ -0,0 +1,66 @@
+import asyncio
+
+from fw_test.cloud.broker import Broker, MqttClient, SubscriptionTree, encode_length, publish_packet, \
+    split_packets, parse_publish
+
+
+def test_split_packets():
+    payload = b"x" * 300
+    buffer = bytearray(publish_packet(b"re/things/a/shadow/get", payload, 1, 7) + publish_packet(b"t", b""))
+    # an incomplete packet stays in the buffer
+    tail = publish_packet(b"t", b"tail")
+    buffer += tail[:3]
+
+    packets = split_packets(buffer)
+    assert [packet_type for packet_type, _, _ in packets] == [3, 3]
+    assert parse_publish(*packets[0][1:]) == (b"re/things/a/shadow/get", payload, 1, 7)
+    assert buffer == tail[:3]
+    assert encode_length(300) == b"\xac\x02"
+    assert encode_length(2_097_152) == b"\x80\x80\x80\x01"
+
+
+def test_subscription_tree():
+    tree = SubscriptionTree()
+    tree.add(b"re/things/+/shadow/get", "responder", 0)
+    tree.add(b"re/things/a/shadow/#", "device", 1)
+    tree.add(b"re/#", "logger", 0)
+
+    assert tree.match(b"re/things/a/shadow/get") == {"responder": 0, "device": 1, "logger": 0}
+    assert tree.match(b"re/things/b/shadow/get") == {"responder": 0, "logger": 0}
+    assert tree.match(b"re/things/a/shadow") == {"device": 1, "logger": 0}
+    assert tree.match(b"other") == {}
+
+    tree.remove(b"re/#", "logger")
+    assert tree.match(b"re/things/b/shadow/get") == {"responder": 0}
+
+    tree.add(b"#", "everything", 0)
+    tree.add(b"$aws/things/+/jobs/#", "jobs", 1)
+    assert tree.match(b"$aws/things/a/jobs/notify-next") == {"jobs": 1}
+
+
+def test_publish_subscribe():
+    async def scenario():
+        broker = Broker()
+        await broker.start()
+        received = []
+        subscriber = MqttClient("subscriber", lambda topic, payload: received.append((topic, payload)))
+        publisher = MqttClient("publisher")
+        await subscriber.connect("127.0.0.1", broker.port)
+        await publisher.connect("127.0.0.1", broker.port)
+        try:
+            assert await subscriber.subscribe([b"re/things/+/shadow/get", b"jobs/#"], qos=1) == b"\x01\x01"
+            await publisher.publish_acked(b"re/things/a/shadow/get", b"\x01\x02")
+            publisher.publish(b"re/things/a/shadow/reported-update", b"ignored")
+            publisher.publish(b"jobs/a/notify", b"job")
+            await publisher.publish_acked(b"jobs/a/notify", b"last")
+            await asyncio.sleep(0.05)
+        finally:
+            await publisher.disconnect()
+            await subscriber.disconnect()
+            await broker.stop()
+
+        assert received == [(b"re/things/a/shadow/get", b"\x01\x02"), (b"jobs/a/notify", b"job"),
+                            (b"jobs/a/notify", b"last")]
+        assert broker.stats.received == 4
+
+    asyncio.run(scenario())
@@ -0,0 +1,45 @@
+import socket
+import struct
+
+from fw_test.wifi.capture import PacketRing, CapturedPacket, write_pcap, PCAP_HEADER, PCAP_RECORD, PCAP_MAGIC_NS, \
+    LINKTYPE_ETHERNET, SO_TIMESTAMPNS, _timestamp_ns
+
+
+def test_ring_discards_oldest():
+    ring = PacketRing(max_bytes=250)
+    for i in range(5):
+        ring.add(CapturedPacket(i, bytes([i]) * 100))
+
+    packets = ring.snapshot()
+    assert [packet.timestamp_ns for packet in packets] == [3, 4]
+    assert ring.size == 200
+    assert ring.discarded == 3
+
+    ring.clear()
+    assert ring.snapshot() == [] and ring.size == 0
+
+
+def test_pcap_and_index(tmp_path):
+    packets = [CapturedPacket(1_700_000_000_123_456_789, b"a" * 60),
+               CapturedPacket(1_700_000_001_000_000_000, b"b" * 80)]
+    path = tmp_path / "capture.pcap"
+    index = write_pcap(str(path), packets, clock_offset_ns=1_700_000_000_000_000_000)
+
+    data = path.read_bytes()
+    magic, major, minor, _, _, _, linktype = PCAP_HEADER.unpack_from(data)
+    assert (magic, major, minor, linktype) == (PCAP_MAGIC_NS, 2, 4, LINKTYPE_ETHERNET)
+
+    assert [entry["offset"] for entry in index] == [PCAP_HEADER.size, PCAP_HEADER.size + PCAP_RECORD.size + 60]
+    assert index[0]["monotonic_ns"] == 123_456_789
+
+    seconds, nanoseconds, captured, length = PCAP_RECORD.unpack_from(data, index[1]["offset"])
+    assert (seconds, nanoseconds, captured, length) == (1_700_000_001, 0, 80, 80)
+    assert data[index[1]["offset"] + PCAP_RECORD.size:] == b"b" * 80
+
+
+def test_kernel_timestamp():
+    # the option gives two native longs, whatever their size on the platform
+    value = struct.pack("@ll", 1_700_000_000, 123_456_789)
+    assert _timestamp_ns([(socket.SOL_SOCKET, SO_TIMESTAMPNS, value)]) == 1_700_000_000_123_456_789
+    # without the timestamp the time of reception is used
+    assert _timestamp_ns([]) > 1_700_000_000_000_000_000
@@ -0,0 +1,82 @@
+import random
+
+from time import time
+
+import pytest
+
+from fw_test.cloud import ChangeFeed, Message, Action
+from fw_test.cloud.changes import changed_fields
+from fw_test.cloud.serializer import layout
+from fw_test.cloud.state import PacketType, PACKET_HEADER, PACKET_STATE_REPORTED_V1, PACKET_STATE_REPORTED_V2, \
+    SYSTEM_STATUS_WORKING, SYSTEM_STATUS_HEATING
+
+REPORTED = layout(PACKET_STATE_REPORTED_V2)
+DEVICE = "02:00:00:00:00:01"
+LAST = list(REPORTED.fields)[-1]
+
+
+def frame(packet_type: PacketType = PacketType.STATE_REPORTED_V2, **fields) -> bytes:
+    structure_layout = layout(PACKET_STATE_REPORTED_V2 if packet_type == PacketType.STATE_REPORTED_V2
+                              else PACKET_STATE_REPORTED_V1)
+    buffer = bytearray(structure_layout.size)
+    structure_layout.write(buffer, "type", packet_type.value)
+    structure_layout.write(buffer, "macAddress", bytes.fromhex(DEVICE.replace(":", "")))
+    for key, value in {"systemStatus": SYSTEM_STATUS_WORKING, **fields}.items():
+        structure_layout.write(buffer, key, value)
+    return bytes(buffer)
+
+
+def test_changed_fields():
+    previous = frame(temperature=200)
+    # the header is not compared, the last field is
+    current = frame(clientToken=7, version=2, systemConfiguration=1, temperature=201, ledStatus=0x01000000,
+                    **{LAST: bytes(REPORTED.fields[LAST].codec.size - 1) + b"\1"})
+    assert [field.name for field in changed_fields(REPORTED, previous, current)] == \
+        ["systemConfiguration", "ledStatus", "temperature", LAST]
+    assert changed_fields(REPORTED, current, current) == []
+
+    # same result as decoding the whole frames
+    body = [key for key in REPORTED.fields if key not in PACKET_HEADER]
+    rng = random.Random(1)
+    for _ in range(50):
+        previous = bytes(rng.getrandbits(8) for _ in range(REPORTED.size))
+        current = bytearray(previous)
+        for position in rng.sample(range(REPORTED.size), rng.randint(1, 10)):
+            current[position] ^= 1 << rng.randint(0, 7)
+        old, new = REPORTED.unpack(previous), REPORTED.unpack(current)
+        assert [field.name for field in changed_fields(REPORTED, previous, current)] == \
+            [key for key in body if old[key] != new[key]]
+
+
+def test_feed():
+    feed = ChangeFeed()
+    heating = []
+    feed.add_listener(heating.append, fields=["heatingStatus"])
+    start = time()
+
+    # the first frame of a device has nothing to compare with
+    message = Message(Action.REPORTED_UPDATE, None, None, frame())
+    feed.on_message(message)
+    assert feed.value(DEVICE, "systemStatus") == SYSTEM_STATUS_WORKING
+    # the state of the message is decoded only when it is used
+    assert "state" not in vars(message) and message.packet_type == PacketType.STATE_REPORTED_V2.value
+    assert message.state["systemStatus"] == SYSTEM_STATUS_WORKING and "state" in vars(message)
+
+    changes = feed.update(DEVICE, frame(heatingStatus=1, systemStatus=SYSTEM_STATUS_WORKING | SYSTEM_STATUS_HEATING,
+                                        timestamp=100))
+    assert [(change.field, change.old, change.new) for change in changes] == \
+        [("systemStatus", SYSTEM_STATUS_WORKING, SYSTEM_STATUS_WORKING | SYSTEM_STATUS_HEATING),
+         ("heatingStatus", 0, 1)]
+    assert changes[0].rose(SYSTEM_STATUS_HEATING) and not changes[0].rose(SYSTEM_STATUS_WORKING)
+    assert [change.new for change in heating] == [1]
+    assert feed.wait(lambda change: change.field == "heatingStatus" and change.new == 1, since=start) is changes[1]
+
+    changes = feed.update(DEVICE, frame(heatingStatus=1))
+    assert len(changes) == 1 and changes[0].fell(SYSTEM_STATUS_HEATING)
+    with pytest.raises(TimeoutError):
+        feed.wait(lambda change: change.field == "heatingStatus" and change.new == 0, since=start, timeout=0.1)
+
+    # the V1 state after a downgrade starts again
+    assert feed.update(DEVICE, frame(PacketType.STATE_REPORTED_V1)) == []
+    with pytest.raises(ValueError):
+        feed.update(DEVICE, bytes(15))
@@ -0,0 +1,47 @@
+import pytest
+
+from fw_test.console import Console
+
+
+def test_pipelined_commands():
+    written = []
+    console = Console(written.append)
+
+    version = console.command("version", r"^version (\S+)")
+    counters = console.command("counters", r"^counters boots=(\d+)")
+    assert written == [b"version\n", b"counters\n"]
+
+    # replies are matched by pattern, not by order
+    console.handle_line("boot")
+    console.handle_line("counters boots=3 presses=0")
+    console.handle_line("version v1.2-abcdef")
+
+    assert counters.result(timeout=0).match.group(1) == "3"
+    assert version.result(timeout=0).match.group(1) == "v1.2-abcdef"
+    assert version.result().lines == ["boot", "counters boots=3 presses=0", "version v1.2-abcdef"]
+
+    # lines that are not replies are still readable
+    assert console.readline(timeout=0) == "boot"
+    with pytest.raises(TimeoutError):
+        console.readline(timeout=0)
+
+
+def test_expired_command():
+    console = Console(lambda data: None)
+
+    # the device sends nothing, the command fails anyway
+    future = console.command("state", r"^led", timeout=0.05)
+    with pytest.raises(TimeoutError, match="no reply"):
+        future.result(timeout=1)
+    console.handle_line("led red")
+    assert console.readline(timeout=0) == "led red"
+
+
+def test_command_from_callback():
+    written = []
+    console = Console(written.append)
+
+    # the callbacks run out of the lock, they can send other commands
+    console.command("version", r"^version").add_done_callback(lambda future: console.command("counters", r"^counters"))
+    console.handle_line("version v1.2-abcdef")
+    assert written == [b"version\n", b"counters\n"]
@@ -0,0 +1,62 @@
+import pytest
+
+from fw_test.device import DeviceTracker, DeviceState, DeviceRequirement, DeviceStateError, Provisioning, plan
+from fw_test.firmware import Firmware, FirmwareVersion
+from fw_test.io import IO, IOPin, BUTTON_UP_VALUE
+from fw_test.simulator import Simulator
+from fw_test.trace import Tracer
+from fw_test.tests.test_simulator import CONFIG, VERSION
+
+PREVIOUS = FirmwareVersion(1, 1, "012345")
+
+
+def names(path):
+    return [transition.name for transition in path]
+
+
+def boots(tracer):
+    return sum("$$FIRMWARE_VERSION" in event.attributes["line"]
+               for event in tracer.events() if event.source == "serial")
+
+
+def test_plan():
+    factory = DeviceState(VERSION, Provisioning.FACTORY, dirty=False)
+    assert names(plan(factory, DeviceRequirement(), VERSION)) == []
+    # a reboot is enough to clear the runtime state
+    assert names(plan(DeviceState(VERSION, Provisioning.FACTORY), DeviceRequirement(), VERSION)) == ["reset"]
+    assert names(plan(DeviceState(PREVIOUS, Provisioning.FACTORY), DeviceRequirement(), VERSION)) == \
+        ["restore_firmware"]
+    assert names(plan(DeviceState(), DeviceRequirement(), VERSION)) == ["restore_firmware", "hard_reset"]
+
+    with pytest.raises(DeviceStateError):
+        plan(factory, DeviceRequirement(Provisioning.PAIRED), VERSION)
+
+
+def test_tracker(tmp_path):
+    firmware = tmp_path / "fw.bin"
+    firmware.write_bytes(b"\0" * 64 + b"$$FIRMWARE_VERSION=1.2-abcdef#" + b"\0" * 64)
+
+    simulator = Simulator(CONFIG, Firmware.load_file(str(firmware)))
+    tracer = Tracer()
+    io = IO(CONFIG, gpio=simulator.gpio, serial_port=simulator.console.port, tracer=tracer)
+    device = DeviceTracker(io, tracer, VERSION)
+    try:
+        # the firmware is unknown, the LED tells the device is not provisioned
+        device.ensure()
+        assert device.state == DeviceState(VERSION, Provisioning.FACTORY, dirty=False)
+        # the simulator also prints the milestone of its first boot
+        booted = boots(tracer)
+
+        # nothing to do
+        device.ensure()
+        assert boots(tracer) == booted
+
+        # the inputs were used, the device is rebooted
+        io.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
+        assert device.state.dirty
+        device.ensure()
+        assert boots(tracer) == booted + 1
+        assert not device.state.dirty
+    finally:
+        io.stop()
+        simulator.stop()
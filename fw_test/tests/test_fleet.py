@@ -0,0 +1,54 @@
+import asyncio
+
+from fw_test.cloud.broker import Broker, MqttClient
+from fw_test.cloud.serializer import layout
+from fw_test.cloud.state import PacketType, PACKET_STATE_DESIRED_V2, from_binary
+from fw_test.simulator.fleet import Fleet, GetResponder, mac_address, topic_base
+
+DEVICES = 50
+DESIRED = layout(PACKET_STATE_DESIRED_V2)
+
+
+def test_fleet_lifecycle():
+    async def scenario():
+        broker = Broker()
+        await broker.start()
+        responder = GetResponder({"version": 3, "manualSetPoint": 150, "envId": b"e" * 16})
+        await responder.start("127.0.0.1", broker.port)
+        reports = []
+        cloud = MqttClient("cloud", lambda topic, payload: reports.append((topic, from_binary(payload))))
+        await cloud.connect("127.0.0.1", broker.port)
+        await cloud.subscribe([b"re/things/+/shadow/reported-update"])
+
+        fleet = Fleet(DEVICES, connections=3, metric_interval=1)
+        run = asyncio.create_task(fleet.run("127.0.0.1", broker.port, 2.2))
+        await asyncio.sleep(0.5)
+        # a desired update of the cloud reaches only its device
+        desired = bytearray(DESIRED.size)
+        for key, value in {"type": PacketType.STATE_DESIRED_V2.value, "version": 4, "manualSetPoint": 200,
+                           "metricInterval": 1}.items():
+            DESIRED.write(desired, key, value)
+        cloud.publish(topic_base(mac_address(7)) + b"/desired-update/accepted", bytes(desired))
+        stats = await run
+
+        await cloud.disconnect()
+        await responder.stop()
+        await broker.stop()
+
+        return fleet, stats, reports
+
+    fleet, stats, reports = asyncio.run(scenario())
+
+    assert stats.synced == DEVICES
+    assert stats.desired_updates == 1
+    assert fleet.state.version[7] == 4 and fleet.state.set_point[7] == 200
+    assert fleet.state.version[8] == 3 and fleet.state.env_id(8) == b"e" * 16
+
+    connections = [state for _, state in reports if state["type"] == PacketType.CONNECTION.value]
+    reported = [(topic, state) for topic, state in reports if state["type"] == PacketType.STATE_REPORTED_V2.value]
+    assert len(connections) == DEVICES
+    # the answer to the GET and at least one metric report for each device
+    assert len(reported) >= 2 * DEVICES
+    last = [state for topic, state in reported if topic == topic_base(mac_address(7)) + b"/reported-update"][-1]
+    assert last["manualSetPoint"] == 200 and last["version"] == 4
+    assert last["macAddress"] == bytes.fromhex("020000000007")
@@ -0,0 +1,33 @@
+from time import sleep
+
+from fw_test.wifi.impairment import Impairment, PROFILES, TimelinePlayer, compile_impairment, flap, \
+    _compile_impairment
+
+
+def test_compile_impairment():
+    slow = Impairment("test", loss_percent=5, delay_ms=100, jitter_ms=20, rate_kbit=256)
+    assert slow.netem_arguments() == "delay 100ms 20ms loss 5% rate 256kbit"
+
+    firewall, qdisc = compile_impairment(slow, None, "wlan0", "eth0")
+    assert qdisc == {"op": "qdisc", "ifname": "wlan0", "netem": slow.netem_arguments(), "previous": None}
+    assert "-A POSTROUTING -o eth0 -j MASQUERADE" in firewall["rules"]
+
+    # only the firewall changes between profiles without netem
+    operations = compile_impairment(PROFILES["mqtt-blocked"], PROFILES["dns-down"], "wlan0", "eth0")
+    assert [operation["op"] for operation in operations] == ["firewall"]
+    assert "-A FORWARD -i wlan0 -p tcp --dport 8883 -j DROP" in operations[0]["rules"]
+    assert "--dport 53" not in operations[0]["rules"]
+
+    # profiles are compiled once, the cached operations can't be changed by the callers
+    firewall["rules"] = ""
+    assert compile_impairment(slow, None, "wlan0", "eth0")[0]["rules"] != ""
+    assert _compile_impairment(slow, None, "wlan0", "eth0") is _compile_impairment(slow, None, "wlan0", "eth0")
+
+
+def test_flap():
+    applied = []
+    player = TimelinePlayer(applied.append, flap(period=0.1, down_time=0.05))
+    sleep(0.22)
+    player.stop()
+
+    assert applied[:4] == [PROFILES["offline"], None, PROFILES["offline"], None]
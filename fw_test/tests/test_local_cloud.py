@@ -0,0 +1,123 @@
+import json
+import socket
+import hashlib
+import dataclasses
+
+from queue import Queue
+
+import pytest
+import requests
+
+from botocore.exceptions import ClientError
+
+from fw_test.artifacts import ArtifactServer
+from fw_test.cloud import Cloud, Message, Action, Response, JobState
+from fw_test.cloud.cloud import OTA_HOST
+from fw_test.cloud.local import LocalCloud
+from fw_test.config import CloudBackend
+from fw_test.firmware import Firmware, FirmwareVersion
+from fw_test.simulator.radiator import Radiator
+from fw_test.simulator.wifi import SimulatedWifi
+from fw_test.tests.test_simulator import CONFIG, VERSION
+
+LOCAL_CONFIG = dataclasses.replace(CONFIG, aws_iot_client_id="fw_test", ota_bucket="bucket", cloud=CloudBackend.LOCAL)
+BINARY = bytes(range(256)) * 16
+FIRMWARE = Firmware(FirmwareVersion(1, 3, "abcdef"), BINARY, hashlib.sha256(BINARY).hexdigest())
+JOBS = f"$aws/things/{CONFIG.mac_address}/jobs"
+
+
+def listen() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+def device_listen() -> socket.socket:
+    """
+    listening socket bound to an interface other than the loopback, as the ones of
+    Wifi.listen are bound to the AP interface: connections over the loopback are refused
+    """
+    ifname = next((name for _, name in socket.if_nameindex() if name != "lo"), None)
+    if ifname is None:
+        pytest.skip("no network interface other than the loopback")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, ifname.encode())
+    except OSError as e:
+        sock.close()
+        pytest.skip(f"can't bind a socket to {ifname}: {e}")
+    sock.bind(("0.0.0.0", 0))
+    sock.listen()
+
+    return sock
+
+
+@pytest.fixture(params=["simulated", "device"])
+def local(request):
+    artifacts_sock = listen()
+    artifacts = ArtifactServer(artifacts_sock)
+    # the broker socket comes from the fixture network, as in Context
+    if request.param == "simulated":
+        broker_sock = SimulatedWifi(Radiator(CONFIG, VERSION)).listen(LOCAL_CONFIG.cloud_local_port)
+    else:
+        broker_sock = device_listen()
+    local = LocalCloud(LOCAL_CONFIG, broker_sock, artifacts)
+    cloud = Cloud(LOCAL_CONFIG, local=local)
+    messages = Queue()
+    # the device side, on the topics the firmware uses
+    device = local.mqtt("device")
+    device.subscribe(f"{JOBS}/#", lambda topic, payload: messages.put((topic, json.loads(payload))))
+    device.subscribe(f"re/things/{CONFIG.mac_address}/shadow/get/accepted", lambda topic, payload: messages.put(
+        (topic, payload)))
+    yield local, cloud, device, messages, "%s:%d" % artifacts_sock.getsockname()
+    device.stop()
+    cloud.stop()
+    local.stop()
+    artifacts.stop()
+
+
+def next_message(messages: Queue, topic: str):
+    while True:
+        received, payload = messages.get(timeout=5)
+        if received == topic:
+            return payload
+
+
+def test_ota(local):
+    local, cloud, device, messages, artifacts_host = local
+    job = cloud.send_ota(FIRMWARE)
+    execution = next_message(messages, f"{JOBS}/notify-next")["execution"]
+    assert execution["jobId"] == job.id and execution["status"] == "QUEUED"
+    assert cloud.job_state(job) == JobState.QUEUED
+
+    # the OTA host resolves to the artifact server
+    url = execution["jobDocument"]["files"]["url"].replace(OTA_HOST, artifacts_host)
+    assert requests.get(url).content == BINARY
+
+    device.publish(f"{JOBS}/start-next", json.dumps({"clientToken": "t1"}).encode())
+    started = next_message(messages, f"{JOBS}/start-next/accepted")
+    assert started["execution"]["status"] == "IN_PROGRESS" and started["clientToken"] == "t1"
+    assert cloud.job_state(job) == JobState.IN_PROGRESS
+
+    device.publish(f"{JOBS}/{job.id}/update", json.dumps({"status": "SUCCEEDED"}).encode())
+    assert next_message(messages, f"{JOBS}/{job.id}/update/accepted")["executionState"]["status"] == "SUCCEEDED"
+    assert "execution" not in next_message(messages, f"{JOBS}/notify-next")
+    assert cloud.job_state(job) == JobState.SUCCEEDED
+
+    # a finished execution can't change
+    device.publish(f"{JOBS}/{job.id}/update", json.dumps({"status": "FAILED"}).encode())
+    assert next_message(messages, f"{JOBS}/{job.id}/update/rejected")["code"] == "InvalidStateTransition"
+
+    cloud.job_delete(job)
+    with pytest.raises(ClientError, match="ResourceNotFoundException"):
+        cloud.job_state(job)
+
+
+def test_shadow_over_local_broker(local):
+    local, cloud, device, messages, _ = local
+    cloud.publish(Message(Action.GET, Response.ACCEPTED, {
+        "clientToken": 1, "timestamp": 0, "version": 0, "type": 0}))
+    assert len(next_message(messages, f"re/things/{CONFIG.mac_address}/shadow/get/accepted")) == 15
+
+    device.publish(f"re/things/{CONFIG.mac_address}/shadow/get", bytes(15))
+    assert cloud.receive(timeout=5).action == Action.GET
@@ -0,0 +1,51 @@
+import pytest
+
+from fw_test.wifi import netctl
+from fw_test.wifi.helper import Transaction
+from fw_test.wifi.netlink import attribute_str, attribute_u32, parse_attributes
+
+
+def test_attributes():
+    data = attribute_str(3, "wlan0") + attribute_u32(16, 6)
+    attributes = parse_attributes(data)
+
+    assert attributes[3] == b"wlan0\0"
+    assert int.from_bytes(attributes[16], "little") == 6
+
+
+class FakeRtnetlink:
+    def __init__(self):
+        self.up = set()
+        self.addresses = set()
+
+    def link_flags(self, ifname: str) -> int:
+        return int(ifname in self.up)
+
+    def link_set(self, ifname: str, up: bool):
+        if up:
+            self.up.add(ifname)
+        else:
+            self.up.discard(ifname)
+
+    def address_add(self, ifname: str, address: str):
+        if address == "invalid":
+            raise OSError("invalid address")
+        self.addresses.add((ifname, address))
+
+    def address_del(self, ifname: str, address: str):
+        self.addresses.remove((ifname, address))
+
+
+def test_transaction_rollback():
+    rtnl = FakeRtnetlink()
+
+    with pytest.raises(OSError):
+        Transaction(rtnl, None).run([
+            netctl.link_up("wlan0"),
+            netctl.address_add("wlan0", "192.168.13.1/24"),
+            netctl.address_add("wlan0", "invalid"),
+        ])
+
+    # the operations already applied are reverted
+    assert rtnl.up == set()
+    assert rtnl.addresses == set()
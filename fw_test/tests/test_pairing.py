@@ -0,0 +1,94 @@
+from queue import Queue
+from time import monotonic
+
+from fw_test.api import LocalApi
+from fw_test.cloud import Message, Action, ShadowService
+from fw_test.cloud.serializer import layout
+from fw_test.cloud.state import PacketType, PACKET_STATE_DESIRED_V2, to_binary, from_binary
+from fw_test.device import DeviceTracker, Provisioning
+from fw_test.firmware import Firmware
+from fw_test.io import IO, IOPin, BUTTON_UP_VALUE
+from fw_test.pairing import PairingService
+from fw_test.simulator import Simulator
+from fw_test.trace import Tracer
+from fw_test.tests.test_simulator import CONFIG, VERSION, AP_CONFIG
+
+DESIRED = layout(PACKET_STATE_DESIRED_V2)
+# the button and reset sequences are played this much faster, against a radiator clock that runs as much faster
+TIME_SCALE = 0.1
+STATE = {**DESIRED.unpack(bytes(DESIRED.size)), "type": PacketType.STATE_DESIRED_V2, "manualSetPoint": 120}
+
+
+class Cloud:
+    """
+    the virtual radiator has no cloud connection, it asks its state at each connection
+    """
+
+    def __init__(self, tracer: Tracer):
+        self._tracer = tracer
+        self._listeners = []
+        self.published: Queue = Queue()
+        self.gets = 0
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def flush(self):
+        pass
+
+    def receive(self, timeout=10, filter_action=None) -> Message:
+        self.gets += 1
+        state = {"clientToken": self.gets, "timestamp": 0, "version": 0, "type": PacketType.HEADER}
+        message = Message(Action.GET, None, state, to_binary(state))
+        for listener in self._listeners:
+            listener(message)
+        return message
+
+    def publish_frame(self, action, response, frame: bytes):
+        state = from_binary(frame)
+        self._tracer.stimulus("cloud.publish", action=action.name, response=response.name,
+                              env_id=state["envId"].hex())
+        self.published.put(Message(action, response, state, frame))
+
+
+def test_pairing_reused(tmp_path):
+    firmware = tmp_path / "fw.bin"
+    firmware.write_bytes(b"\0" * 64 + b"$$FIRMWARE_VERSION=1.2-abcdef#" + b"\0" * 64)
+
+    simulator = Simulator(CONFIG, Firmware.load_file(str(firmware)), clock=lambda: monotonic() / TIME_SCALE)
+    tracer = Tracer()
+    io = IO(CONFIG, gpio=simulator.gpio, serial_port=simulator.console.port, tracer=tracer, time_scale=TIME_SCALE)
+    api = LocalApi(CONFIG, base_url=simulator.api.url, tracer=tracer)
+    cloud = Cloud(tracer)
+    shadow = ShadowService(cloud)
+    device = DeviceTracker(io, tracer, VERSION)
+    pairing = PairingService(CONFIG, io, simulator.wifi, api, cloud, shadow, device, tracer)
+    try:
+        # the virtual radiator starts in the factory state, no need to reset it
+        device.update(firmware=VERSION, provisioning=Provisioning.FACTORY, dirty=False)
+        session = pairing.ensure(AP_CONFIG, STATE)
+        assert device.state.provisioning == Provisioning.PAIRED and pairing.active
+        assert cloud.published.get_nowait().state["manualSetPoint"] == 120
+
+        # the device is still paired, nothing to do
+        assert pairing.ensure(AP_CONFIG, STATE) is session
+        assert cloud.published.empty()
+
+        # the inputs were used: the device is rebooted and given the state again
+        io.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
+        resumed = pairing.ensure(AP_CONFIG, STATE)
+        assert resumed.env_id == session.env_id and resumed.client_token != session.client_token
+
+        # another state is given with the same pairing
+        resumed = pairing.ensure(AP_CONFIG, {**STATE, "manualSetPoint": 150})
+        assert resumed.env_id == session.env_id
+        assert cloud.published.qsize() == 2
+
+        # the device left the access point, it is paired from scratch
+        pairing.release()
+        assert pairing.ensure(AP_CONFIG, STATE).env_id != session.env_id
+    finally:
+        shadow.stop()
+        api.close()
+        io.stop()
+        simulator.stop()
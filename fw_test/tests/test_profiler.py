@@ -0,0 +1,47 @@
+import sys
+
+from time import sleep
+
+from fw_test.profiler import Profiler, SpanKind
+
+
+class Radio:
+    def connect(self):
+        sleep(0.01)
+        self.wait()
+
+    def wait(self):
+        sleep(0.02)
+
+    def _private(self):
+        pass
+
+
+def test_nested_spans(monkeypatch):
+    profiler = Profiler()
+    radio = Radio()
+    profiler.instrument(radio, "radio")
+    # the module sleeps through time.sleep bound to its own name, as the tests do,
+    # monkeypatch restores it at the end
+    module = sys.modules[__name__]
+    monkeypatch.setattr(module, "sleep", sleep)
+    profiler.patch_sleep(module)
+
+    radio.connect()
+    sleep(0.01)
+
+    spans = profiler.take("test")
+    assert [span.name for span in spans] == ["radio.connect", "sleep"]
+    assert [child.name for child in spans[0].children] == ["sleep", "radio.wait"]
+    assert spans[1].kind == SpanKind.SLEEP and spans[1].test == "test"
+    assert spans[0].render()[2].startswith("  radio.wait")
+    assert profiler.take() == []
+
+    summary = profiler.summary()
+    assert summary["operations"]["radio.connect"]["count"] == 1
+    assert summary["operations"]["radio.wait"]["total_s"] >= 0.02
+    assert summary["sleep_s"] >= 0.01
+    assert summary["wait_s"] >= 0.03
+    assert summary["slowest"][0] == {"name": "radio.connect", "test": "test",
+                                     "duration_s": spans[0].duration}
+    assert "_private" not in vars(radio)
@@ -0,0 +1,55 @@
+from time import monotonic
+
+from fw_test.firmware import Firmware, FirmwareVersion
+from fw_test.results import ResultsStore, regressions
+
+OTA = "test_ota.py::test_ota"
+
+
+def firmware(minor: int) -> Firmware:
+    return Firmware(data=b"", hash=f"{minor:064x}", version=FirmwareVersion(1, minor, "abcdef"))
+
+
+def test_trends(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    try:
+        for minor, ota, pairing in [(1, 30.0, 10.0), (1, 32.0, 12.0), (2, 31.0, 11.0), (3, 45.0, 20.0)]:
+            run_id = store.start_run("pi-1", firmware(minor))
+            store.record_test(run_id, OTA, "passed", {"setup": pairing, "call": ota - pairing, "teardown": 0.0},
+                              {"pairing.ensure": {"count": 1, "total_s": pairing}})
+            store.record_test(run_id, "test_standby.py::test_standby", "failed", {"call": 1.0})
+            store.record_latencies(run_id, {"button -> relay": {"count": 3, "p50_ms": 40.0 + minor, "p95_ms": 50.0,
+                                                                "p99_ms": 55.0, "max_ms": 60.0}})
+            store.finish_run(run_id)
+
+        points = store.test_durations(OTA)
+        assert [(point.firmware_version, point.samples, point.mean) for point in points] == \
+            [("v1.3-abcdef", 1, 45.0), ("v1.2-abcdef", 1, 31.0), ("v1.1-abcdef", 2, 31.0)]
+        assert len(store.test_durations(OTA, builds=2)) == 2
+        # the failed runs are not counted
+        assert store.test_durations("test_standby.py::test_standby") == []
+        assert store.test_durations(OTA, fixture_id="pi-2") == []
+
+        pairing = store.operation_times("pairing.ensure")
+        assert [(previous.firmware_version, following.firmware_version) for previous, following in
+                regressions(pairing)] == [("v1.2-abcdef", "v1.3-abcdef")]
+        assert store.latencies("button -> relay")[0].mean == 43.0
+
+        assert store.latest_durations() == {OTA: 45.0}
+    finally:
+        store.close()
+
+
+def test_writes_are_batched(tmp_path):
+    store = ResultsStore(str(tmp_path / "results.sqlite"))
+    try:
+        run_id = store.start_run("pi-1", firmware(1))
+        start = monotonic()
+        for i in range(1000):
+            store.record_test(run_id, f"test_{i}", "passed", {"call": 1.0})
+        # recording only queues the rows
+        assert monotonic() - start < 0.5
+
+        assert len(store.latest_durations()) == 1000
+    finally:
+        store.close()
@@ -0,0 +1,81 @@
+import pytest
+
+from time import sleep
+
+from fw_test.scenario import Scenario, Step, StepStatus, ScenarioError
+
+
+def pause(seconds, value=None):
+    def action(ctx):
+        sleep(seconds)
+        return value
+
+    return action
+
+
+def test_independent_steps_in_parallel():
+    scenario = Scenario(ctx=None)
+    # restore the firmware while the access point starts, then pair
+    scenario.add(Step("restore", pause(0.3)))
+    scenario.add(Step("start_ap", pause(0.1)))
+    scenario.add(Step("flush", pause(0.05)))
+    scenario.add(Step("pair", pause(0.1, "session"), after=("restore", "start_ap")))
+    scenario.add(Step("assert", lambda ctx: scenario.result("pair"), after=("pair", "flush")))
+
+    report = scenario.run()
+
+    assert report.passed
+    assert report.steps["assert"].value == "session"
+    # the longest chain, not the sum of the steps
+    assert report.duration < 0.5
+    assert report.critical_path == ["restore", "pair", "assert"]
+    assert report.steps["pair"].start >= report.steps["restore"].end
+
+
+def test_failure_skips_dependents():
+    scenario = Scenario(ctx=None)
+    ran = []
+
+    @scenario.step()
+    def provision(ctx):
+        raise AssertionError("provision rejected")
+
+    @scenario.step(after=("provision",))
+    def start_ap(ctx):
+        ran.append("start_ap")
+
+    @scenario.step()
+    def slow(ctx):
+        sleep(0.1)
+        ran.append("slow")
+
+    with pytest.raises(AssertionError, match="provision rejected"):
+        scenario.run()
+
+    # the steps already started complete, the dependents don't start
+    assert ran == ["slow"]
+    assert scenario.report.steps["start_ap"].status == StepStatus.SKIPPED
+    assert scenario.report.steps["provision"].status == StepStatus.FAILED
+
+
+def test_timeout():
+    scenario = Scenario(ctx=None)
+    scenario.add(Step("wait_get", pause(1), timeout=0.1))
+
+    with pytest.raises(TimeoutError):
+        scenario.run()
+    assert scenario.report.steps["wait_get"].status == StepStatus.TIMED_OUT
+    assert scenario.report.duration < 0.5
+
+
+def test_invalid_dependencies():
+    scenario = Scenario(ctx=None)
+    scenario.add(Step("a", pause(0), after=("b",)))
+    scenario.add(Step("b", pause(0), after=("a",)))
+    with pytest.raises(ScenarioError, match="cycle"):
+        scenario.run()
+
+    scenario = Scenario(ctx=None)
+    scenario.add(Step("a", pause(0), after=("missing",)))
+    with pytest.raises(ScenarioError, match="unknown"):
+        scenario.run()
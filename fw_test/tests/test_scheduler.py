@@ -0,0 +1,139 @@
+from time import sleep
+from threading import Lock
+
+from fw_test.scheduler import Scheduler, DurationHistory, FixtureSpec, ScheduledTest, PytestRunner, plan
+
+FIXTURES = [
+    FixtureSpec("pi-1", "pi-1.toml", frozenset({"prev_firmware"})),
+    FixtureSpec("pi-2", "pi-2.toml"),
+]
+
+
+def history(durations: dict[str, float]) -> DurationHistory:
+    history = DurationHistory()
+    history.durations = dict(durations)
+    return history
+
+
+def test_plan_longest_first():
+    items = [ScheduledTest("a"), ScheduledTest("b"), ScheduledTest("c"), ScheduledTest("d")]
+    queues, unschedulable = plan(items, FIXTURES, history({"a": 10, "b": 60, "c": 40, "d": 30}))
+
+    assert [item.nodeid for item in queues["pi-1"]] == ["b", "a"]
+    assert [item.nodeid for item in queues["pi-2"]] == ["c", "d"]
+    assert unschedulable == []
+
+
+def test_plan_capabilities():
+    items = [
+        ScheduledTest("downgrade", requires=frozenset({"prev_firmware"})),
+        ScheduledTest("pinned", affinity="pi-2"),
+        ScheduledTest("radio", requires=frozenset({"dual_radio"})),
+    ]
+    queues, unschedulable = plan(items, FIXTURES, history({}))
+
+    assert [item.nodeid for item in queues["pi-1"]] == ["downgrade"]
+    assert [item.nodeid for item in queues["pi-2"]] == ["pinned"]
+    assert [item.nodeid for item in unschedulable] == ["radio"]
+
+
+def test_work_stealing():
+    # the estimates are wrong: "slow" takes much more than expected, the
+    # other fixture steals the tests queued behind it
+    durations = {"slow": 0.3, "fast": 0.01}
+    lock = Lock()
+    ran = []
+
+    def runner(fixture, items):
+        for item in items:
+            sleep(durations[item.nodeid.split("-")[0]])
+            with lock:
+                ran.append((fixture.name, item.nodeid))
+            yield True, None
+
+    items = [ScheduledTest("slow"), *(ScheduledTest(f"fast-{i}") for i in range(6))]
+    estimates = history({"slow": 1, **{f"fast-{i}": 0.2 for i in range(6)}})
+    results = Scheduler(FIXTURES, estimates, runner).run(items)
+
+    assert all(result.passed for result in results) and len(results) == 7
+    assert ("pi-1", "slow") in ran
+    assert sum(fixture == "pi-2" for fixture, _ in ran) == 6
+    # the measured durations replace the estimates
+    assert estimates.durations["slow"] < 1
+
+
+def test_failed_session():
+    # the tests of a session that stops are failed, the others run in a new session
+    sessions = []
+
+    def runner(fixture, items):
+        sessions.append(fixture.name)
+        for item in items:
+            if item.nodeid == "crash":
+                raise RuntimeError("pytest exited")
+            yield True, None
+
+    items = [ScheduledTest(nodeid, affinity="pi-1") for nodeid in ("a", "crash", "b")]
+    results = Scheduler(FIXTURES, history({"a": 3, "crash": 2, "b": 1}), runner).run(items)
+
+    assert [(result.nodeid, result.passed) for result in results] == [("a", True), ("crash", False), ("b", True)]
+    assert sessions.count("pi-1") == 2
+
+
+CONFTEST = """
+import pytest
+
+def pytest_addoption(parser):
+    parser.addoption("--config-path")
+    parser.addoption("--capture-dir")
+
+@pytest.fixture(scope="session")
+def session_state():
+    return {}
+"""
+
+SUITE = """
+import os
+
+def test_first(session_state):
+    session_state["pid"] = os.getpid()
+
+def test_failing():
+    assert 1 == 2
+
+def test_second(session_state):
+    assert session_state["pid"] == os.getpid()
+"""
+
+
+def test_pytest_runner(tmp_path):
+    suite = tmp_path / "suite"
+    suite.mkdir()
+    (suite / "pytest.ini").write_text("[pytest]\n")
+    (suite / "conftest.py").write_text(CONFTEST)
+    (suite / "test_suite.py").write_text(SUITE)
+
+    runner = PytestRunner(str(tmp_path / "logs"), [str(suite)])
+    names = ["test_first", "test_failing", "test_second", "test_missing"]
+    items = iter(ScheduledTest(f"test_suite.py::{name}") for name in names)
+    results = list(runner(FixtureSpec("pi-1", "pi-1.toml"), items))
+
+    # the tests run in the same session, in order: the session fixture is set up once
+    assert [passed for passed, _ in results] == [True, False, True, False]
+    with open(results[1][1]) as log:
+        assert "assert 1 == 2" in log.read()
+
+
+def test_history_smoothing(tmp_path):
+    path = str(tmp_path / "durations.json")
+    estimates = DurationHistory(path)
+    assert estimates.estimate("a") == 60
+
+    estimates.update("a", 10)
+    estimates.update("a", 20)
+    estimates.save()
+
+    estimates = DurationHistory(path)
+    assert estimates.estimate("a") == 15
+    # unknown tests are estimated with the median of the others
+    assert estimates.estimate("b") == 15
@@ -0,0 +1,41 @@
+from time import monotonic_ns
+
+from fw_test.pins import IOPin, IOValue, BUTTON_DOWN_VALUE, BUTTON_UP_VALUE
+from fw_test.sequence import Sequence, SequencePlayer, Step, NS_PER_SECOND
+
+
+def test_compile_order():
+    steps = Sequence() \
+        .set(0.2, IOPin.RESET, IOValue.HIGH) \
+        .set(0, IOPin.RESET, IOValue.LOW) \
+        .set(0.2, IOPin.BOOT, IOValue.LOW) \
+        .compile()
+
+    assert steps == [
+        Step(0, IOPin.RESET, IOValue.LOW),
+        Step(200_000_000, IOPin.RESET, IOValue.HIGH),
+        Step(200_000_000, IOPin.BOOT, IOValue.LOW),
+    ]
+
+
+def test_presses():
+    steps = Sequence.presses(IOPin.BUTTON_PLUS, count=3, press_time=0.05, release_time=0.05).compile()
+
+    assert len(steps) == 6
+    assert [step.value for step in steps] == [BUTTON_DOWN_VALUE, BUTTON_UP_VALUE] * 3
+    assert [step.offset_ns for step in steps] == [i * 50_000_000 for i in range(6)]
+
+
+def test_player_timing():
+    writes = []
+    player = SequencePlayer(lambda pin, value: writes.append((monotonic_ns(), pin, value)))
+    steps = Sequence.presses(IOPin.BUTTON_MINUS, count=5, press_time=0.01, release_time=0.01).compile()
+
+    result = player.play(steps)
+    player.stop()
+
+    assert [(pin, value) for _, pin, value in writes] == [(step.pin, step.value) for step in steps]
+    for step_result in result.steps:
+        assert step_result.actual_ns >= step_result.deadline_ns
+    # generous bound, the machine running the tests is not real-time
+    assert result.max_lateness_ns < NS_PER_SECOND // 20
@@ -1,6 +1,6 @@
 import pytest
 
-from fw_test.cloud.serializer import to_struct_fmt, sizeof
+from fw_test.cloud.serializer import to_struct_fmt, sizeof, serialize, deserialize, layout
 from fw_test.cloud import state
 from fw_test.cloud import PacketType
 
@@ -77,4 +77,21 @@ def test_encode_state():
         "forFutureUsage_rw": b"\0" * 68
     }
     binary = state.to_binary(test_state)
-    assert state.from_binary(binary) == test_state
\ No newline at end of file
+    assert state.from_binary(binary) == test_state
+
+
+def test_layout():
+    structure = {"clientToken": "u32", "type": "u8", "envId": "u8[4]", "temperature": "i16"}
+    message = {"clientToken": 7, "type": 4, "envId": b"abcd", "temperature": -5}
+    packet_layout = layout(structure)
+    assert packet_layout is layout(dict(structure))
+    assert packet_layout.size == sizeof(structure)
+    assert [field.offset for field in packet_layout.fields.values()] == [0, 4, 5, 9]
+
+    binary = bytearray(serialize(structure, message))
+    assert packet_layout.pack(message) == binary
+    assert packet_layout.unpack(binary) == message
+    assert packet_layout.read(binary, "envId") == b"abcd"
+
+    packet_layout.write(binary, "temperature", 215)
+    assert deserialize(structure, binary)["temperature"] == 215
@@ -0,0 +1,85 @@
+import socket
+import struct
+
+from ipaddress import IPv4Address, IPv4Interface
+
+from fw_test.wifi.dhcp import DhcpServer, DhcpPacket, Lease, BOOTREQUEST, OPTION_MESSAGE_TYPE, OPTION_REQUESTED_IP, \
+    OPTION_SERVER_ID, MessageType, ANY_ADDRESS
+from fw_test.wifi.dns import DnsFailure, DNS_HEADER, RCODE_NXDOMAIN
+from fw_test.wifi.services import NetworkServices
+
+MAC = bytes.fromhex("020000000100") + bytes(10)
+INTERFACE = IPv4Interface("192.168.13.1/24")
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((DhcpPacket.parse(data), addr))
+
+
+def request(message_type, options=None):
+    options = {OPTION_MESSAGE_TYPE: bytes([message_type]), **(options or {})}
+    return DhcpPacket(BOOTREQUEST, 0x1234, 0x8000, ANY_ADDRESS, ANY_ADDRESS, MAC, options).serialize()
+
+
+def test_dhcp_lease():
+    leases = []
+    server = DhcpServer(INTERFACE, leases.append)
+    transport = FakeTransport()
+    server.connection_made(transport)
+
+    server.datagram_received(request(MessageType.DISCOVER), ("0.0.0.0", 68))
+    offer, destination = transport.sent[-1]
+    assert offer.message_type == MessageType.OFFER
+    assert destination == ("255.255.255.255", 68)
+
+    # the lease is notified as soon as it is acknowledged
+    server.datagram_received(request(MessageType.REQUEST, {
+        OPTION_REQUESTED_IP: offer.yiaddr.packed,
+        OPTION_SERVER_ID: INTERFACE.ip.packed,
+    }), ("0.0.0.0", 68))
+    assert transport.sent[-1][0].message_type == MessageType.ACK
+    assert leases == [Lease("02:00:00:00:01:00", offer.yiaddr, None)]
+
+    # an address that belongs to the network but is not the one of the device
+    server.datagram_received(request(MessageType.REQUEST, {OPTION_REQUESTED_IP: IPv4Address("192.168.13.200").packed}),
+                             ("0.0.0.0", 68))
+    assert transport.sent[-1][0].message_type == MessageType.NAK
+
+
+def query(name: str) -> bytes:
+    question = b"".join(bytes([len(label)]) + label.encode() for label in name.split(".")) + b"\0"
+    return DNS_HEADER.pack(0x4242, 0x0100, 1, 0, 0, 0) + question + struct.pack("!HH", 1, 1)
+
+
+def test_dns_table():
+    services = NetworkServices(INTERFACE, lambda lease: None)
+    dhcp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    dhcp_socket.bind(("127.0.0.1", 0))
+    dns_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    dns_socket.bind(("127.0.0.1", 0))
+    address = dns_socket.getsockname()
+
+    services.dns_table.set("reota.irsap.cloud", "192.168.13.1")
+    services.dns_table.set("broken.example.com", DnsFailure.NXDOMAIN)
+    services.start(dhcp_socket, dns_socket)
+    try:
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.settimeout(1)
+
+        client.sendto(query("REOTA.irsap.cloud"), address)
+        response = client.recv(512)
+        _, flags, _, answers, _, _ = DNS_HEADER.unpack_from(response)
+        assert answers == 1 and flags & 0xF == 0
+        assert response[-4:] == IPv4Address("192.168.13.1").packed
+
+        client.sendto(query("broken.example.com"), address)
+        _, flags, _, answers, _, _ = DNS_HEADER.unpack_from(client.recv(512))
+        assert answers == 0 and flags & 0xF == RCODE_NXDOMAIN
+
+        assert services.dns_latencies()["reota.irsap.cloud"]["count"] == 1
+    finally:
+        services.stop()
@@ -0,0 +1,100 @@
+import pytest
+
+from queue import Queue
+
+from fw_test.artifacts import ArtifactServer
+from fw_test.cloud import Cloud, Shadow, ShadowService, ShadowError
+from fw_test.cloud.local import LocalCloud
+from fw_test.cloud.serializer import layout
+from fw_test.cloud.state import PacketType, PACKET_STATE_DESIRED_V2, PACKET_STATE_REPORTED_V2, to_binary
+from fw_test.tests.test_local_cloud import LOCAL_CONFIG, listen
+from fw_test.tests.test_simulator import CONFIG
+
+DESIRED = layout(PACKET_STATE_DESIRED_V2)
+REPORTED = layout(PACKET_STATE_REPORTED_V2)
+STATE = {**DESIRED.unpack(bytes(DESIRED.size)), "type": PacketType.STATE_DESIRED_V2, "version": 3,
+         "manualSetPoint": 120, "metricInterval": 20}
+TOPIC = f"re/things/{CONFIG.mac_address}/shadow"
+
+
+def reported(desired: bytes, **fields) -> bytes:
+    """
+    the state the device reports after applying the desired one
+    """
+    frame = bytearray(REPORTED.size)
+    frame[:len(desired)] = desired
+    REPORTED.write(frame, "type", PacketType.STATE_REPORTED_V2.value)
+    REPORTED.write(frame, "length", REPORTED.size)
+    for key, value in fields.items():
+        REPORTED.write(frame, key, value)
+    return bytes(frame)
+
+
+def test_delta():
+    shadow = Shadow()
+    with pytest.raises(ShadowError, match="no desired state"):
+        shadow.update_desired(manualSetPoint=150)
+
+    shadow.set_desired(STATE)
+    assert shadow.version == 3 and not shadow.in_sync
+
+    shadow.report(reported(shadow.desired, temperature=215))
+    assert shadow.in_sync and shadow.value("temperature") == 215
+
+    shadow.update_desired(manualSetPoint=150)
+    assert shadow.version == 4 and shadow.delta == {"manualSetPoint"} and not shadow.in_sync
+    assert shadow.value("manualSetPoint", reported=False) == 150
+
+    shadow.report(reported(shadow.desired, manualSetPoint=140))
+    assert shadow.delta == {"manualSetPoint"}
+    shadow.report(reported(shadow.desired))
+    assert shadow.in_sync
+
+
+def test_service_answers_gets():
+    artifacts = ArtifactServer(listen())
+    local = LocalCloud(LOCAL_CONFIG, listen(), artifacts)
+    cloud = Cloud(LOCAL_CONFIG, local=local)
+    service = ShadowService(cloud)
+    messages = Queue()
+    device = local.mqtt("device")
+    device.subscribe(f"{TOPIC}/get/+", lambda topic, payload: messages.put((topic, payload)))
+    device.subscribe(f"{TOPIC}/desired-update/accepted", lambda topic, payload: messages.put((topic, payload)))
+    try:
+        def get(token: int) -> tuple[str, bytes]:
+            device.publish(f"{TOPIC}/get", to_binary({"clientToken": token, "timestamp": 0, "version": 0,
+                                                      "type": PacketType.HEADER}))
+            service.wait(lambda shadow: shadow.answered_token == token)
+            return messages.get(timeout=5)
+
+        # no shadow for the device yet
+        service.serve(None)
+        assert get(1)[0] == f"{TOPIC}/get/rejected"
+
+        service.serve(STATE)
+        topic, answer = get(2)
+        assert topic == f"{TOPIC}/get/accepted"
+        assert DESIRED.read(answer, "clientToken") == 2 and DESIRED.read(answer, "manualSetPoint") == 120
+
+        device.publish(f"{TOPIC}/reported-update", reported(answer))
+        assert service.wait(lambda shadow: shadow.in_sync).reported_version == 3
+
+        service.desire(manualSetPoint=150)
+        topic, update = messages.get(timeout=5)
+        assert topic == f"{TOPIC}/desired-update/accepted" and DESIRED.read(update, "version") == 4
+        assert service.shadow.delta == {"manualSetPoint"}
+
+        device.publish(f"{TOPIC}/reported-update", reported(update))
+        service.wait(lambda shadow: shadow.in_sync)
+
+        # the test answers by itself
+        service.release()
+        device.publish(f"{TOPIC}/get", bytes(15))
+        service.wait(lambda shadow: shadow.client_token == 0)
+        assert messages.empty()
+    finally:
+        device.stop()
+        service.stop()
+        cloud.stop()
+        local.stop()
+        artifacts.stop()
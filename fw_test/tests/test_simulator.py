@@ -0,0 +1,204 @@
+import pytest
+import hashlib
+import requests
+
+from time import sleep
+
+from fw_test.api import LocalApi
+from fw_test.config import Config, Backend
+from fw_test.firmware import Firmware, FirmwareVersion
+from fw_test.io import IO
+from fw_test.pins import IOPin, IOValue, LedColor, BUTTON_DOWN_VALUE, BUTTON_UP_VALUE
+from fw_test.simulator import Simulator
+from fw_test.simulator.radiator import Radiator, DEFAULT_SET_POINT, SET_POINT_STEP, BOOT_TIME
+from fw_test.trace import Tracer
+from fw_test.waveform import FilPiloteMode, fil_pilote, current_feedback, HALF_PERIOD_NS
+from fw_test.wifi import ApConfiguration, WifiSecurityType
+
+CONFIG = Config(
+    mac_address="ff:ff:ff:ff:ff:ff",
+    aws_profile="",
+    aws_region="",
+    aws_iot_endpoint="",
+    aws_iot_client_id="",
+    wifi_ap_interface="wlan0",
+    wifi_client_interface="wlan0",
+    wifi_ssid="RE",
+    serial_port="",
+    prev_firmware_path="",
+    ota_bucket="",
+    backend=Backend.SIMULATED,
+)
+VERSION = FirmwareVersion(1, 2, "abcdef")
+AP_CONFIG = ApConfiguration("TEST", WifiSecurityType.WPA2, "passphrase", 6)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def radiator(clock):
+    return Radiator(CONFIG, VERSION, clock=clock)
+
+
+def press(radiator, clock, pin, duration=0.1, pause=0.1):
+    radiator.write(pin, BUTTON_DOWN_VALUE)
+    clock.now += duration
+    radiator.write(pin, BUTTON_UP_VALUE)
+    clock.now += pause
+
+
+def test_boot_and_pairing(radiator, clock):
+    assert radiator.led_color() == LedColor.RED
+
+    radiator.write(IOPin.RESET, IOValue.LOW)
+    assert radiator.led_color() == LedColor.OFF
+    radiator.write(IOPin.RESET, IOValue.HIGH)
+    assert not radiator.running
+    clock.now += 1
+    assert radiator.led_color() == LedColor.RED
+
+    assert radiator.provision("TEST", "wpa", "passphrase", "env")
+    assert radiator.led_color() == LedColor.YELLOW
+
+    radiator.set_ap(AP_CONFIG)
+    assert radiator.online
+    assert radiator.led_color() == LedColor.OFF
+
+
+def test_set_point_buttons(radiator, clock):
+    press(radiator, clock, IOPin.BUTTON_PLUS)
+    assert radiator.set_point == DEFAULT_SET_POINT
+
+    for _ in range(4):
+        press(radiator, clock, IOPin.BUTTON_PLUS)
+    assert radiator.set_point == DEFAULT_SET_POINT + 4 * SET_POINT_STEP
+    assert radiator.read(IOPin.RELAY) == IOValue.HIGH
+    assert radiator.led_color() == LedColor.RED
+
+    # bounces are ignored
+    press(radiator, clock, IOPin.BUTTON_MINUS, duration=0.001)
+    assert radiator.set_point == DEFAULT_SET_POINT + 4 * SET_POINT_STEP
+
+    clock.now += 10
+    assert radiator.led_color() == LedColor.RED
+
+
+def test_standby_and_hard_reset(radiator, clock):
+    radiator.provision("TEST", "wpa", "passphrase", "env")
+    radiator.set_ap(AP_CONFIG)
+
+    press(radiator, clock, IOPin.BUTTON_MINUS, duration=6)
+    assert radiator.led_color() == LedColor.MAGENTA
+    assert radiator.read(IOPin.RELAY) == IOValue.LOW
+
+    press(radiator, clock, IOPin.BUTTON_MINUS, duration=6)
+    assert radiator.led_color() == LedColor.OFF
+
+    radiator.write(IOPin.BUTTON_PLUS, BUTTON_DOWN_VALUE)
+    radiator.write(IOPin.BUTTON_MINUS, BUTTON_DOWN_VALUE)
+    clock.now += 7
+    radiator.write(IOPin.BUTTON_PLUS, BUTTON_UP_VALUE)
+    radiator.write(IOPin.BUTTON_MINUS, BUTTON_UP_VALUE)
+    clock.now += 0.5
+    press(radiator, clock, IOPin.BUTTON_PLUS, duration=0.5)
+
+    assert radiator.provisioning is None
+    assert radiator.led_color() == LedColor.RED
+
+
+def test_waveforms(radiator, clock):
+    lines = []
+    radiator.attach_console(lines.append)
+
+    radiator.set_waveform(fil_pilote(FilPiloteMode.FROST))
+    radiator.set_waveform(current_feedback(True))
+    assert lines == ["fil pilote FROST", "current feedback on"]
+
+    # the levels follow the clock of the radiator
+    assert radiator.read(IOPin.CURRENT_FEEDBACK) == IOValue.LOW
+    clock.now += HALF_PERIOD_NS / 2 / 1e9
+    assert radiator.read(IOPin.CURRENT_FEEDBACK) == IOValue.HIGH
+    assert radiator.read(IOPin.FIL_PILOTE_N) == IOValue.LOW
+    clock.now += HALF_PERIOD_NS / 1e9
+    assert radiator.read(IOPin.FIL_PILOTE_N) == IOValue.HIGH
+
+
+def test_simulator_interfaces(tmp_path):
+    firmware = tmp_path / "fw.bin"
+    firmware.write_bytes(b"\0" * 64 + b"$$FIRMWARE_VERSION=1.2-abcdef#" + b"\0" * 64)
+
+    loaded = Firmware.load_file(str(firmware))
+    # the image is read from the file only when needed
+    assert loaded.size == 158 and "binary" not in vars(loaded)
+    assert loaded.hash == hashlib.sha256(loaded.binary).hexdigest() and loaded.binary == firmware.read_bytes()
+
+    simulator = Simulator(CONFIG, loaded)
+    tracer = Tracer()
+    io = IO(CONFIG, gpio=simulator.gpio, serial_port=simulator.console.port, tracer=tracer)
+    api = LocalApi(CONFIG, base_url=simulator.api.url)
+    try:
+        assert FirmwareVersion.from_str(api.status()["system"]["fwVer"]) == VERSION
+        assert api.provision(AP_CONFIG, "3ab5b0a4-54d6-4f52-8a8f-5ba1e0d6ab4a")["status"] == "success"
+
+        simulator.wifi.start_ap(AP_CONFIG)
+        assert io.status_led_color() == LedColor.OFF
+
+        # longer than the 30 ms debounce of the simulated radiator, shorter than the presses on the fixtures
+        io.press_plus(press_time=0.05, count=5, release_time=0.05)
+        assert simulator.radiator.set_point == DEFAULT_SET_POINT + 4 * SET_POINT_STEP
+        assert io.is_load_active()
+
+        version, counters = io.serial_script([("version", r"^version (\S+)"), ("counters", r"presses=(\d+)")])
+        assert version.match.group(1) == str(VERSION)
+        assert counters.match.group(1) == "5"
+
+        io.set_fil_pilote(FilPiloteMode.OFF)
+        assert simulator.radiator.fil_pilote_mode == FilPiloteMode.OFF
+        assert not io.is_load_active()
+        io.set_fil_pilote(FilPiloteMode.COMFORT)
+        assert io.is_load_active()
+
+        io.reset()
+        assert io.status_led_color() == LedColor.OFF
+        with pytest.raises(requests.ConnectionError):
+            api.status()
+
+        sleep(BOOT_TIME + 0.1)
+        assert tracer.histograms["reset -> console"].count == 1
+    finally:
+        io.stop()
+        simulator.stop()
+
+
+def test_firmware_update(tmp_path):
+    current = tmp_path / "fw.bin"
+    current.write_bytes(b"\0" * 64 + b"$$FIRMWARE_VERSION=1.2-abcdef#" + b"\0" * 64)
+    previous = tmp_path / "prev.bin"
+    previous.write_bytes(b"\0" * 100_000 + b"$$FIRMWARE_VERSION=1.1-012345#" + b"\0" * 64)
+
+    simulator = Simulator(CONFIG, Firmware.load_file(str(current)))
+    api = LocalApi(CONFIG, base_url=simulator.api.url)
+    progress = []
+    try:
+        firmware = Firmware.load_file(str(previous))
+        assert api.firmware_update(firmware, on_progress=progress.append).status_code == 200
+        assert progress[-1].sent == progress[-1].total == firmware.size
+
+        upload, = api.uploads
+        assert upload.sent == upload.size and upload.status == 200
+
+        status = api.wait_for_version(firmware.version, timeout=BOOT_TIME + 2)
+        assert status["system"]["fwVer"] == "1.1-012345"
+    finally:
+        simulator.stop()
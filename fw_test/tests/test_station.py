@@ -0,0 +1,38 @@
+from threading import Timer
+from ipaddress import IPv4Address
+
+import pytest
+
+from fw_test.wifi.dhcp import Lease
+from fw_test.wifi.station import StationMonitor, StationStage, StationError
+
+MAC = "02:00:00:00:01:00"
+
+
+def test_station_stages():
+    monitor = StationMonitor()
+
+    monitor.handle_hostapd_output(f"wlan0: STA {MAC} IEEE 802.11: associated (aid 1)")
+    monitor.handle_hostapd_event(f"EAPOL-4WAY-HS-COMPLETED {MAC}")
+    assert monitor.stage(MAC) == StationStage.AUTHORIZED
+
+    Timer(0.05, monitor.handle_lease, [Lease(MAC, IPv4Address("192.168.13.57"), "radiator")]).start()
+    event = monitor.wait_for_station(MAC.upper(), StationStage.LEASED, timeout=1)
+    assert event.detail == "192.168.13.57"
+
+    # a late event doesn't move the station back
+    monitor.handle_hostapd_event(f"AP-STA-CONNECTED {MAC}")
+    assert monitor.wait_for_station(MAC, StationStage.AUTHORIZED, timeout=0).stage == StationStage.LEASED
+
+    monitor.handle_hostapd_event(f"AP-STA-DISCONNECTED {MAC}")
+    with pytest.raises(TimeoutError, match="last stage DISCONNECTED"):
+        monitor.wait_for_station(MAC, StationStage.ASSOCIATED, timeout=0.05)
+
+
+def test_station_rejected():
+    monitor = StationMonitor()
+
+    # the waiter fails as soon as hostapd reports the mismatch, not at the timeout
+    Timer(0.05, monitor.handle_hostapd_event, [f"AP-STA-POSSIBLE-PSK-MISMATCH {MAC}"]).start()
+    with pytest.raises(StationError, match="wrong passphrase"):
+        monitor.wait_for_station(MAC, StationStage.LEASED, timeout=10)
@@ -0,0 +1,46 @@
+from fw_test.trace import Tracer, LatencyPair, EventMatch, LatencyHistogram, TraceEvent, EventKind, NS_PER_MS
+
+
+def record(tracer, timestamp_ns, kind, source, **attributes):
+    tracer._record(TraceEvent(timestamp_ns, kind, source, attributes))
+
+
+def test_event_match():
+    match = EventMatch("io.write", {"pin": ("BUTTON_PLUS", "BUTTON_MINUS"), "value": "LOW"})
+
+    assert match.matches(TraceEvent(0, EventKind.STIMULUS, "io.write", {"pin": "BUTTON_PLUS", "value": "LOW"}))
+    assert not match.matches(TraceEvent(0, EventKind.STIMULUS, "io.write", {"pin": "RESET", "value": "LOW"}))
+    assert not match.matches(TraceEvent(0, EventKind.STIMULUS, "gpio", {"pin": "BUTTON_PLUS", "value": "LOW"}))
+
+
+def test_latency_pairing():
+    pair = LatencyPair("press -> relay", EventMatch("io.write"), EventMatch("gpio"), 100 * NS_PER_MS)
+    tracer = Tracer([pair])
+
+    # the response is paired with the latest stimulus
+    record(tracer, 0, EventKind.STIMULUS, "io.write")
+    record(tracer, 10 * NS_PER_MS, EventKind.STIMULUS, "io.write")
+    record(tracer, 15 * NS_PER_MS, EventKind.RESPONSE, "gpio")
+
+    # responses without a stimulus are ignored
+    record(tracer, 20 * NS_PER_MS, EventKind.RESPONSE, "gpio")
+
+    # too late to be a response
+    record(tracer, 30 * NS_PER_MS, EventKind.STIMULUS, "io.write")
+    record(tracer, 200 * NS_PER_MS, EventKind.RESPONSE, "gpio")
+
+    assert tracer.histograms["press -> relay"].samples == [5 * NS_PER_MS]
+    assert len(tracer.events()) == 6
+
+
+def test_histogram():
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.add(ms * NS_PER_MS)
+
+    assert histogram.percentile(50) == 50 * NS_PER_MS
+    assert histogram.percentile(95) == 95 * NS_PER_MS
+    summary = histogram.summary()
+    assert summary["count"] == 100
+    assert sum(summary["buckets_ms"].values()) == 100
+    assert summary["buckets_ms"]["100"] == 50
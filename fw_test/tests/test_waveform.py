@@ -0,0 +1,74 @@
+from time import sleep, monotonic_ns
+
+import pytest
+
+from fw_test.pins import IOPin, IOValue
+from fw_test.waveform import (
+    FilPiloteMode, WaveformPlayer, fil_pilote, current_feedback, MAINS_PERIOD_NS, HALF_PERIOD_NS,
+)
+
+
+def test_fil_pilote_half_waves():
+    eco = fil_pilote(FilPiloteMode.ECO)
+    assert eco.level(IOPin.FIL_PILOTE_P, HALF_PERIOD_NS // 2) == IOValue.HIGH
+    assert eco.level(IOPin.FIL_PILOTE_N, HALF_PERIOD_NS // 2) == IOValue.LOW
+    assert eco.level(IOPin.FIL_PILOTE_P, MAINS_PERIOD_NS + HALF_PERIOD_NS * 3 // 2) == IOValue.LOW
+    assert eco.level(IOPin.FIL_PILOTE_N, MAINS_PERIOD_NS + HALF_PERIOD_NS * 3 // 2) == IOValue.HIGH
+
+    frost = fil_pilote(FilPiloteMode.FROST)
+    assert {step.pin for step in frost.steps} == {IOPin.FIL_PILOTE_N}
+
+    assert fil_pilote(FilPiloteMode.COMFORT).steps == ()
+
+
+def test_merge():
+    merged = fil_pilote(FilPiloteMode.OFF).merge(current_feedback(True))
+
+    assert merged.pins == {IOPin.FIL_PILOTE_P, IOPin.FIL_PILOTE_N, IOPin.CURRENT_FEEDBACK}
+    assert [step.offset_ns for step in merged.steps] == sorted(step.offset_ns for step in merged.steps)
+
+    with pytest.raises(ValueError):
+        merged.merge(current_feedback(False))
+
+
+def test_player():
+    levels = {}
+    edges = []
+
+    def output(pin, value):
+        if levels.get(pin) != value:
+            edges.append(pin)
+        levels[pin] = value
+
+    player = WaveformPlayer(output)
+    player.start(fil_pilote(FilPiloteMode.ECO))
+    sleep(0.1)
+    player.stop_pins(frozenset({IOPin.FIL_PILOTE_P}))
+    sleep(0.05)
+    player.stop()
+
+    # about 5 periods with 2 edges per pin each
+    assert 10 <= edges.count(IOPin.FIL_PILOTE_P.value) <= 14
+    assert levels[IOPin.FIL_PILOTE_P.value] == IOValue.LOW.value
+    assert levels[IOPin.FIL_PILOTE_N.value] == IOValue.LOW.value
+
+
+def test_change_keeps_other_waveforms():
+    outputs = []
+    player = WaveformPlayer(lambda pin, value: outputs.append((monotonic_ns(), pin, value)))
+    player.start(current_feedback(True))
+    sleep(0.1)
+    changed = len(outputs)
+    player.start(fil_pilote(FilPiloteMode.ECO))
+    sleep(0.1)
+    player.stop()
+
+    feedback = [(time_ns, value) for time_ns, pin, value in outputs if pin == IOPin.CURRENT_FEEDBACK.value]
+    # no glitch: the current feedback is not driven low out of its pulses
+    assert all(previous[1] != following[1] for previous, following in zip(feedback, feedback[1:]))
+    # and it keeps its phase
+    rising = [time_ns for time_ns, value in feedback if value == IOValue.HIGH.value]
+    first_after = next(time_ns for time_ns, pin, value in outputs[changed:]
+                       if pin == IOPin.CURRENT_FEEDBACK.value and value == IOValue.HIGH.value)
+    shift = (first_after - rising[0]) % HALF_PERIOD_NS
+    assert min(shift, HALF_PERIOD_NS - shift) < HALF_PERIOD_NS // 4
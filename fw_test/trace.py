@@ -0,0 +1,180 @@
+import bisect
+
+from time import monotonic_ns
+from logging import getLogger
+from threading import Lock
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum, auto
+from typing import Callable, Optional
+
+LOGGER = getLogger(__name__)
+
+# number of events kept in the timeline, older ones are discarded
+TIMELINE_LENGTH = 100_000
+
+# upper bounds (in milliseconds) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000]
+
+NS_PER_MS = 1_000_000
+
+
+class EventKind(Enum):
+    # something the fixture did to the device
+    STIMULUS = auto()
+    # something the device did that the fixture observed
+    RESPONSE = auto()
+
+
+@dataclass(frozen=True)
+class TraceEvent:
+    timestamp_ns: int
+    kind: EventKind
+    source: str
+    attributes: dict
+
+
+@dataclass(frozen=True)
+class EventMatch:
+    """
+    selects events by source and attributes, an attribute
+    can be matched against a single value or a tuple of values
+    """
+    source: str
+    attributes: dict = field(default_factory=dict)
+
+    def matches(self, event: TraceEvent) -> bool:
+        if event.source != self.source:
+            return False
+
+        for key, expected in self.attributes.items():
+            value = event.attributes.get(key)
+            if value != expected and not (isinstance(expected, tuple) and value in expected):
+                return False
+
+        return True
+
+
+@dataclass(frozen=True)
+class LatencyPair:
+    """
+    a stimulus and the response of the device to it. A response is paired with
+    the latest stimulus that precedes it, if it comes within the timeout
+    """
+    name: str
+    stimulus: EventMatch
+    response: EventMatch
+    timeout_ns: int
+
+
+class LatencyHistogram:
+    """
+    collects the latency samples of a stimulus/response pair
+    """
+
+    def __init__(self):
+        self.samples: list[int] = []
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def add(self, latency_ns: int):
+        self.samples.append(latency_ns)
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, latency_ns / NS_PER_MS)] += 1
+
+    @property
+    def count(self) -> int:
+        return len(self.samples)
+
+    def percentile(self, p: float) -> int:
+        """
+        nearest rank percentile of the samples, in nanoseconds
+        """
+        if not self.samples:
+            raise ValueError("no samples")
+
+        ordered = sorted(self.samples)
+        rank = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+
+        return ordered[rank]
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "min_ms": min(self.samples) / NS_PER_MS,
+            "p50_ms": self.percentile(50) / NS_PER_MS,
+            "p95_ms": self.percentile(95) / NS_PER_MS,
+            "p99_ms": self.percentile(99) / NS_PER_MS,
+            "max_ms": max(self.samples) / NS_PER_MS,
+            "buckets_ms": dict(zip([*map(str, HISTOGRAM_BUCKETS_MS), "inf"], self.buckets)),
+        }
+
+
+BUTTON_PRESS = EventMatch("io.write", {"pin": ("BUTTON_PLUS", "BUTTON_MINUS"), "value": "LOW"})
+RESET_RELEASE = EventMatch("io.write", {"pin": "RESET", "value": "HIGH"})
+DESIRED_PUBLISH = EventMatch("cloud.publish", {"action": ("GET", "DESIRED_UPDATE"), "response": "ACCEPTED"})
+
+DEFAULT_PAIRS = [
+    LatencyPair("button -> relay", BUTTON_PRESS, EventMatch("gpio", {"pin": "RELAY"}), 10 * 1000 * NS_PER_MS),
+    LatencyPair("desired -> reported", DESIRED_PUBLISH, EventMatch("cloud.message", {"action": "REPORTED_UPDATE"}),
+                30 * 1000 * NS_PER_MS),
+    LatencyPair("reset -> console", RESET_RELEASE, EventMatch("serial"), 10 * 1000 * NS_PER_MS),
+    LatencyPair("reset -> led", RESET_RELEASE, EventMatch("gpio", {"pin": ("LED_R", "LED_G", "LED_B")}),
+                10 * 1000 * NS_PER_MS),
+    LatencyPair("reset -> mqtt get", RESET_RELEASE, EventMatch("cloud.message", {"action": "GET"}),
+                60 * 1000 * NS_PER_MS),
+]
+
+
+class Tracer:
+    """
+    records the stimuli sent to the device and its responses on a single
+    monotonic timeline, and measures the reaction latencies of the device
+    """
+
+    def __init__(self, pairs: Optional[list[LatencyPair]] = None):
+        self._lock = Lock()
+        self._pairs = pairs if pairs is not None else DEFAULT_PAIRS
+        self._pending: dict[str, int] = {}
+        self.timeline: deque[TraceEvent] = deque(maxlen=TIMELINE_LENGTH)
+        self.histograms: dict[str, LatencyHistogram] = {pair.name: LatencyHistogram() for pair in self._pairs}
+        self._listeners: list[Callable[[TraceEvent], None]] = []
+
+    def add_listener(self, listener: Callable[[TraceEvent], None]):
+        """
+        calls the listener with every event recorded from now on
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def stimulus(self, source: str, **attributes):
+        self._record(TraceEvent(monotonic_ns(), EventKind.STIMULUS, source, attributes))
+
+    def response(self, source: str, **attributes):
+        self._record(TraceEvent(monotonic_ns(), EventKind.RESPONSE, source, attributes))
+
+    def events(self, since_ns: int = 0) -> list[TraceEvent]:
+        """
+        events of the timeline recorded after the specified timestamp
+        """
+        with self._lock:
+            return [event for event in self.timeline if event.timestamp_ns >= since_ns]
+
+    def summary(self) -> dict[str, dict]:
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items() if histogram.count}
+
+    def _record(self, event: TraceEvent):
+        with self._lock:
+            listeners = list(self._listeners)
+            self.timeline.append(event)
+            for pair in self._pairs:
+                if event.kind == EventKind.STIMULUS and pair.stimulus.matches(event):
+                    self._pending[pair.name] = event.timestamp_ns
+                elif event.kind == EventKind.RESPONSE and pair.response.matches(event):
+                    start_ns = self._pending.pop(pair.name, None)
+                    if start_ns is not None and event.timestamp_ns - start_ns <= pair.timeout_ns:
+                        latency_ns = event.timestamp_ns - start_ns
+                        LOGGER.debug("latency %s: %.3f ms", pair.name, latency_ns / NS_PER_MS)
+                        self.histograms[pair.name].add(latency_ns)
+
+        for listener in listeners:
+            listener(event)
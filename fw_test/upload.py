@@ -0,0 +1,118 @@
+import mmap
+import uuid
+
+from time import monotonic
+from logging import getLogger
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+from fw_test.firmware import Firmware
+
+LOGGER = getLogger(__name__)
+
+# bytes read from the firmware and sent at a time
+UPLOAD_CHUNK = 16 * 1024
+# progress is logged every this fraction of the upload
+LOG_STEP = 0.1
+
+
+class UploadError(RuntimeError):
+    pass
+
+
+@dataclass(frozen=True)
+class UploadProgress:
+    sent: int
+    total: int
+    elapsed: float
+
+    @property
+    def fraction(self) -> float:
+        return self.sent / self.total if self.total else 1.0
+
+    @property
+    def throughput(self) -> float:
+        """
+        bytes per second
+        """
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+
+@dataclass(frozen=True)
+class UploadStats:
+    """
+    a firmware upload to the local API
+    """
+    size: int
+    sent: int
+    # time to send the body and time to get the response of the device
+    duration: float
+    response_time: float
+    status: Optional[int]
+
+    @property
+    def throughput(self) -> float:
+        """
+        bytes per second
+        """
+        return self.sent / self.duration if self.duration > 0 else 0.0
+
+
+class MultipartUpload:
+    """
+    multipart/form-data body with a single file field, generated in chunks. The firmware
+    is memory mapped from its file, so the image is never copied as a whole
+    """
+
+    def __init__(self, field: str, firmware: Firmware, on_progress: Optional[Callable[[UploadProgress], None]] = None):
+        self._boundary = uuid.uuid4().hex
+        self._on_progress = on_progress
+        self._file = None
+        if firmware.path is not None:
+            self._file = open(firmware.path, "rb")
+            self._data: bytes | mmap.mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = firmware.binary
+
+        filename = f"{firmware.hash}.bin"
+        self._preamble = (f"--{self._boundary}\r\n"
+                          f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                          "Content-Type: application/octet-stream\r\n\r\n").encode("ascii")
+        self._epilogue = f"\r\n--{self._boundary}--\r\n".encode("ascii")
+
+        self.size = len(self._data)
+        self.sent = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self._boundary}"
+
+    def __len__(self) -> int:
+        # requests sends a Content-Length instead of a chunked body
+        return len(self._preamble) + self.size + len(self._epilogue)
+
+    def __iter__(self) -> Iterator[bytes]:
+        self.started = monotonic()
+        logged = 0.0
+        yield self._preamble
+        for offset in range(0, self.size, UPLOAD_CHUNK):
+            chunk = self._data[offset:offset + UPLOAD_CHUNK]
+            yield chunk
+            # the previous chunk was accepted by the socket
+            self.sent += len(chunk)
+            progress = UploadProgress(self.sent, self.size, monotonic() - self.started)
+            if progress.fraction - logged >= LOG_STEP:
+                logged = progress.fraction
+                LOGGER.info("upload %.0f%%, %.1f kB/s", progress.fraction * 100, progress.throughput / 1000)
+            if self._on_progress is not None:
+                self._on_progress(progress)
+        yield self._epilogue
+        self.finished = monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._data.close()
+            self._file.close()
+            self._file = None
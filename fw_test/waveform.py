@@ -0,0 +1,203 @@
+import os
+
+from time import monotonic_ns
+from logging import getLogger
+from threading import Thread, Lock, Event
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Callable, Optional, Self
+
+from fw_test.pins import IOPin, IOValue
+from fw_test.sequence import Step, sleep_until, PLAYER_PRIORITY, NS_PER_SECOND
+
+LOGGER = getLogger(__name__)
+
+MAINS_FREQUENCY = 50
+MAINS_PERIOD_NS = NS_PER_SECOND // MAINS_FREQUENCY
+HALF_PERIOD_NS = MAINS_PERIOD_NS // 2
+
+# width of the current sensor pulse at the peak of each half-wave
+CURRENT_PULSE_NS = 2_000_000
+
+
+class FilPiloteMode(Enum):
+    # no signal on the pilot wire
+    COMFORT = auto()
+    # full mains sine wave
+    ECO = auto()
+    # only the negative half-wave
+    FROST = auto()
+    # only the positive half-wave
+    OFF = auto()
+
+
+@dataclass(frozen=True)
+class Waveform:
+    """
+    periodic pulse train, the steps are repeated every period. Each pin
+    must end the period at the same level it starts with
+    """
+    period_ns: int
+    pins: frozenset[IOPin]
+    steps: tuple[Step, ...]
+
+    def level(self, pin: IOPin, time_ns: int) -> IOValue:
+        """
+        level of a pin at the specified time from the start of the waveform
+        """
+        offset = time_ns % self.period_ns
+        value = IOValue.LOW
+        for step in self.steps:
+            if step.pin == pin:
+                if step.offset_ns > offset:
+                    break
+                value = step.value
+
+        return value
+
+    def merge(self, other: Self) -> Self:
+        """
+        combines two waveforms with the same period that drive different pins
+        """
+        if self.period_ns != other.period_ns:
+            raise ValueError("waveforms must have the same period")
+        if self.pins & other.pins:
+            raise ValueError("waveforms drive the same pins")
+
+        steps = sorted(self.steps + other.steps, key=lambda step: step.offset_ns)
+
+        return Waveform(self.period_ns, self.pins | other.pins, tuple(steps))
+
+
+def _half_waves(pin: IOPin, start_ns: int, width_ns: int) -> list[Step]:
+    return [Step(start_ns, pin, IOValue.HIGH), Step(start_ns + width_ns, pin, IOValue.LOW)]
+
+
+def fil_pilote(mode: FilPiloteMode) -> Waveform:
+    """
+    signal of the optocouplers that detect the positive (P) and negative (N)
+    half-waves on the pilot wire for the specified mode
+    """
+    steps = []
+    if mode in (FilPiloteMode.ECO, FilPiloteMode.OFF):
+        steps += _half_waves(IOPin.FIL_PILOTE_P, 0, HALF_PERIOD_NS)
+    if mode in (FilPiloteMode.ECO, FilPiloteMode.FROST):
+        steps += _half_waves(IOPin.FIL_PILOTE_N, HALF_PERIOD_NS, HALF_PERIOD_NS)
+
+    pins = frozenset({IOPin.FIL_PILOTE_P, IOPin.FIL_PILOTE_N})
+
+    return Waveform(MAINS_PERIOD_NS, pins, tuple(sorted(steps, key=lambda step: step.offset_ns)))
+
+
+def current_feedback(load_on: bool) -> Waveform:
+    """
+    signal of the current sensor, a pulse at the peak of every half-wave while the load draws current
+    """
+    steps = []
+    if load_on:
+        for half_wave in range(2):
+            peak = half_wave * HALF_PERIOD_NS + HALF_PERIOD_NS // 2
+            steps += _half_waves(IOPin.CURRENT_FEEDBACK, peak - CURRENT_PULSE_NS // 2, CURRENT_PULSE_NS)
+
+    return Waveform(MAINS_PERIOD_NS, frozenset({IOPin.CURRENT_FEEDBACK}), tuple(steps))
+
+
+class WaveformPlayer:
+    """
+    repeats waveforms on the outputs from a dedicated real-time thread. Every step
+    is scheduled on an absolute deadline computed from the start of the playback,
+    so the signal never drifts. Changes are applied at the next period boundary
+    """
+
+    def __init__(self, output: Callable[[int, int], None]):
+        self._output = output
+        self._lock = Lock()
+        self._changed = Event()
+        self._stop = False
+        self._waveforms: dict[frozenset[IOPin], Waveform] = {}
+        self._thread = Thread(target=self._thread_entry, daemon=True)
+        self._thread.start()
+
+    def start(self, waveform: Waveform):
+        """
+        starts playing a waveform, replacing the one that drives the same pins
+        """
+        with self._lock:
+            for pins in list(self._waveforms):
+                if pins & waveform.pins:
+                    del self._waveforms[pins]
+            self._waveforms[waveform.pins] = waveform
+        self._changed.set()
+
+    def stop_pins(self, pins: frozenset[IOPin]):
+        """
+        stops the waveforms that drive the specified pins, that are left low
+        """
+        with self._lock:
+            for playing in list(self._waveforms):
+                if playing & pins:
+                    del self._waveforms[playing]
+        self._changed.set()
+
+    def stop(self):
+        self._stop = True
+        self._changed.set()
+        self._thread.join()
+
+    def _merged(self) -> tuple[Optional[Waveform], frozenset[IOPin]]:
+        with self._lock:
+            waveforms = list(self._waveforms.values())
+
+        merged = None
+        for waveform in waveforms:
+            merged = waveform if merged is None else merged.merge(waveform)
+
+        return merged, frozenset().union(*(waveform.pins for waveform in waveforms))
+
+    def _thread_entry(self):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(PLAYER_PRIORITY))
+        except (PermissionError, AttributeError, OSError):
+            LOGGER.debug("real-time priority not allowed for the waveform player")
+
+        driven: frozenset[IOPin] = frozenset()
+        # the playback keeps the same time origin across changes, so the waveforms
+        # that keep playing don't change phase
+        start_ns = None
+        period_ns = None
+        while not self._stop:
+            self._changed.clear()
+            waveform, pins = self._merged()
+
+            # only the pins that are no more driven are left low, the others
+            # are at the level where each period ends and starts
+            for pin in driven - pins:
+                self._output(pin.value, IOValue.LOW.value)
+            driven = pins
+
+            if waveform is None or not waveform.steps:
+                start_ns = None
+                self._changed.wait()
+                continue
+
+            LOGGER.debug("playing waveform on %s", sorted(pin.name for pin in pins))
+            now = monotonic_ns()
+            if start_ns is None or period_ns != waveform.period_ns:
+                start_ns = now
+                period_ns = waveform.period_ns
+                period = 0
+            else:
+                # the change is applied from the next period boundary
+                period = -(-(now - start_ns) // period_ns)
+            while not self._changed.is_set():
+                period_start_ns = start_ns + period * period_ns
+                for step in waveform.steps:
+                    sleep_until(period_start_ns + step.offset_ns)
+                    self._output(step.pin.value, step.value.value)
+
+                period += 1
+                # after a long stall skip the lost periods instead of trying to catch up
+                late_periods = (monotonic_ns() - start_ns) // period_ns - period
+                if late_periods > 0:
+                    LOGGER.debug("waveform player late by %d periods", late_periods)
+                    period += late_periods
@@ -0,0 +1,4 @@
+from fw_test.wifi.wifi import Wifi, WifiSecurityType, ApConfiguration
+from fw_test.wifi.station import StationStage, StationEvent, StationError
+from fw_test.wifi.impairment import Impairment, Timeline, PROFILES, flap
+from fw_test.wifi.dns import DnsTable, DnsFailure
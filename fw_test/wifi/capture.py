@@ -0,0 +1,213 @@
+import json
+import socket
+import struct
+import ctypes
+
+from time import time_ns, monotonic_ns
+from logging import getLogger
+from threading import Thread, Event, Lock
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+LOGGER = getLogger(__name__)
+
+ETH_P_ALL = 0x0003
+# from asm-generic/socket.h, not exported by the socket module
+SO_ATTACH_FILTER = 26
+SO_TIMESTAMPNS = 35
+# this option gives the old kernel timespec, two native longs: 8 bytes on 32-bit
+# Raspberry Pi OS whatever the size of time_t in user space
+TIMESPEC = struct.Struct("@ll")
+
+SNAPLEN = 65535
+LINKTYPE_ETHERNET = 1
+# pcap with nanosecond timestamps
+PCAP_MAGIC_NS = 0xA1B23C4D
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_RECORD = struct.Struct("<IIII")
+
+# classic BPF instructions
+BPF_INSTRUCTION = struct.Struct("@HBBI")
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_JEQ_K = 0x15
+BPF_RET_K = 0x06
+
+
+@dataclass(frozen=True)
+class CapturedPacket:
+    # time the packet was received by the kernel
+    timestamp_ns: int
+    data: bytes
+
+
+def mac_filter(mac: str) -> list[tuple[int, int, int, int]]:
+    """
+    BPF program that accepts the Ethernet frames sent or received by the MAC address
+    """
+    address = bytes.fromhex(mac.replace(":", "").replace("-", ""))
+    high, low = struct.unpack("!HI", address)
+
+    return [
+        # destination address
+        (BPF_LD_W_ABS, 0, 0, 2),
+        (BPF_JEQ_K, 0, 2, low),
+        (BPF_LD_H_ABS, 0, 0, 0),
+        (BPF_JEQ_K, 4, 0, high),
+        # source address
+        (BPF_LD_W_ABS, 0, 0, 8),
+        (BPF_JEQ_K, 0, 3, low),
+        (BPF_LD_H_ABS, 0, 0, 6),
+        (BPF_JEQ_K, 0, 1, high),
+        (BPF_RET_K, 0, 0, SNAPLEN),
+        (BPF_RET_K, 0, 0, 0),
+    ]
+
+
+def attach_filter(sock: socket.socket, program: list[tuple[int, int, int, int]]):
+    instructions = ctypes.create_string_buffer(b"".join(BPF_INSTRUCTION.pack(*i) for i in program))
+    # struct sock_fprog, the buffer must stay alive until the kernel copied it
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                    struct.pack("@HP", len(program), ctypes.addressof(instructions)))
+
+
+class PacketRing:
+    """
+    last packets captured, the oldest ones are discarded once the size is exceeded
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.discarded = 0
+        self._packets: deque[CapturedPacket] = deque()
+        self._lock = Lock()
+
+    def add(self, packet: CapturedPacket):
+        with self._lock:
+            self._packets.append(packet)
+            self.size += len(packet.data)
+            while self.size > self.max_bytes:
+                self.size -= len(self._packets.popleft().data)
+                self.discarded += 1
+
+    def clear(self):
+        with self._lock:
+            self._packets.clear()
+            self.size = 0
+            self.discarded = 0
+
+    def snapshot(self) -> list[CapturedPacket]:
+        with self._lock:
+            return list(self._packets)
+
+
+def write_pcap(path: str, packets: list[CapturedPacket], clock_offset_ns: int = 0) -> list[dict]:
+    """
+    writes the packets to a pcap file, returns the index of the file: offset, length
+    and timestamps of each packet. clock_offset_ns converts the timestamps of the
+    packets to the monotonic clock used by the tracer
+    """
+    index = []
+    with open(path, "wb") as f:
+        f.write(PCAP_HEADER.pack(PCAP_MAGIC_NS, 2, 4, 0, 0, SNAPLEN, LINKTYPE_ETHERNET))
+        for number, packet in enumerate(packets):
+            index.append({
+                "packet": number + 1,
+                "offset": f.tell(),
+                "length": len(packet.data),
+                "timestamp_ns": packet.timestamp_ns,
+                "monotonic_ns": packet.timestamp_ns - clock_offset_ns,
+            })
+            seconds, nanoseconds = divmod(packet.timestamp_ns, 1_000_000_000)
+            f.write(PCAP_RECORD.pack(seconds, nanoseconds, len(packet.data), len(packet.data)))
+            f.write(packet.data)
+
+    return index
+
+
+def _timestamp_ns(ancillary: list[tuple[int, int, bytes]]) -> int:
+    """
+    time the kernel received the packet, the current time if it is not given
+    """
+    for level, kind, value in ancillary:
+        if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS and len(value) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(value)
+            return seconds * 1_000_000_000 + nanoseconds
+
+    return time_ns()
+
+
+class PacketCapture:
+    """
+    captures in memory the traffic of a device on an interface. The filter runs in the
+    kernel, so only the packets of the device reach the process, and nothing is written
+    to disk until the ring is dumped
+    """
+
+    def __init__(self, sock: socket.socket, ifname: str, mac: str, max_bytes: int):
+        self._sock = sock
+        self._ifname = ifname
+        self._mac = mac
+        self._stop = Event()
+        self.ring = PacketRing(max_bytes)
+
+        # the socket receives nothing until bound, so no packet passes unfiltered
+        attach_filter(sock, mac_filter(mac))
+        sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        sock.bind((ifname, ETH_P_ALL))
+        sock.settimeout(0.5)
+        self._clock_offset_ns = time_ns() - monotonic_ns()
+
+        self._thread = Thread(target=self._thread_entry, daemon=True)
+        self._thread.start()
+        LOGGER.debug("capturing %s on %s (%d bytes)", mac, ifname, max_bytes)
+
+    def dump(self, path: str) -> Optional[str]:
+        """
+        writes the captured packets to a pcap file, along with a JSON index of their
+        timestamps. Returns the path of the index, None if nothing was captured
+        """
+        packets = self.ring.snapshot()
+        if not packets:
+            return None
+
+        index = write_pcap(path, packets, self._clock_offset_ns)
+        index_path = path.removesuffix(".pcap") + ".index.json"
+        with open(index_path, "w") as f:
+            json.dump({
+                "interface": self._ifname,
+                "mac": self._mac,
+                "discarded": self.ring.discarded,
+                "packets": index,
+            }, f, indent=1)
+        LOGGER.info("dumped %d packets to %s", len(packets), path)
+
+        return index_path
+
+    def clear(self):
+        self.ring.clear()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._sock.close()
+
+    def _thread_entry(self):
+        ancillary_size = socket.CMSG_SPACE(TIMESPEC.size)
+        while not self._stop.is_set():
+            try:
+                data, ancillary, _, _ = self._sock.recvmsg(SNAPLEN, ancillary_size)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                LOGGER.error("capture on %s failed: %s", self._ifname, e)
+                return
+
+            try:
+                self.ring.add(CapturedPacket(_timestamp_ns(ancillary), data))
+            except Exception as e:
+                # a packet that can't be kept must not stop the capture
+                LOGGER.exception("capture on %s dropped a packet: %s", self._ifname, e)
+
@@ -0,0 +1,212 @@
+import struct
+import asyncio
+
+from logging import getLogger
+from dataclasses import dataclass
+from enum import IntEnum
+from ipaddress import IPv4Address, IPv4Interface
+from typing import Callable, Optional
+
+LOGGER = getLogger(__name__)
+
+DHCP_SERVER_PORT = 67
+DHCP_CLIENT_PORT = 68
+
+# lease time announced to the devices, in seconds
+LEASE_TIME = 12 * 3600
+
+# the first addresses of the network are not assigned
+POOL_OFFSET = 10
+
+BOOTP_HEADER = struct.Struct("!BBBBIHH4s4s4s4s16s64s128s")
+MAGIC_COOKIE = b"\x63\x82\x53\x63"
+BOOTREQUEST = 1
+BOOTREPLY = 2
+
+OPTION_PAD = 0
+OPTION_SUBNET_MASK = 1
+OPTION_ROUTER = 3
+OPTION_DNS = 6
+OPTION_HOSTNAME = 12
+OPTION_REQUESTED_IP = 50
+OPTION_LEASE_TIME = 51
+OPTION_MESSAGE_TYPE = 53
+OPTION_SERVER_ID = 54
+OPTION_END = 255
+
+ANY_ADDRESS = IPv4Address("0.0.0.0")
+
+
+class MessageType(IntEnum):
+    DISCOVER = 1
+    OFFER = 2
+    REQUEST = 3
+    DECLINE = 4
+    ACK = 5
+    NAK = 6
+    RELEASE = 7
+
+
+@dataclass(frozen=True)
+class DhcpPacket:
+    op: int
+    xid: int
+    flags: int
+    ciaddr: IPv4Address
+    yiaddr: IPv4Address
+    chaddr: bytes
+    options: dict[int, bytes]
+
+    @property
+    def mac(self) -> str:
+        return ":".join(f"{b:02x}" for b in self.chaddr[:6])
+
+    @property
+    def message_type(self) -> Optional[int]:
+        value = self.options.get(OPTION_MESSAGE_TYPE)
+        return value[0] if value else None
+
+    @classmethod
+    def parse(cls, data: bytes) -> "DhcpPacket":
+        if len(data) < BOOTP_HEADER.size + len(MAGIC_COOKIE):
+            raise ValueError("packet too short")
+
+        op, _, _, _, xid, _, flags, ciaddr, yiaddr, _, _, chaddr, _, _ = BOOTP_HEADER.unpack_from(data)
+        offset = BOOTP_HEADER.size
+        if data[offset:offset + len(MAGIC_COOKIE)] != MAGIC_COOKIE:
+            raise ValueError("not a DHCP packet")
+
+        offset += len(MAGIC_COOKIE)
+        options = {}
+        while offset < len(data):
+            code = data[offset]
+            if code == OPTION_END:
+                break
+            if code == OPTION_PAD:
+                offset += 1
+                continue
+            length = data[offset + 1]
+            options[code] = data[offset + 2:offset + 2 + length]
+            offset += 2 + length
+
+        return cls(op, xid, flags, IPv4Address(ciaddr), IPv4Address(yiaddr), chaddr, options)
+
+    def serialize(self) -> bytes:
+        header = BOOTP_HEADER.pack(self.op, 1, 6, 0, self.xid, 0, self.flags, self.ciaddr.packed,
+                                   self.yiaddr.packed, ANY_ADDRESS.packed, ANY_ADDRESS.packed, self.chaddr, b"", b"")
+        options = b"".join(bytes([code, len(value)]) + value for code, value in self.options.items())
+
+        return header + MAGIC_COOKIE + options + bytes([OPTION_END])
+
+
+@dataclass(frozen=True)
+class Lease:
+    mac: str
+    address: IPv4Address
+    hostname: Optional[str]
+
+
+class DhcpServer(asyncio.DatagramProtocol):
+    """
+    DHCP server for the devices connected to the AP, it is also the router
+    and the DNS server of the network. The lease callback is invoked as soon
+    as the ACK is sent
+    """
+
+    def __init__(self, interface: IPv4Interface, on_lease: Callable[[Lease], None], lease_time: int = LEASE_TIME):
+        self._interface = interface
+        self._on_lease = on_lease
+        self._lease_time = lease_time
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._leases: dict[str, IPv4Address] = {}
+        hosts = list(interface.network.hosts())
+        self._pool = [host for host in hosts[POOL_OFFSET - 1:] if host != interface.ip]
+
+    @property
+    def leases(self) -> dict[str, IPv4Address]:
+        return dict(self._leases)
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self._transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            request = DhcpPacket.parse(data)
+        except (ValueError, struct.error) as e:
+            LOGGER.debug("invalid DHCP packet from %s: %s", addr, e)
+            return
+
+        if request.op != BOOTREQUEST:
+            return
+
+        match request.message_type:
+            case MessageType.DISCOVER:
+                address = self._allocate(request.mac, self._requested(request))
+                if address is not None:
+                    self._reply(request, MessageType.OFFER, address)
+            case MessageType.REQUEST:
+                self._request(request)
+            case MessageType.RELEASE | MessageType.DECLINE:
+                LOGGER.debug("DHCP release from %s", request.mac)
+                self._leases.pop(request.mac, None)
+
+    def _request(self, request: DhcpPacket):
+        server_id = request.options.get(OPTION_SERVER_ID)
+        if server_id is not None and server_id != self._interface.ip.packed:
+            # the device accepted the offer of another server
+            return
+
+        requested = self._requested(request) or request.ciaddr
+        if self._allocate(request.mac, requested) != requested:
+            LOGGER.info("DHCP NAK to %s for %s", request.mac, requested)
+            self._reply(request, MessageType.NAK, ANY_ADDRESS)
+            return
+
+        self._reply(request, MessageType.ACK, requested)
+        hostname = request.options.get(OPTION_HOSTNAME)
+        lease = Lease(request.mac, requested, hostname.decode("ascii", errors="replace") if hostname else None)
+        LOGGER.debug("DHCP lease %s to %s", lease.address, lease.mac)
+        self._on_lease(lease)
+
+    def _allocate(self, mac: str, requested: Optional[IPv4Address]) -> Optional[IPv4Address]:
+        """
+        address for the device, the one it already has or asks for if possible
+        """
+        if mac in self._leases:
+            return self._leases[mac]
+
+        used = set(self._leases.values())
+        if requested in self._pool and requested not in used:
+            address = requested
+        else:
+            address = next((host for host in self._pool if host not in used), None)
+            if address is None:
+                LOGGER.warning("DHCP pool exhausted")
+                return None
+
+        self._leases[mac] = address
+
+        return address
+
+    @staticmethod
+    def _requested(request: DhcpPacket) -> Optional[IPv4Address]:
+        value = request.options.get(OPTION_REQUESTED_IP)
+        return IPv4Address(value) if value and len(value) == 4 else None
+
+    def _reply(self, request: DhcpPacket, message_type: MessageType, address: IPv4Address):
+        options = {OPTION_MESSAGE_TYPE: bytes([message_type]), OPTION_SERVER_ID: self._interface.ip.packed}
+        if message_type != MessageType.NAK:
+            options |= {
+                OPTION_LEASE_TIME: struct.pack("!I", self._lease_time),
+                OPTION_SUBNET_MASK: self._interface.netmask.packed,
+                OPTION_ROUTER: self._interface.ip.packed,
+                OPTION_DNS: self._interface.ip.packed,
+            }
+        reply = DhcpPacket(BOOTREPLY, request.xid, request.flags, request.ciaddr, address, request.chaddr, options)
+
+        # the device has no address until it gets the ACK, unless it is renewing
+        if request.ciaddr != ANY_ADDRESS and message_type != MessageType.NAK:
+            destination = str(request.ciaddr)
+        else:
+            destination = "255.255.255.255"
+        self._transport.sendto(reply.serialize(), (destination, DHCP_CLIENT_PORT))
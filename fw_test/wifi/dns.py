@@ -0,0 +1,201 @@
+import struct
+import asyncio
+
+from time import monotonic_ns
+from logging import getLogger
+from threading import Lock
+from ipaddress import IPv4Address
+from enum import Enum, auto
+from typing import Optional
+
+from fw_test.trace import LatencyHistogram
+
+LOGGER = getLogger(__name__)
+
+DNS_PORT = 53
+DNS_HEADER = struct.Struct("!HHHHHH")
+ANSWER = struct.Struct("!HHHIH")
+
+FLAG_RESPONSE = 0x8000
+FLAG_RECURSION_DESIRED = 0x0100
+FLAG_RECURSION_AVAILABLE = 0x0080
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+
+TYPE_A = 1
+CLASS_IN = 1
+# pointer to the name of the question, that always starts after the header
+QUESTION_NAME_POINTER = 0xC000 | DNS_HEADER.size
+
+TTL = 60
+UPSTREAM_TIMEOUT = 2
+
+
+class DnsFailure(Enum):
+    # the name doesn't exist
+    NXDOMAIN = auto()
+    # the server failed to resolve the name
+    SERVFAIL = auto()
+    # no answer at all
+    TIMEOUT = auto()
+
+
+class DnsTable:
+    """
+    answers of the DNS server that replace the ones of the upstream resolver, a
+    name can be resolved to a local address (e.g. a stand-in of a cloud service) or fail
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._entries: dict[str, IPv4Address | DnsFailure] = {}
+
+    def set(self, name: str, answer: str | IPv4Address | DnsFailure):
+        with self._lock:
+            self._entries[_normalize(name)] = answer if isinstance(answer, DnsFailure) else IPv4Address(answer)
+
+    def remove(self, name: str):
+        with self._lock:
+            self._entries.pop(_normalize(name), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def lookup(self, name: str) -> Optional[IPv4Address | DnsFailure]:
+        with self._lock:
+            return self._entries.get(_normalize(name))
+
+
+def _normalize(name: str) -> str:
+    return name.lower().rstrip(".")
+
+
+def parse_question(data: bytes) -> tuple[int, int, str, int, int]:
+    """
+    id, flags, name, type and end offset of the question of a query
+    """
+    query_id, flags, questions, _, _, _ = DNS_HEADER.unpack_from(data)
+    if questions != 1:
+        raise ValueError("only queries with one question are supported")
+
+    labels = []
+    offset = DNS_HEADER.size
+    while data[offset]:
+        length = data[offset]
+        if length & 0xC0:
+            raise ValueError("compressed names are not supported in questions")
+        labels.append(data[offset + 1:offset + 1 + length].decode("ascii"))
+        offset += 1 + length
+    offset += 1
+    qtype, _ = struct.unpack_from("!HH", data, offset)
+
+    return query_id, flags, ".".join(labels), qtype, offset + 4
+
+
+def build_response(query: bytes, question_end: int, rcode: int = 0, address: Optional[IPv4Address] = None) -> bytes:
+    query_id, flags, _, _, _, _ = DNS_HEADER.unpack_from(query)
+    flags = FLAG_RESPONSE | (flags & FLAG_RECURSION_DESIRED) | FLAG_RECURSION_AVAILABLE | rcode
+    answers = 1 if address is not None else 0
+    response = DNS_HEADER.pack(query_id, flags, 1, answers, 0, 0) + query[DNS_HEADER.size:question_end]
+    if address is not None:
+        response += ANSWER.pack(QUESTION_NAME_POINTER, TYPE_A, CLASS_IN, TTL, 4) + address.packed
+
+    return response
+
+
+def upstream_resolver() -> str:
+    """
+    first name server of the system
+    """
+    try:
+        with open("/etc/resolv.conf") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "nameserver":
+                    return fields[1]
+    except OSError:
+        pass
+
+    return "8.8.8.8"
+
+
+class _UpstreamQuery(asyncio.DatagramProtocol):
+    def __init__(self, future: asyncio.Future):
+        self._future = future
+
+    def datagram_received(self, data: bytes, addr):
+        if not self._future.done():
+            self._future.set_result(data)
+
+    def error_received(self, exc: Exception):
+        if not self._future.done():
+            self._future.set_exception(exc)
+
+
+class DnsServer(asyncio.DatagramProtocol):
+    """
+    DNS server for the devices connected to the AP. Names of the table are answered
+    locally, the others are forwarded to the upstream resolver. The time taken to
+    answer is recorded for each name
+    """
+
+    def __init__(self, table: DnsTable, upstream: Optional[str] = None):
+        self._table = table
+        self._upstream = upstream or upstream_resolver()
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        # the loop keeps only weak references to the tasks
+        self._forwards: set[asyncio.Task] = set()
+        self.latencies: dict[str, LatencyHistogram] = {}
+
+    def connection_made(self, transport: asyncio.DatagramTransport):
+        self._transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        received_ns = monotonic_ns()
+        try:
+            _, _, name, qtype, question_end = parse_question(data)
+        except (ValueError, IndexError, UnicodeDecodeError, struct.error) as e:
+            LOGGER.debug("invalid DNS query from %s: %s", addr, e)
+            return
+
+        answer = self._table.lookup(name)
+        match answer:
+            case None:
+                task = asyncio.ensure_future(self._forward(data, addr, name, received_ns))
+                self._forwards.add(task)
+                task.add_done_callback(self._forwards.discard)
+                return
+            case DnsFailure.TIMEOUT:
+                LOGGER.debug("DNS %s: no answer", name)
+                return
+            case DnsFailure.NXDOMAIN:
+                response = build_response(data, question_end, rcode=RCODE_NXDOMAIN)
+            case DnsFailure.SERVFAIL:
+                response = build_response(data, question_end, rcode=RCODE_SERVFAIL)
+            case _:
+                # other record types exist but have no value
+                response = build_response(data, question_end, address=answer if qtype == TYPE_A else None)
+
+        LOGGER.debug("DNS %s: %s", name, answer)
+        self._send(response, addr, name, received_ns)
+
+    async def _forward(self, query: bytes, addr, name: str, received_ns: int):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UpstreamQuery(future),
+                                                           remote_addr=(self._upstream, DNS_PORT))
+        try:
+            transport.sendto(query)
+            response = await asyncio.wait_for(future, UPSTREAM_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            LOGGER.debug("DNS %s: upstream failed: %s", name, e)
+            return
+        finally:
+            transport.close()
+
+        self._send(response, addr, name, received_ns)
+
+    def _send(self, response: bytes, addr, name: str, received_ns: int):
+        self._transport.sendto(response, addr)
+        self.latencies.setdefault(_normalize(name), LatencyHistogram()).add(monotonic_ns() - received_ns)
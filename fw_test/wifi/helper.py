@@ -0,0 +1,179 @@
+"""
+privileged helper that applies the network configuration of the fixture,
+receives the transactions of NetworkControl on a unix socket
+
+run as: python -m fw_test.wifi.helper <socket path> <uid of the client>
+"""
+import os
+import sys
+import json
+import socket
+import subprocess
+
+from logging import getLogger
+from typing import Optional
+
+from fw_test.wifi.netctl import NetworkControlError
+from fw_test.wifi.netlink import Rtnetlink, Nl80211, IFTYPES, interface_exists
+
+LOGGER = getLogger(__name__)
+
+
+class Transaction:
+    """
+    executes the operations of a transaction on the helper side,
+    recording how to undo each one of them
+    """
+
+    def __init__(self, rtnl: Rtnetlink, nl80211: Optional[Nl80211]):
+        self._rtnl = rtnl
+        self._nl80211 = nl80211
+        self._undo = []
+
+    def run(self, operations: list[dict]):
+        try:
+            for operation in operations:
+                getattr(self, "_" + operation["op"])(**{k: v for k, v in operation.items() if k != "op"})
+        except Exception:
+            self.rollback()
+            raise
+
+    def rollback(self):
+        for undo in reversed(self._undo):
+            try:
+                undo()
+            except Exception as e:
+                LOGGER.warning("rollback failed: %s", e)
+
+    def _link_set(self, ifname: str, up: bool):
+        was_up = bool(self._rtnl.link_flags(ifname) & 1)
+        self._rtnl.link_set(ifname, up)
+        self._undo.append(lambda: self._rtnl.link_set(ifname, was_up))
+
+    def _address_add(self, ifname: str, address: str):
+        self._rtnl.address_add(ifname, address)
+        self._undo.append(lambda: self._rtnl.address_del(ifname, address))
+
+    def _address_flush(self, ifname: str):
+        removed = self._rtnl.address_flush(ifname)
+
+        def undo():
+            for address in removed:
+                self._rtnl.address_add(ifname, str(address))
+
+        self._undo.append(undo)
+
+    def _route_flush(self, ifname: str):
+        # routes are not restored, the ones that matter come back with the addresses
+        self._rtnl.route_flush(ifname)
+
+    def _set_type(self, ifname: str, type: str):
+        previous = self._wireless().interface_type(ifname)
+        if previous == IFTYPES[type]:
+            return
+
+        # the type of an interface can't be changed while it is up
+        self._link_set(ifname, False)
+        self._wireless().set_interface_type(ifname, IFTYPES[type])
+        self._undo.append(lambda: self._wireless().set_interface_type(ifname, previous))
+
+    def _create_interface(self, ifname: str, parent: str, type: str):
+        if interface_exists(ifname):
+            return
+
+        self._wireless().new_interface(self._wireless().interface_wiphy(parent), ifname, IFTYPES[type])
+        self._undo.append(lambda: self._wireless().del_interface(ifname))
+
+    def _delete_interface(self, ifname: str):
+        if interface_exists(ifname):
+            self._wireless().del_interface(ifname)
+
+    def _connect(self, ifname: str, ssid: str):
+        self._wireless().connect(ifname, ssid)
+        self._undo.append(lambda: self._wireless().disconnect(ifname))
+
+    def _disconnect(self, ifname: str):
+        self._wireless().disconnect(ifname)
+
+    def _firewall(self, rules: str):
+        saved = subprocess.run(["iptables-save"], check=True, capture_output=True, encoding="utf-8").stdout
+        subprocess.run(["iptables-restore"], input=rules, check=True, capture_output=True, encoding="utf-8")
+        self._undo.append(lambda: subprocess.run(["iptables-restore"], input=saved, check=True, encoding="utf-8"))
+
+    def _qdisc(self, ifname: str, netem: Optional[str], previous: Optional[str]):
+        _set_netem(ifname, netem)
+        self._undo.append(lambda: _set_netem(ifname, previous))
+
+    def _wireless(self) -> Nl80211:
+        if self._nl80211 is None:
+            raise NetworkControlError("nl80211 is not available")
+
+        return self._nl80211
+
+
+def _set_netem(ifname: str, netem: Optional[str]):
+    if netem:
+        subprocess.run(["tc", "qdisc", "replace", "dev", ifname, "root", "netem"] + netem.split(),
+                       check=True, capture_output=True, encoding="utf-8")
+    else:
+        # fails if there is no root queue to remove, that is what we want anyway
+        subprocess.run(["tc", "qdisc", "del", "dev", ifname, "root"], capture_output=True)
+
+
+def _open_socket(type: str, address: str, port: int, ifname: str, broadcast: bool) -> socket.socket:
+    if type == "packet":
+        # the client attaches its filter before binding to ifname
+        return socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM if type == "tcp" else socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, ifname.encode("ascii"))
+        if broadcast:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.bind((address, port))
+        if type == "tcp":
+            sock.listen()
+    except OSError:
+        sock.close()
+        raise
+
+    return sock
+
+
+def serve(path: str, uid: int):
+    rtnl = Rtnetlink()
+    try:
+        nl80211 = Nl80211()
+    except OSError:
+        nl80211 = None
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chown(path, uid, -1)
+    server.listen(1)
+    print("ready", flush=True)
+
+    connection, _ = server.accept()
+    server.close()
+    with connection, connection.makefile("r", encoding="utf-8") as reader:
+        for line in reader:
+            request = json.loads(line)
+            sockets = []
+            try:
+                if "sockets" in request:
+                    sockets = [_open_socket(**spec) for spec in request["sockets"]]
+                else:
+                    Transaction(rtnl, nl80211).run(request["transaction"])
+                response = {"ok": True}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+            data = json.dumps(response).encode("utf-8") + b"\n"
+            socket.send_fds(connection, [data], [s.fileno() for s in sockets])
+            for s in sockets:
+                s.close()
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], int(sys.argv[2]))
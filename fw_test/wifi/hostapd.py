@@ -0,0 +1,261 @@
+import os
+import socket
+import tempfile
+import subprocess
+
+from itertools import count
+from time import monotonic, sleep
+from logging import getLogger
+from threading import Thread, Lock, Event
+from typing import Callable, Optional
+
+LOGGER = getLogger(__name__)
+
+# time hostapd takes to bring up the BSS
+AP_ENABLE_TIMEOUT = 10
+REQUEST_TIMEOUT = 5
+
+# options that are fixed for the whole life of the daemon,
+# all the others are changed with SET on the control interface
+STATIC_OPTIONS = ("interface", "driver", "ctrl_interface", "ctrl_interface_group")
+
+_client_ids = count()
+
+
+class HostapdError(RuntimeError):
+    pass
+
+
+class _ControlSocket:
+    """
+    connection to the hostapd control interface
+    """
+
+    def __init__(self, path: str, directory: str):
+        self._local = os.path.join(directory, f"client-{os.getpid()}-{next(_client_ids)}")
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._local)
+        self._socket.connect(path)
+
+    def request(self, command: str, timeout: float = REQUEST_TIMEOUT) -> str:
+        self._socket.settimeout(timeout)
+        self._socket.send(command.encode("utf-8"))
+        while True:
+            reply = self._socket.recv(4096).decode("utf-8", errors="replace")
+            # unsolicited events can arrive on an attached socket before the reply
+            if not reply.startswith("<"):
+                return reply.strip()
+
+    def receive(self, timeout: float) -> Optional[str]:
+        self._socket.settimeout(timeout)
+        try:
+            return self._socket.recv(4096).decode("utf-8", errors="replace").strip()
+        except socket.timeout:
+            return None
+
+    def close(self):
+        self._socket.close()
+        os.unlink(self._local)
+
+
+class Hostapd:
+    """
+    long-lived hostapd instance, started once and then driven through its
+    control interface. Events (AP-ENABLED, AP-STA-CONNECTED, ...) are
+    delivered to the registered listeners
+    """
+
+    def __init__(self, interface: str):
+        self._interface = interface
+        self._lock = Lock()
+        self._directory = tempfile.mkdtemp(prefix="fw_test-hostapd-")
+        self._process: Optional[subprocess.Popen] = None
+        self._control: Optional[_ControlSocket] = None
+        self._monitor: Optional[_ControlSocket] = None
+        self._monitor_thread: Optional[Thread] = None
+        self._listeners: list[Callable[[str], None]] = []
+        self._output_listeners: list[Callable[[str], None]] = []
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """
+        registers a function called with every event of hostapd, without the priority prefix
+        """
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str], None]):
+        with self._lock:
+            self._listeners.remove(listener)
+
+    def add_output_listener(self, listener: Callable[[str], None]):
+        """
+        registers a function called with every line of the debug output, that
+        reports things that have no event (e.g. the 802.11 association)
+        """
+        with self._lock:
+            self._output_listeners.append(listener)
+
+    def configure(self, config: dict, timeout: float = AP_ENABLE_TIMEOUT):
+        """
+        applies a configuration to the BSS and waits until it is enabled,
+        the daemon is started the first time
+        """
+        with self._waiting("AP-ENABLED") as enabled:
+            if not self.running:
+                self._start(config)
+            else:
+                # hostapd refuses to disable an AP that is already disabled
+                if self.status().get("state") != "DISABLED":
+                    self._check(self.request("DISABLE"), "DISABLE")
+                for key, value in config.items():
+                    if key not in STATIC_OPTIONS:
+                        self._check(self.request(f"SET {key} {value}"), f"SET {key}")
+                self._check(self.request("ENABLE"), "ENABLE")
+
+            # the event may have been sent before the monitor was attached,
+            # any later one is received since the monitor is attached now
+            if self.status().get("state") != "ENABLED" and not enabled.wait(timeout):
+                raise TimeoutError("hostapd did not enable the AP")
+
+        LOGGER.info("AP enabled on %s", self._interface)
+
+    def disable(self, timeout: float = AP_ENABLE_TIMEOUT):
+        """
+        stops the BSS, the daemon keeps running
+        """
+        if not self.running or self.status().get("state") == "DISABLED":
+            return
+
+        with self._waiting("AP-DISABLED") as disabled:
+            self._check(self.request("DISABLE"), "DISABLE")
+            if not disabled.wait(timeout):
+                raise TimeoutError("hostapd did not disable the AP")
+
+        LOGGER.info("AP disabled on %s", self._interface)
+
+    def status(self) -> dict[str, str]:
+        reply = self.request("STATUS")
+
+        return dict(line.split("=", 1) for line in reply.splitlines() if "=" in line)
+
+    def request(self, command: str) -> str:
+        with self._lock:
+            if self._control is None:
+                raise HostapdError("hostapd is not running")
+
+            LOGGER.debug("hostapd request: %s", command)
+            return self._control.request(command)
+
+    def stop(self):
+        """
+        terminates the daemon
+        """
+        if self.running:
+            try:
+                self.request("TERMINATE")
+                self._process.wait(timeout=REQUEST_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired):
+                self._process.terminate()
+                self._process.wait()
+
+        with self._lock:
+            for control in (self._control, self._monitor):
+                if control is not None:
+                    control.close()
+            self._control = self._monitor = None
+        if self._monitor_thread is not None:
+            self._monitor_thread.join()
+            self._monitor_thread = None
+
+    def _start(self, config: dict):
+        config_path = os.path.join(self._directory, "hostapd.conf")
+        with open(config_path, "w") as f:
+            for key, value in config.items():
+                print(f"{key}={value}", file=f)
+            print(f"ctrl_interface={self._directory}", file=f)
+            print(f"ctrl_interface_group={os.getgid()}", file=f)
+
+        LOGGER.info("start hostapd")
+        command = ["hostapd", "-dd", config_path]
+        if os.geteuid() != 0:
+            command = ["sudo", "-n"] + command
+        self._process = subprocess.Popen(command, stderr=subprocess.STDOUT, stdout=subprocess.PIPE, encoding="utf-8")
+        Thread(target=self._output_entry, args=(self._process,), daemon=True).start()
+
+        path = os.path.join(self._directory, self._interface)
+        deadline = monotonic() + REQUEST_TIMEOUT
+        while not os.path.exists(path):
+            if not self.running or monotonic() > deadline:
+                raise HostapdError("hostapd failed to start")
+            sleep(0.05)
+
+        with self._lock:
+            self._control = _ControlSocket(path, self._directory)
+            self._monitor = _ControlSocket(path, self._directory)
+            self._check(self._monitor.request("ATTACH"), "ATTACH")
+        self._monitor_thread = Thread(target=self._monitor_entry, args=(self._monitor,), daemon=True)
+        self._monitor_thread.start()
+
+    def _waiting(self, event: str):
+        return _EventWaiter(self, event)
+
+    def _monitor_entry(self, monitor: _ControlSocket):
+        while self.running and self._monitor is monitor:
+            try:
+                message = monitor.receive(timeout=0.5)
+            except OSError:
+                break
+            if message is None:
+                continue
+
+            # strip the priority, e.g. "<3>AP-ENABLED"
+            if message.startswith("<"):
+                message = message[message.index(">") + 1:]
+            LOGGER.debug("hostapd event: %s", message)
+
+            with self._lock:
+                listeners = list(self._listeners)
+            for listener in listeners:
+                listener(message)
+
+    @staticmethod
+    def _check(reply: str, command: str):
+        if reply != "OK":
+            raise HostapdError(f"hostapd {command} failed: {reply}")
+
+    def _output_entry(self, process: subprocess.Popen):
+        for line in process.stdout:
+            line = line.strip()
+            LOGGER.debug("hostapd: %s", line)
+            with self._lock:
+                listeners = list(self._output_listeners)
+            for listener in listeners:
+                listener(line)
+
+        LOGGER.debug("hostapd terminated")
+
+
+class _EventWaiter:
+    """
+    context manager that listens for an event while a command is in progress
+    """
+
+    def __init__(self, hostapd: Hostapd, event: str):
+        self._hostapd = hostapd
+        self._name = event
+        self._event = Event()
+
+    def _listener(self, message: str):
+        if message.split()[0] == self._name:
+            self._event.set()
+
+    def __enter__(self) -> Event:
+        self._hostapd.add_listener(self._listener)
+        return self._event
+
+    def __exit__(self, *exc):
+        self._hostapd.remove_listener(self._listener)
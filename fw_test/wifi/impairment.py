@@ -0,0 +1,170 @@
+from time import monotonic
+from logging import getLogger
+from threading import Thread, Event
+from dataclasses import dataclass
+from functools import cache
+from types import MappingProxyType
+from typing import Callable, Optional
+
+from fw_test.wifi import netctl
+
+LOGGER = getLogger(__name__)
+
+# port of the AWS IoT MQTT broker
+MQTT_PORT = 8883
+DNS_PORT = 53
+
+
+@dataclass(frozen=True)
+class Impairment:
+    """
+    network conditions imposed on the traffic of the devices connected to the AP.
+    Delay, loss and rate are applied to the packets sent to the devices
+    """
+    name: str
+    loss_percent: float = 0
+    delay_ms: int = 0
+    jitter_ms: int = 0
+    rate_kbit: Optional[int] = None
+    # DNS queries get no answer, while the rest of internet works
+    block_dns: bool = False
+    # TCP ports of internet that can't be reached
+    block_ports: tuple[int, ...] = ()
+    # nothing is forwarded to internet
+    block_all: bool = False
+
+    def netem_arguments(self) -> Optional[str]:
+        arguments = []
+        if self.delay_ms:
+            arguments.append(f"delay {self.delay_ms}ms" + (f" {self.jitter_ms}ms" if self.jitter_ms else ""))
+        if self.loss_percent:
+            arguments.append(f"loss {self.loss_percent}%")
+        if self.rate_kbit:
+            arguments.append(f"rate {self.rate_kbit}kbit")
+
+        return " ".join(arguments) or None
+
+
+PROFILES = {impairment.name: impairment for impairment in [
+    Impairment("lossy", loss_percent=10),
+    Impairment("very-lossy", loss_percent=40),
+    Impairment("slow", delay_ms=300, jitter_ms=100),
+    Impairment("narrow", rate_kbit=64),
+    Impairment("dns-down", block_dns=True),
+    Impairment("mqtt-blocked", block_ports=(MQTT_PORT,)),
+    Impairment("offline", block_all=True),
+]}
+
+
+def firewall_rules(dev: str, uplink: str, impairment: Optional[Impairment] = None) -> str:
+    """
+    filter and nat tables that forward the traffic of the AP to the uplink, with the
+    rules of the impairment. They are loaded with iptables-restore, that replaces
+    each table at once
+    """
+    impairment = impairment or Impairment("none")
+    filter_rules = []
+    if impairment.block_dns:
+        for protocol in ("udp", "tcp"):
+            # both the local DNS server and the ones of internet
+            filter_rules.append(f"-A INPUT -i {dev} -p {protocol} --dport {DNS_PORT} -j DROP")
+            filter_rules.append(f"-A FORWARD -i {dev} -p {protocol} --dport {DNS_PORT} -j DROP")
+    for port in impairment.block_ports:
+        filter_rules.append(f"-A FORWARD -i {dev} -p tcp --dport {port} -j DROP")
+    if impairment.block_all:
+        filter_rules.append(f"-A FORWARD -i {dev} -j DROP")
+
+    return "\n".join([
+        "*filter",
+        ":INPUT ACCEPT [0:0]",
+        ":FORWARD ACCEPT [0:0]",
+        ":OUTPUT ACCEPT [0:0]",
+        *filter_rules,
+        "-A FORWARD -m conntrack --ctstate RELATED,ESTABLISHED -j ACCEPT",
+        f"-A FORWARD -i {dev} -o {uplink} -j ACCEPT",
+        "COMMIT",
+        "*nat",
+        ":PREROUTING ACCEPT [0:0]",
+        ":INPUT ACCEPT [0:0]",
+        ":OUTPUT ACCEPT [0:0]",
+        ":POSTROUTING ACCEPT [0:0]",
+        f"-A POSTROUTING -o {uplink} -j MASQUERADE",
+        "COMMIT",
+        "",
+    ])
+
+
+def compile_impairment(impairment: Optional[Impairment], previous: Optional[Impairment], dev: str,
+                       uplink: str) -> list[dict]:
+    """
+    operations that switch from the previous impairment to the new one,
+    computed once for each pair of profiles. The operations are copies,
+    changing them doesn't change the cached ones
+    """
+    return [dict(operation) for operation in _compile_impairment(impairment, previous, dev, uplink)]
+
+
+@cache
+def _compile_impairment(impairment: Optional[Impairment], previous: Optional[Impairment], dev: str,
+                        uplink: str) -> tuple[MappingProxyType, ...]:
+    netem = impairment.netem_arguments() if impairment else None
+    previous_netem = previous.netem_arguments() if previous else None
+
+    operations = [netctl.firewall(firewall_rules(dev, uplink, impairment))]
+    if netem != previous_netem:
+        operations.append(netctl.qdisc(dev, netem, previous_netem))
+
+    return tuple(MappingProxyType(operation) for operation in operations)
+
+
+@dataclass(frozen=True)
+class Timeline:
+    """
+    impairments applied at the specified offsets (in seconds) from the start,
+    the whole timeline is repeated every period if specified
+    """
+    steps: tuple[tuple[float, Optional[Impairment]], ...]
+    period: Optional[float] = None
+
+
+def flap(period: float, down_time: float, impairment: Impairment = PROFILES["offline"]) -> Timeline:
+    """
+    timeline that applies the impairment for down_time seconds every period
+    """
+    return Timeline(((0, impairment), (down_time, None)), period)
+
+
+class TimelinePlayer:
+    """
+    applies the steps of a timeline from a background thread
+    """
+
+    def __init__(self, apply: Callable[[Optional[Impairment]], None], timeline: Timeline):
+        self._apply = apply
+        self._timeline = timeline
+        self._stop = Event()
+        self._thread = Thread(target=self._thread_entry, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _thread_entry(self):
+        start = monotonic()
+        iteration = 0
+        while True:
+            base = start + iteration * (self._timeline.period or 0)
+            for offset, impairment in self._timeline.steps:
+                if self._stop.wait(max(0.0, base + offset - monotonic())):
+                    return
+
+                LOGGER.info("timeline: apply %s", impairment.name if impairment else "no impairment")
+                try:
+                    self._apply(impairment)
+                except Exception as e:
+                    LOGGER.error("timeline: failed to apply impairment: %s", e)
+
+            if self._timeline.period is None:
+                return
+            iteration += 1
@@ -0,0 +1,183 @@
+"""
+network configuration of the fixture. The changes are sent as transactions to a
+privileged helper (fw_test.wifi.helper) that is started once with sudo, so that
+no process needs to be forked for each operation
+"""
+import os
+import sys
+import json
+import socket
+import tempfile
+import subprocess
+
+from logging import getLogger
+from threading import Lock
+from typing import Optional
+
+LOGGER = getLogger(__name__)
+
+# sockets that can be received with a single request
+MAX_SOCKETS = 8
+
+
+class NetworkControlError(RuntimeError):
+    pass
+
+
+# operations that can be part of a transaction
+
+def link_up(ifname: str) -> dict:
+    return {"op": "link_set", "ifname": ifname, "up": True}
+
+
+def link_down(ifname: str) -> dict:
+    return {"op": "link_set", "ifname": ifname, "up": False}
+
+
+def address_add(ifname: str, address: str) -> dict:
+    return {"op": "address_add", "ifname": ifname, "address": address}
+
+
+def address_flush(ifname: str) -> dict:
+    return {"op": "address_flush", "ifname": ifname}
+
+
+def route_flush(ifname: str) -> dict:
+    return {"op": "route_flush", "ifname": ifname}
+
+
+def set_type(ifname: str, iftype: str) -> dict:
+    return {"op": "set_type", "ifname": ifname, "type": iftype}
+
+
+def create_interface(ifname: str, parent: str, iftype: str) -> dict:
+    """
+    creates a virtual interface on the same radio of the parent one
+    """
+    return {"op": "create_interface", "ifname": ifname, "parent": parent, "type": iftype}
+
+
+def delete_interface(ifname: str) -> dict:
+    return {"op": "delete_interface", "ifname": ifname}
+
+
+def connect(ifname: str, ssid: str) -> dict:
+    return {"op": "connect", "ifname": ifname, "ssid": ssid}
+
+
+def disconnect(ifname: str) -> dict:
+    return {"op": "disconnect", "ifname": ifname}
+
+
+def qdisc(ifname: str, netem: Optional[str], previous: Optional[str]) -> dict:
+    """
+    sets the netem arguments of the root queue of the interface (None
+    for the default queue), previous is restored on rollback
+    """
+    return {"op": "qdisc", "ifname": ifname, "netem": netem, "previous": previous}
+
+
+def firewall(rules: str) -> dict:
+    """
+    replaces the tables present in the rules, in iptables-save format
+    """
+    return {"op": "firewall", "rules": rules}
+
+
+def udp_socket(address: str, port: int, ifname: str, broadcast: bool = False) -> dict:
+    """
+    UDP socket bound to a (privileged) port of the interface
+    """
+    return {"type": "udp", "address": address, "port": port, "ifname": ifname, "broadcast": broadcast}
+
+
+def tcp_socket(address: str, port: int, ifname: str) -> dict:
+    """
+    listening TCP socket bound to a (privileged) port of the interface
+    """
+    return {"type": "tcp", "address": address, "port": port, "ifname": ifname, "broadcast": False}
+
+
+def packet_socket(ifname: str) -> dict:
+    """
+    raw socket for the capture of the interface, it is bound by the client
+    """
+    return {"type": "packet", "address": "", "port": 0, "ifname": ifname, "broadcast": False}
+
+
+class NetworkControl:
+    """
+    client of the privileged helper
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._process: Optional[subprocess.Popen] = None
+        self._socket: Optional[socket.socket] = None
+        self._directory: Optional[tempfile.TemporaryDirectory] = None
+
+    def transaction(self, operations: list[dict]):
+        """
+        applies all the operations, if one of them fails the
+        already applied ones are reverted and an error is raised
+        """
+        LOGGER.debug("network transaction: %s", operations)
+        self._request({"transaction": operations})
+
+    def open_sockets(self, sockets: list[dict]) -> list[socket.socket]:
+        """
+        sockets opened by the helper, that the test process can't bind
+        """
+        LOGGER.debug("open sockets: %s", sockets)
+        fds = self._request({"sockets": sockets})
+
+        return [socket.socket(fileno=fd) for fd in fds]
+
+    def _request(self, request: dict) -> list[int]:
+        with self._lock:
+            if self._socket is None:
+                self._start()
+
+            self._socket.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+            # requests and responses alternate, nothing follows the end of the line
+            data = b""
+            fds = []
+            while not data.endswith(b"\n"):
+                chunk, chunk_fds, _, _ = socket.recv_fds(self._socket, 65536, MAX_SOCKETS)
+                if not chunk:
+                    raise NetworkControlError("network helper terminated")
+                data += chunk
+                fds += chunk_fds
+
+            response = json.loads(data)
+            if not response["ok"]:
+                for fd in fds:
+                    os.close(fd)
+                raise NetworkControlError(response["error"])
+
+            return fds
+
+    def stop(self):
+        with self._lock:
+            if self._socket is not None:
+                # the helper exits when the connection is closed
+                self._socket.close()
+                self._process.wait()
+                self._directory.cleanup()
+                self._socket = None
+
+    def _start(self):
+        self._directory = tempfile.TemporaryDirectory(prefix="fw_test-")
+        path = os.path.join(self._directory.name, "netctl.sock")
+        command = [sys.executable, "-m", "fw_test.wifi.helper", path, str(os.getuid())]
+        if os.geteuid() != 0:
+            command = ["sudo", "-n"] + command
+
+        LOGGER.info("start network helper")
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE, encoding="utf-8")
+        if self._process.stdout.readline().strip() != "ready":
+            raise NetworkControlError("network helper failed to start")
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
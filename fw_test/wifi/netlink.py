@@ -0,0 +1,337 @@
+import os
+import errno
+import socket
+import struct
+import ipaddress
+
+from logging import getLogger
+from dataclasses import dataclass
+
+LOGGER = getLogger(__name__)
+
+NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
+
+NLMSG_HEADER = struct.Struct("=LHHLL")
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x001
+NLM_F_MULTI = 0x002
+NLM_F_ACK = 0x004
+NLM_F_DUMP = 0x300
+NLM_F_CREATE = 0x400
+NLM_F_EXCL = 0x200
+
+RTA_HEADER = struct.Struct("=HH")
+
+# rtnetlink
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTMSG = struct.Struct("=BBBBBBBBI")
+
+IFF_UP = 0x1
+IFLA_IFNAME = 3
+IFLA_OPERSTATE = 16
+IF_OPER_UP = 6
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+RTA_OIF = 4
+RT_TABLE_MAIN = 254
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_HOST = 254
+
+# generic netlink
+GENL_ID_CTRL = 0x10
+GENLMSGHDR = struct.Struct("=BBH")
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+# nl80211
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_SET_INTERFACE = 6
+NL80211_CMD_NEW_INTERFACE = 7
+NL80211_CMD_DEL_INTERFACE = 8
+NL80211_CMD_CONNECT = 46
+NL80211_CMD_DISCONNECT = 48
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_SSID = 52
+NL80211_ATTR_REASON_CODE = 54
+NL80211_IFTYPE_STATION = 2
+NL80211_IFTYPE_AP = 3
+WLAN_REASON_DEAUTH_LEAVING = 3
+
+IFTYPES = {
+    "managed": NL80211_IFTYPE_STATION,
+    "ap": NL80211_IFTYPE_AP,
+}
+
+
+class NetlinkError(OSError):
+    pass
+
+
+@dataclass(frozen=True)
+class Address:
+    family: int
+    prefix_length: int
+    index: int
+    address: str
+
+    def __str__(self):
+        return f"{self.address}/{self.prefix_length}"
+
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+
+def attribute(kind: int, value: bytes) -> bytes:
+    length = RTA_HEADER.size + len(value)
+    return RTA_HEADER.pack(length, kind) + value + b"\0" * (_align(length) - length)
+
+
+def attribute_u32(kind: int, value: int) -> bytes:
+    return attribute(kind, struct.pack("=I", value))
+
+
+def attribute_str(kind: int, value: str) -> bytes:
+    return attribute(kind, value.encode("ascii") + b"\0")
+
+
+def parse_attributes(data: bytes) -> dict[int, bytes]:
+    attributes = {}
+    offset = 0
+    while offset + RTA_HEADER.size <= len(data):
+        length, kind = RTA_HEADER.unpack_from(data, offset)
+        if length < RTA_HEADER.size:
+            break
+        # the nested and byte order flags are not used
+        attributes[kind & 0x3fff] = data[offset + RTA_HEADER.size:offset + length]
+        offset += _align(length)
+
+    return attributes
+
+
+class NetlinkSocket:
+    """
+    request/response netlink socket
+    """
+
+    def __init__(self, protocol: int):
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, protocol)
+        self._socket.bind((0, 0))
+        self._seq = 0
+
+    def close(self):
+        self._socket.close()
+
+    def request(self, kind: int, flags: int, payload: bytes) -> list[tuple[int, bytes]]:
+        """
+        sends a request and returns the (type, payload) of the response messages,
+        raises NetlinkError if the kernel answers with an error
+        """
+        self._seq += 1
+        seq = self._seq
+        message = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), kind, flags | NLM_F_REQUEST, seq, 0) + payload
+        self._socket.send(message)
+
+        responses = []
+        while True:
+            data = self._socket.recv(65536)
+            offset = 0
+            done = False
+            while offset + NLMSG_HEADER.size <= len(data):
+                length, msg_type, msg_flags, msg_seq, _ = NLMSG_HEADER.unpack_from(data, offset)
+                body = data[offset + NLMSG_HEADER.size:offset + length]
+                offset += _align(length)
+                if msg_seq != seq:
+                    continue
+                if msg_type == NLMSG_ERROR:
+                    code = -struct.unpack_from("=i", body)[0]
+                    if code:
+                        raise NetlinkError(code, os.strerror(code))
+                    done = True
+                elif msg_type == NLMSG_DONE:
+                    done = True
+                else:
+                    responses.append((msg_type, body))
+                    done = done or not msg_flags & NLM_F_MULTI and not flags & NLM_F_ACK
+            if done:
+                return responses
+
+
+class Rtnetlink:
+    """
+    links, addresses and routes through the NETLINK_ROUTE protocol
+    """
+
+    def __init__(self):
+        self._socket = NetlinkSocket(NETLINK_ROUTE)
+
+    def close(self):
+        self._socket.close()
+
+    def link_flags(self, ifname: str) -> int:
+        index = socket.if_nametoindex(ifname)
+        (_, body), = self._socket.request(RTM_GETLINK, 0, IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0))
+
+        return IFINFOMSG.unpack_from(body)[3]
+
+    def link_operstate(self, ifname: str) -> int:
+        index = socket.if_nametoindex(ifname)
+        (_, body), = self._socket.request(RTM_GETLINK, 0, IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0))
+        attributes = parse_attributes(body[IFINFOMSG.size:])
+
+        return attributes[IFLA_OPERSTATE][0]
+
+    def link_set(self, ifname: str, up: bool):
+        index = socket.if_nametoindex(ifname)
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, IFF_UP if up else 0, IFF_UP)
+        self._socket.request(RTM_NEWLINK, NLM_F_ACK, payload)
+
+    def addresses(self, ifname: str) -> list[Address]:
+        index = socket.if_nametoindex(ifname)
+        result = []
+        for _, body in self._socket.request(RTM_GETADDR, NLM_F_DUMP, IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)):
+            family, prefix_length, _, _, address_index = IFADDRMSG.unpack_from(body)
+            if address_index != index:
+                continue
+            attributes = parse_attributes(body[IFADDRMSG.size:])
+            raw = attributes.get(IFA_LOCAL, attributes.get(IFA_ADDRESS))
+            result.append(Address(family, prefix_length, index, str(ipaddress.ip_address(raw))))
+
+        return result
+
+    def address_add(self, ifname: str, address: str):
+        self._address(RTM_NEWADDR, NLM_F_ACK | NLM_F_CREATE | NLM_F_EXCL, ifname, address)
+
+    def address_del(self, ifname: str, address: str):
+        self._address(RTM_DELADDR, NLM_F_ACK, ifname, address)
+
+    def address_flush(self, ifname: str) -> list[Address]:
+        """
+        removes all the IPv4 addresses of an interface, returns the removed ones
+        """
+        addresses = self.addresses(ifname)
+        for address in addresses:
+            self.address_del(ifname, str(address))
+
+        return addresses
+
+    def route_flush(self, ifname: str):
+        """
+        removes all the IPv4 routes of the main table that go through an interface
+        """
+        index = socket.if_nametoindex(ifname)
+        request = RTMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)
+        for _, body in self._socket.request(RTM_GETROUTE, NLM_F_DUMP, request):
+            table = RTMSG.unpack_from(body)[4]
+            attributes = parse_attributes(body[RTMSG.size:])
+            oif = attributes.get(RTA_OIF)
+            if table != RT_TABLE_MAIN or oif is None or struct.unpack("=I", oif)[0] != index:
+                continue
+            try:
+                self._socket.request(RTM_DELROUTE, NLM_F_ACK, body)
+            except NetlinkError as e:
+                # routes of an address are removed together with it
+                if e.errno != errno.ESRCH:
+                    raise
+
+    def _address(self, kind: int, flags: int, ifname: str, address: str):
+        interface = ipaddress.ip_interface(address)
+        index = socket.if_nametoindex(ifname)
+        packed = interface.ip.packed
+        scope = RT_SCOPE_HOST if interface.ip.is_loopback else RT_SCOPE_UNIVERSE
+        payload = IFADDRMSG.pack(socket.AF_INET, interface.network.prefixlen, 0, scope, index) \
+            + attribute(IFA_LOCAL, packed) \
+            + attribute(IFA_ADDRESS, packed)
+        self._socket.request(kind, flags, payload)
+
+
+class Nl80211:
+    """
+    wireless interfaces configuration through the nl80211 generic netlink family
+    """
+
+    def __init__(self):
+        self._socket = NetlinkSocket(NETLINK_GENERIC)
+        self._family = self._resolve_family("nl80211")
+
+    def close(self):
+        self._socket.close()
+
+    def interface_type(self, ifname: str) -> int:
+        return struct.unpack("=I", self._interface(ifname)[NL80211_ATTR_IFTYPE])[0]
+
+    def interface_wiphy(self, ifname: str) -> int:
+        return struct.unpack("=I", self._interface(ifname)[NL80211_ATTR_WIPHY])[0]
+
+    def _interface(self, ifname: str) -> dict[int, bytes]:
+        index = attribute_u32(NL80211_ATTR_IFINDEX, socket.if_nametoindex(ifname))
+        (_, body), = self._command(NL80211_CMD_GET_INTERFACE, 0, index)
+
+        return parse_attributes(body[GENLMSGHDR.size:])
+
+    def set_interface_type(self, ifname: str, iftype: int):
+        self._command(NL80211_CMD_SET_INTERFACE, NLM_F_ACK,
+                      attribute_u32(NL80211_ATTR_IFINDEX, socket.if_nametoindex(ifname))
+                      + attribute_u32(NL80211_ATTR_IFTYPE, iftype))
+
+    def new_interface(self, wiphy: int, ifname: str, iftype: int):
+        self._command(NL80211_CMD_NEW_INTERFACE, NLM_F_ACK,
+                      attribute_u32(NL80211_ATTR_WIPHY, wiphy)
+                      + attribute_str(NL80211_ATTR_IFNAME, ifname)
+                      + attribute_u32(NL80211_ATTR_IFTYPE, iftype))
+
+    def del_interface(self, ifname: str):
+        self._command(NL80211_CMD_DEL_INTERFACE, NLM_F_ACK,
+                      attribute_u32(NL80211_ATTR_IFINDEX, socket.if_nametoindex(ifname)))
+
+    def connect(self, ifname: str, ssid: str):
+        """
+        connects to an open network, as `iw dev <ifname> connect <ssid>` does
+        """
+        self._command(NL80211_CMD_CONNECT, NLM_F_ACK,
+                      attribute_u32(NL80211_ATTR_IFINDEX, socket.if_nametoindex(ifname))
+                      + attribute(NL80211_ATTR_SSID, ssid.encode("utf-8")))
+
+    def disconnect(self, ifname: str):
+        try:
+            self._command(NL80211_CMD_DISCONNECT, NLM_F_ACK,
+                          attribute_u32(NL80211_ATTR_IFINDEX, socket.if_nametoindex(ifname))
+                          + attribute(NL80211_ATTR_REASON_CODE, struct.pack("=H", WLAN_REASON_DEAUTH_LEAVING)))
+        except NetlinkError as e:
+            # not being connected is fine when disconnecting
+            if e.errno != errno.ENOTCONN:
+                raise
+
+    def _resolve_family(self, name: str) -> int:
+        payload = GENLMSGHDR.pack(CTRL_CMD_GETFAMILY, 1, 0) + attribute_str(CTRL_ATTR_FAMILY_NAME, name)
+        (_, body), = self._socket.request(GENL_ID_CTRL, 0, payload)
+        attributes = parse_attributes(body[GENLMSGHDR.size:])
+
+        return struct.unpack("=H", attributes[CTRL_ATTR_FAMILY_ID][:2])[0]
+
+    def _command(self, command: int, flags: int, attributes: bytes) -> list[tuple[int, bytes]]:
+        return self._socket.request(self._family, flags, GENLMSGHDR.pack(command, 0, 0) + attributes)
+
+
+def interface_exists(ifname: str) -> bool:
+    try:
+        socket.if_nametoindex(ifname)
+        return True
+    except OSError:
+        return False
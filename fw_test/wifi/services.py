@@ -0,0 +1,67 @@
+import socket
+import asyncio
+
+from logging import getLogger
+from threading import Thread
+from ipaddress import IPv4Interface
+from typing import Callable, Optional
+
+from fw_test.wifi.dhcp import DhcpServer, Lease
+from fw_test.wifi.dns import DnsServer, DnsTable
+
+LOGGER = getLogger(__name__)
+
+
+class NetworkServices:
+    """
+    DHCP and DNS servers of the AP network, they run on an asyncio loop in a
+    dedicated thread of the test process. The sockets are opened by the caller,
+    since the ports are privileged
+    """
+
+    def __init__(self, interface: IPv4Interface, on_lease: Callable[[Lease], None]):
+        self.dns_table = DnsTable()
+        self.dhcp = DhcpServer(interface, on_lease)
+        self.dns = DnsServer(self.dns_table)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._transports: list[asyncio.BaseTransport] = []
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    def start(self, dhcp_socket: socket.socket, dns_socket: socket.socket):
+        if self.running:
+            return
+
+        LOGGER.debug("start DHCP and DNS servers")
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(dhcp_socket, dns_socket), self._loop).result()
+
+    def stop(self):
+        if not self.running:
+            return
+
+        LOGGER.debug("stop DHCP and DNS servers")
+        for transport in self._transports:
+            self._loop.call_soon_threadsafe(transport.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+        self._transports = []
+
+    def dns_latencies(self) -> dict[str, dict]:
+        """
+        summary of the time taken to answer the queries of each name
+        """
+        return {name: histogram.summary() for name, histogram in dict(self.dns.latencies).items()}
+
+    async def _open(self, dhcp_socket: socket.socket, dns_socket: socket.socket):
+        loop = asyncio.get_running_loop()
+        for server, sock in ((self.dhcp, dhcp_socket), (self.dns, dns_socket)):
+            transport, _ = await loop.create_datagram_endpoint(lambda server=server: server, sock=sock)
+            self._transports.append(transport)
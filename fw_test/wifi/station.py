@@ -0,0 +1,144 @@
+import re
+
+from time import monotonic
+from logging import getLogger
+from threading import Condition
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Optional
+
+from fw_test.wifi.dhcp import Lease
+
+LOGGER = getLogger(__name__)
+
+STATION_TIMEOUT = 30
+
+MAC_RE = r"([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})"
+
+# hostapd debug output, e.g. "wlan0: STA 02:00:00:00:01:00 IEEE 802.11: associated (aid 1)"
+ASSOCIATED_RE = re.compile(rf"STA {MAC_RE} IEEE 802\.11: associated")
+
+
+class StationStage(IntEnum):
+    DISCONNECTED = 0
+    # 802.11 association completed
+    ASSOCIATED = 1
+    # authorized to send traffic, after the 4-way handshake when WPA is enabled
+    AUTHORIZED = 2
+    # got an address from the DHCP server
+    LEASED = 3
+
+
+@dataclass(frozen=True)
+class StationEvent:
+    timestamp: float
+    mac: str
+    stage: StationStage
+    # address for LEASED, reason of the disconnection for DISCONNECTED
+    detail: Optional[str] = None
+
+
+class StationError(Exception):
+    pass
+
+
+def normalize_mac(mac: str) -> str:
+    return mac.lower().replace("-", ":")
+
+
+class StationMonitor:
+    """
+    follows the stations connected to the AP, parsing the events of hostapd
+    and the leases of the DHCP server into typed events
+    """
+
+    def __init__(self):
+        self._condition = Condition()
+        self._stations: dict[str, StationEvent] = {}
+        self._failures: dict[str, str] = {}
+
+    def handle_hostapd_event(self, message: str):
+        """
+        called for each event received on the hostapd control interface
+        """
+        match message.split():
+            case ["AP-STA-CONNECTED", mac, *_] | ["EAPOL-4WAY-HS-COMPLETED", mac, *_]:
+                self._update(mac, StationStage.AUTHORIZED)
+            case ["AP-STA-DISCONNECTED", mac, *_]:
+                self._update(mac, StationStage.DISCONNECTED, "disconnected")
+            case ["AP-STA-POSSIBLE-PSK-MISMATCH", mac, *_]:
+                self._fail(mac, "wrong passphrase")
+            case ["AP-DISABLED", *_]:
+                self.clear()
+
+    def handle_hostapd_output(self, line: str):
+        """
+        called for each line of the hostapd debug output
+        """
+        match = ASSOCIATED_RE.search(line)
+        if match:
+            self._update(match.group(1), StationStage.ASSOCIATED)
+
+    def handle_lease(self, lease: Lease):
+        """
+        called by the DHCP server when it acknowledges a lease
+        """
+        self._update(lease.mac, StationStage.LEASED, str(lease.address))
+
+    def stage(self, mac: str) -> StationStage:
+        with self._condition:
+            event = self._stations.get(normalize_mac(mac))
+            return event.stage if event else StationStage.DISCONNECTED
+
+    def clear(self):
+        """
+        forgets all the stations, called when the AP is reconfigured
+        """
+        with self._condition:
+            self._stations.clear()
+            self._failures.clear()
+            self._condition.notify_all()
+
+    def wait_for_station(self, mac: str, stage: StationStage, timeout: float = STATION_TIMEOUT) -> StationEvent:
+        """
+        waits until the station reaches the specified stage (or a later one),
+        fails as soon as the AP rejects the station
+        """
+        mac = normalize_mac(mac)
+        deadline = monotonic() + timeout
+        with self._condition:
+            while True:
+                if mac in self._failures:
+                    raise StationError(f"station {mac} rejected: {self._failures[mac]}")
+
+                event = self._stations.get(mac)
+                current = event.stage if event else StationStage.DISCONNECTED
+                if current == stage or (stage != StationStage.DISCONNECTED and current > stage):
+                    return event or StationEvent(monotonic(), mac, StationStage.DISCONNECTED)
+
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"station {mac} did not reach {stage.name}, last stage {current.name}")
+                self._condition.wait(remaining)
+
+    def _update(self, mac: str, stage: StationStage, detail: Optional[str] = None):
+        mac = normalize_mac(mac)
+        with self._condition:
+            previous = self._stations.get(mac)
+            # a station only moves back with a disconnection, e.g. a
+            # new handshake doesn't invalidate the lease it already has
+            if previous and stage != StationStage.DISCONNECTED and previous.stage > stage:
+                return
+
+            LOGGER.info("station %s %s%s", mac, stage.name, f" ({detail})" if detail else "")
+            self._stations[mac] = StationEvent(monotonic(), mac, stage, detail)
+            if stage != StationStage.DISCONNECTED:
+                self._failures.pop(mac, None)
+            self._condition.notify_all()
+
+    def _fail(self, mac: str, reason: str):
+        mac = normalize_mac(mac)
+        with self._condition:
+            LOGGER.warning("station %s rejected: %s", mac, reason)
+            self._failures[mac] = reason
+            self._condition.notify_all()
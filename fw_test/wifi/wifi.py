@@ -0,0 +1,309 @@
+import socket
+
+from time import monotonic, sleep
+from dataclasses import dataclass
+from enum import Enum, auto
+from logging import getLogger
+from threading import Lock
+from ipaddress import IPv4Interface
+from typing import Optional
+
+from fw_test.config import Config
+from fw_test.wifi import netctl
+from fw_test.wifi.netctl import NetworkControl
+from fw_test.wifi.netlink import Rtnetlink, IF_OPER_UP, interface_exists
+from fw_test.wifi.hostapd import Hostapd
+from fw_test.wifi.services import NetworkServices
+from fw_test.wifi.dns import DnsTable, DNS_PORT
+from fw_test.wifi.dhcp import DHCP_SERVER_PORT
+from fw_test.wifi.impairment import Impairment, Timeline, TimelinePlayer, firewall_rules, compile_impairment
+from fw_test.wifi.station import StationMonitor, StationStage, StationEvent, STATION_TIMEOUT
+from fw_test.wifi.capture import PacketCapture
+
+LOGGER = getLogger(__name__)
+
+# client IP address to use
+CLIENT_IP = "192.168.240.254/24"
+
+# address of the AP interface, the devices reach the internet through the uplink
+AP_IP = "192.168.13.1/24"
+UPLINK_INTERFACE = "eth0"
+
+# time to associate to the AP of the device
+CONNECT_TIMEOUT = 15
+
+
+class WifiSecurityType(Enum):
+    NONE = auto()
+    WEP = auto()
+    WPA = auto()
+    WPA2 = auto()
+    WPA3 = auto()
+
+
+@dataclass(frozen=True)
+class ApConfiguration:
+    ssid: str
+    security_type: WifiSecurityType
+    passphrase: str
+    channel: int
+
+
+class Wifi:
+    """
+    handles the Wi-Fi interfaces of the test fixture. When the AP and client interfaces
+    are different the two links are up at the same time and each operation only touches
+    its own interface, if the client interface doesn't exist it is created as a virtual
+    interface on the radio of the AP one. With a single interface it is switched between
+    the two modes
+    """
+
+    def __init__(self, config: Config):
+        self._config = config
+        self._hostapd = Hostapd(config.wifi_ap_interface)
+        self._net = NetworkControl()
+        self._stations = StationMonitor()
+        self._hostapd.add_listener(self._stations.handle_hostapd_event)
+        self._hostapd.add_output_listener(self._stations.handle_hostapd_output)
+        self._services = NetworkServices(IPv4Interface(AP_IP), self._stations.handle_lease)
+        self._created_interface = False
+        self._impairment: Optional[Impairment] = None
+        self._impairment_lock = Lock()
+        self._timeline: Optional[TimelinePlayer] = None
+        self._capture: Optional[PacketCapture] = None
+        if config.wifi_capture_size:
+            dev = config.wifi_ap_interface
+            sock, = self._net.open_sockets([netctl.packet_socket(dev)])
+            self._capture = PacketCapture(sock, dev, config.mac_address, config.wifi_capture_size)
+
+    @property
+    def concurrent(self) -> bool:
+        """
+        true if the client and the AP have their own interface
+        """
+        return self._config.wifi_ap_interface != self._config.wifi_client_interface
+
+    def client_connect(self, timeout: float = CONNECT_TIMEOUT):
+        """
+        connect to the device AP interface, returns when the link is up
+        """
+        dev = self._config.wifi_client_interface
+        ssid = self._config.wifi_ssid
+        LOGGER.info("connecting client interface %s to %s", dev, ssid)
+
+        operations = []
+        if not self.concurrent:
+            # the radio is needed in managed mode
+            self._hostapd.disable()
+        elif not interface_exists(dev):
+            operations.append(netctl.create_interface(dev, self._config.wifi_ap_interface, "managed"))
+            self._created_interface = True
+
+        self._net.transaction(operations + [
+            netctl.set_type(dev, "managed"),
+            netctl.address_flush(dev),
+            netctl.route_flush(dev),
+            netctl.link_up(dev),
+            netctl.disconnect(dev),
+            netctl.connect(dev, ssid),
+            netctl.address_add(dev, CLIENT_IP),
+        ])
+        self._wait_link_up(dev, timeout)
+
+    def client_disconnect(self):
+        """
+        disconnects from the device AP interface
+        """
+        dev = self._config.wifi_client_interface
+        LOGGER.info("disconnecting client interface %s", dev)
+        self._net.transaction([
+            netctl.disconnect(dev),
+            netctl.address_flush(dev),
+            netctl.route_flush(dev),
+            netctl.link_down(dev),
+        ])
+
+    def start_ap(self, ap_config: ApConfiguration):
+        """
+        starts the host AP interface with the specified configuration
+        """
+        LOGGER.info("start AP with configuration %s", ap_config)
+
+        dev = self._config.wifi_ap_interface
+        # with a single interface the client mode has removed the AP address
+        if not self._hostapd.running or not self.concurrent:
+            LOGGER.debug("configure interface and NAT traffic")
+            self._net.transaction([
+                netctl.set_type(dev, "ap"),
+                netctl.link_down(dev),
+                netctl.address_flush(dev),
+                netctl.link_up(dev),
+                netctl.address_add(dev, AP_IP),
+                netctl.firewall(firewall_rules(dev, UPLINK_INTERFACE, self._impairment)),
+            ])
+
+        # build hostapd configuration file
+        config = {
+            "interface": self._config.wifi_ap_interface,
+            "ssid": ap_config.ssid,
+            "driver": "nl80211",
+            "hw_mode": "g",
+            "channel": ap_config.channel,
+            "ieee80211n": 1,
+            "wmm_enabled": 0,
+            # maybe in the future here we can limit to 1 specific mac address?
+            "macaddr_acl": 0,
+            "ignore_broadcast_ssid": 0,
+            "auth_algs": 1,
+            # the daemon is reused, a previous configuration may have enabled WPA
+            "wpa": 0,
+        }
+
+        if ap_config.security_type in (
+            WifiSecurityType.WPA,
+            WifiSecurityType.WPA2,
+            WifiSecurityType.WPA3,
+        ):
+            if ap_config.security_type == WifiSecurityType.WPA:
+                config["wpa"] = 1
+            if ap_config.security_type == WifiSecurityType.WPA2:
+                config["wpa"] = 2
+            if ap_config.security_type == WifiSecurityType.WPA3:
+                config["wpa"] = 3
+            config["wpa_key_mgmt"] = "WPA-PSK"
+            config["wpa_pairwise"] = "TKIP"
+            config["rsn_pairwise"] = "CCMP"
+            config["wpa_passphrase"] = ap_config.passphrase
+
+        if ap_config.security_type == WifiSecurityType.WEP:
+            raise NotImplementedError
+
+        LOGGER.debug("generated hostapd config: %s", config)
+
+        if not self._services.running:
+            address = str(IPv4Interface(AP_IP).ip)
+            dhcp_socket, dns_socket = self._net.open_sockets([
+                netctl.udp_socket("0.0.0.0", DHCP_SERVER_PORT, dev, broadcast=True),
+                netctl.udp_socket(address, DNS_PORT, dev),
+            ])
+            self._services.start(dhcp_socket, dns_socket)
+        self._hostapd.configure(config)
+
+    def stop_ap(self):
+        """
+        stops the host AP interface, hostapd and the DHCP and DNS servers keep running
+        """
+        LOGGER.debug("disable AP")
+        self._hostapd.disable()
+        self.clear_impairments()
+
+    def impair(self, impairment: Optional[Impairment]):
+        """
+        applies an impairment to the traffic of the AP, replacing the current one, as
+        a single transaction. None restores the normal conditions
+        """
+        with self._impairment_lock:
+            if impairment == self._impairment:
+                return
+
+            LOGGER.info("impairment: %s", impairment.name if impairment else "none")
+            dev = self._config.wifi_ap_interface
+            self._net.transaction(compile_impairment(impairment, self._impairment, dev, UPLINK_INTERFACE))
+            self._impairment = impairment
+
+    def start_timeline(self, timeline: Timeline):
+        """
+        applies the impairments of the timeline in background, e.g. a periodic flap
+        """
+        self.stop_timeline()
+        self._timeline = TimelinePlayer(self.impair, timeline)
+
+    def stop_timeline(self):
+        if self._timeline is not None:
+            self._timeline.stop()
+            self._timeline = None
+
+    def clear_impairments(self):
+        """
+        stops the timeline and restores the normal network conditions
+        """
+        self.stop_timeline()
+        self.impair(None)
+
+    @property
+    def address(self) -> str:
+        """
+        address of the fixture on the AP network
+        """
+        return str(IPv4Interface(AP_IP).ip)
+
+    def listen(self, port: int) -> socket.socket:
+        """
+        TCP socket that accepts the connections of the devices on the AP network
+        """
+        sock, = self._net.open_sockets([netctl.tcp_socket("0.0.0.0", port, self._config.wifi_ap_interface)])
+
+        return sock
+
+    @property
+    def dns(self) -> DnsTable:
+        """
+        answers of the DNS server of the AP that replace the ones of internet
+        """
+        return self._services.dns_table
+
+    def dns_latencies(self) -> dict[str, dict]:
+        """
+        time taken by the DNS server to answer the queries of each name
+        """
+        return self._services.dns_latencies()
+
+    def wait_for_station(self, mac: str, stage: StationStage, timeout: float = STATION_TIMEOUT) -> StationEvent:
+        """
+        waits until the station with the specified MAC address reaches a stage
+        of the connection to the AP, raises StationError if it is rejected
+        """
+        return self._stations.wait_for_station(mac, stage, timeout)
+
+    def clear_capture(self):
+        """
+        discards the packets captured so far
+        """
+        if self._capture is not None:
+            self._capture.clear()
+
+    def dump_capture(self, path: str) -> Optional[str]:
+        """
+        writes the captured packets of the device to a pcap file, returns the path of
+        its time index or None if the capture is disabled or empty
+        """
+        if self._capture is None:
+            return None
+
+        return self._capture.dump(path)
+
+    def stop(self):
+        """
+        terminates hostapd, the DHCP and DNS servers, the capture and the network helper
+        """
+        self.clear_impairments()
+        if self._capture is not None:
+            self._capture.stop()
+        self._hostapd.stop()
+        self._services.stop()
+        if self._created_interface:
+            self._net.transaction([netctl.delete_interface(self._config.wifi_client_interface)])
+        self._net.stop()
+
+    @staticmethod
+    def _wait_link_up(dev: str, timeout: float):
+        rtnl = Rtnetlink()
+        try:
+            deadline = monotonic() + timeout
+            while rtnl.link_operstate(dev) != IF_OPER_UP:
+                if monotonic() > deadline:
+                    raise TimeoutError(f"{dev} not connected")
+                sleep(0.05)
+        finally:
+            rtnl.close()
+
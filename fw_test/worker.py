@@ -0,0 +1,77 @@
+"""
+pytest plugin of the scheduler, loaded with -p fw_test.worker: the session collects the
+tests, then runs the node ids read from the standard input one at a time and writes the
+result of each one as a line of JSON on the standard output. The output of pytest goes
+to the standard error
+"""
+import os
+import json
+
+from logging import getLogger
+from typing import Optional
+
+import pytest
+
+LOGGER = getLogger(__name__)
+
+
+class _Worker:
+    def __init__(self, requests: int, results: int):
+        self._requests = os.fdopen(requests, "r")
+        self._results = os.fdopen(results, "w", buffering=1)
+        self._reports: list[pytest.TestReport] = []
+
+    @pytest.hookimpl(tryfirst=True)
+    def pytest_runtestloop(self, session: pytest.Session) -> bool:
+        items = {item.nodeid: item for item in session.items}
+        # an item runs once the next one is known, so the fixtures they share are kept
+        pending: Optional[pytest.Item] = None
+        for line in self._requests:
+            nodeid = line.strip()
+            item = items.get(nodeid)
+            # before a test the session didn't collect, the fixtures are torn down as after the last one
+            if pending is not None:
+                self._run(session, pending, item)
+                pending = None
+
+            if item is None:
+                self._send(nodeid, False, "not collected by the session")
+            else:
+                pending = item
+
+        if pending is not None:
+            self._run(session, pending, None)
+
+        return True
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport):
+        self._reports.append(report)
+
+    def _run(self, session: pytest.Session, item: pytest.Item, nextitem: Optional[pytest.Item]):
+        self._reports = []
+        item.config.hook.pytest_runtest_protocol(item=item, nextitem=nextitem)
+
+        log = []
+        for report in self._reports:
+            log.append(f"{report.when}: {report.outcome} in {report.duration:.1f}s")
+            log.extend(f"--- {title} ---\n{content}" for title, content in report.sections)
+            if report.longrepr:
+                log.append(report.longreprtext)
+        self._send(item.nodeid, not any(report.failed for report in self._reports), "\n".join(log))
+
+        if session.shouldfail:
+            raise session.Failed(session.shouldfail)
+        if session.shouldstop:
+            raise session.Interrupted(session.shouldstop)
+
+    def _send(self, nodeid: str, passed: bool, log: str):
+        self._results.write(json.dumps({"nodeid": nodeid, "passed": passed, "log": log}) + "\n")
+
+
+# before the capture of the output starts, the standard streams are still the pipes of the scheduler
+@pytest.hookimpl(wrapper=True, tryfirst=True)
+def pytest_load_initial_conftests(early_config: pytest.Config):
+    worker = _Worker(os.dup(0), os.dup(1))
+    os.dup2(2, 1)
+    early_config.pluginmanager.register(worker, "scheduler-worker")
+    return (yield)
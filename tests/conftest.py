@@ -1,19 +1,68 @@
-from time import sleep
+import os
+import json
+import socket
+
 from logging import getLogger
 
 import pytest
 
 from fw_test.context import Context
-from fw_test.io import LedColor
+from fw_test.device import DeviceRequirement
+from fw_test.pairing import PairingSession
+from fw_test.profiler import Profiler, Span, operations
+from fw_test.results import ResultsStore
+from fw_test.trace import Tracer
+
+from .utils import STATE_MANUAL, TEST_AP_CONFIG
 
 
 LOGGER = getLogger(__name__)
+TRACER_KEY = pytest.StashKey[Tracer]()
+REPORT_KEY = pytest.StashKey[dict[str, pytest.TestReport]]()
+PROFILER_KEY = pytest.StashKey[Profiler]()
+SPANS_KEY = pytest.StashKey[list[Span]]()
+RESULTS_KEY = pytest.StashKey[ResultsStore]()
+RUN_KEY = pytest.StashKey[str]()
 
 
 # adds custom options to the pytest argument parser
 def pytest_addoption(parser: pytest.Parser):
     parser.addoption("--config-path", help="path of the environment configuration", default="config.toml")
     parser.addoption("--firmware-path", help="path of the firmware file", required=True)
+    parser.addoption("--latency-report", help="path where to save the measured device latencies", default=None)
+    parser.addoption("--capture-dir", help="directory where the Wi-Fi captures of the failed tests are saved",
+                     default="captures")
+    parser.addoption("--profile-report", help="path where to save the time spent in each operation", default=None)
+    parser.addoption("--results-db", help="SQLite database where the results of the runs are kept", default=None)
+
+
+# the profiler exists before the collection, to replace the sleeps of the test modules
+def pytest_configure(config: pytest.Config):
+    config.stash[PROFILER_KEY] = Profiler()
+    # a collection runs nothing, there are no results to keep
+    if config.getoption("--results-db") and not config.option.collectonly:
+        config.stash[RESULTS_KEY] = ResultsStore(config.getoption("--results-db"))
+
+
+# the results of the run are written when the session ends
+def pytest_unconfigure(config: pytest.Config):
+    store = config.stash.get(RESULTS_KEY, None)
+    if store is None:
+        return
+
+    run_id = config.stash.get(RUN_KEY, None)
+    tracer = config.stash.get(TRACER_KEY, None)
+    if run_id is not None:
+        if tracer is not None:
+            store.record_latencies(run_id, tracer.summary())
+        store.finish_run(run_id)
+    store.close()
+
+
+def pytest_collection_modifyitems(config: pytest.Config, items: list[pytest.Item]):
+    profiler = config.stash[PROFILER_KEY]
+    for module in {item.module for item in items if isinstance(item, pytest.Function)}:
+        profiler.patch_sleep(module)
 
 
 # load the fixture only one time to reuse connections
@@ -22,34 +71,134 @@ def ctx(request: pytest.FixtureRequest):
     context = Context(
         config_path=request.config.getoption("--config-path"),
         firmware_path=request.config.getoption("--firmware-path"),
+        profiler=request.config.stash[PROFILER_KEY],
     )
+    request.config.stash[TRACER_KEY] = context.tracer
+    store = request.config.stash.get(RESULTS_KEY, None)
+    if store is not None:
+        request.config.stash[RUN_KEY] = store.start_run(context.config.fixture_id or socket.gethostname(),
+                                                        context.firmware)
 
     yield context
 
+    context.shadow.stop()
     context.cloud.stop()
     context.io.stop()
+    context.wifi.stop()
+    if context.local_cloud:
+        context.local_cloud.stop()
+    if context.artifacts:
+        context.artifacts.stop()
+
+    if context.simulator:
+        context.simulator.stop()
+
+# prints the latencies of the device measured during the session
+def pytest_terminal_summary(terminalreporter, config: pytest.Config):
+    tracer = config.stash.get(TRACER_KEY, None)
+    if tracer is None:
+        return
+
+    summary = tracer.summary()
+    terminalreporter.section("device latencies")
+    for name, histogram in summary.items():
+        terminalreporter.write_line(
+            f"{name}: n={histogram['count']} min={histogram['min_ms']:.1f}ms p50={histogram['p50_ms']:.1f}ms "
+            f"p95={histogram['p95_ms']:.1f}ms max={histogram['max_ms']:.1f}ms"
+        )
+
+    path = config.getoption("--latency-report")
+    if path:
+        with open(path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    profile = config.stash[PROFILER_KEY].summary()
+    terminalreporter.section("time profile")
+    terminalreporter.write_line(f"fixed sleeps {profile['sleep_s']:.1f}s, framework calls {profile['wait_s']:.1f}s")
+    for name, operation in list(profile["operations"].items())[:20]:
+        terminalreporter.write_line(
+            f"{name}: n={operation['count']} total={operation['total_s']:.1f}s max={operation['max_s']:.1f}s"
+        )
+    for span in profile["slowest"]:
+        terminalreporter.write_line(f"slowest: {span['name']} {span['duration_s']:.1f}s in {span['test']}")
+
+    path = config.getoption("--profile-report")
+    if path:
+        with open(path, "w") as f:
+            json.dump(profile, f, indent=2)
+
+
+# keeps the reports of each phase of the test, to know if it failed in the teardown
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_makereport(item: pytest.Item, call: pytest.CallInfo):
+    report = yield
+    item.stash.setdefault(REPORT_KEY, {})[report.when] = report
+
+    # the spans of the phase are attached to its report
+    spans = item.config.stash[PROFILER_KEY].take(item.nodeid)
+    if spans:
+        report.user_properties.append(("spans", [span.to_dict() for span in spans]))
+        report.sections.append((f"spans {report.when}", "\n".join(line for span in spans for line in span.render())))
+    item.stash.setdefault(SPANS_KEY, []).extend(spans)
+
+    # the test is recorded in the results store once all its phases are done
+    store = item.config.stash.get(RESULTS_KEY, None)
+    run_id = item.config.stash.get(RUN_KEY, None)
+    if report.when == "teardown" and store is not None and run_id is not None:
+        phases = item.stash[REPORT_KEY].values()
+        outcome = "failed" if any(phase.failed for phase in phases) \
+            else "skipped" if any(phase.skipped for phase in phases) else "passed"
+        store.record_test(run_id, item.nodeid, outcome, {phase.when: phase.duration for phase in phases},
+                          operations(item.stash.get(SPANS_KEY, [])))
+    return report
+
 
 # restores the board state before each test
 @pytest.fixture(autouse=True)
-def before_test_cleanup(ctx: Context):
+def before_test_cleanup(request: pytest.FixtureRequest, ctx: Context):
     LOGGER.info("status LED is %s", ctx.io.status_led_color())
 
-    # ensure firmware is restored before running test
-    ctx.io.restore_firmware()
-
-    # flush cloud receive buffer
+    # flush cloud receive buffer, before the pairing that waits for the GET of the device
     ctx.cloud.flush()
 
-    # wait for the system to boot up
-    sleep(2)
-
-    if ctx.io.status_led_color() != LedColor.RED:
-        LOGGER.info("sending device hard reset")
-        ctx.io.hard_reset()
-
-        assert ctx.io.status_led_color() == LedColor.RED
+    # brings the device to the state the test needs (factory state with the firmware under test
+    # by default), the restore and the hard reset are skipped if they are not needed
+    if "paired" in request.fixturenames:
+        # the pairing of the previous test is reused when the device still has it
+        marker = request.node.get_closest_marker("paired_state")
+        ctx.pairing.ensure(TEST_AP_CONFIG, {**STATE_MANUAL, **(marker.kwargs if marker else {})})
+    else:
+        ctx.pairing.release()
+        marker = request.node.get_closest_marker("device_state")
+        ctx.device.ensure(DeviceRequirement(**marker.kwargs) if marker else DeviceRequirement())
+        # the messages of a device that rebooted are not for the test
+        ctx.cloud.flush()
+
+    ctx.wifi.clear_capture()
 
     yield
 
-    ctx.wifi.stop_ap()
+    # the capture of the device traffic is saved only if the test failed
+    reports = request.node.stash.get(REPORT_KEY, {})
+    failed = any(report.failed for report in reports.values())
+    if failed:
+        directory = request.config.getoption("--capture-dir")
+        os.makedirs(directory, exist_ok=True)
+        index = ctx.wifi.dump_capture(os.path.join(directory, f"{request.node.name}.pcap"))
+        if index:
+            LOGGER.info("Wi-Fi capture of the failed test saved, index in %s", index)
+
+    # the access point stays up for the next test that needs the device paired
+    if not failed and ctx.pairing.active:
+        ctx.wifi.clear_impairments()
+    else:
+        ctx.pairing.release()
+        ctx.wifi.stop_ap()
+
+
+# the device paired with an environment, with the state of the paired_state marker
+# (STATE_MANUAL by default) given by the cloud
+@pytest.fixture
+def paired(ctx: Context) -> PairingSession:
+    return ctx.pairing.session
 
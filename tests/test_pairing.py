@@ -1,10 +1,10 @@
-from time import time, sleep
+from time import time
 from logging import getLogger
 
 import uuid
 
 from fw_test.context import Context
-from fw_test.wifi import ApConfiguration, WifiSecurityType
+from fw_test.wifi import ApConfiguration, WifiSecurityType, StationStage
 from fw_test.cloud import Message, Action, Response, PacketType
 from fw_test.firmware import FirmwareVersion
 
@@ -18,8 +18,6 @@ def test_pairing(ctx: Context):
     # avvio la connessione del Raspberry all'AP
     ctx.wifi.client_connect()
 
-    sleep(1)
-
     # chiedo lo stato al dispositivo
     response = ctx.api.status()
 
@@ -46,6 +44,9 @@ def test_pairing(ctx: Context):
     # communto la raspberry in AP mode
     ctx.wifi.start_ap(ap_config)
 
+    # attendo che il dispositivo si colleghi all'AP e ottenga un indirizzo
+    ctx.wifi.wait_for_station(ctx.config.mac_address, StationStage.LEASED)
+
     # attendo il primo messaggio su cloud
     msg = ctx.cloud.receive(timeout=60)
     assert msg.action == Action.GET